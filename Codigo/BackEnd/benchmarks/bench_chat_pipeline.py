@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Benchmark do pipeline completo do chat, sem acesso à rede
+
+Indexa os PDFs de uploads/ em um diretório temporário (banco vetorial local, chunk store e
+índice BM25) e dispara perguntas concorrentes contra as rotas do chat, com o LLM simulado
+pelo provedor fake do gateway (routes/llm_gateway.py). Para 1, 8 e 32 clientes concorrentes mede:
+- POST /api/chat: vazão (req/s) e latência p50/p95 da requisição HTTP completa
+- POST /api/chat/stream: tempo até o primeiro token (p50/p95) e latência total
+
+O modelo de embeddings real é usado se estiver no cache local do Hugging Face; com
+--embeddings-simulados, um codificador determinístico (hashing de palavras) o substitui no
+registro de modelos, e o benchmark roda em qualquer máquina.
+
+Uso (a partir da pasta BackEnd):
+  python benchmarks/bench_chat_pipeline.py --embeddings-simulados
+  python benchmarks/bench_chat_pipeline.py --concorrencia 1 8 32 --requisicoes 64
+  python benchmarks/bench_chat_pipeline.py --latencia-llm-ms 500 --tokens-por-segundo 250
+"""
+
+import os
+import sys
+import glob
+import time
+import asyncio
+import argparse
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+USER = {"email": "bench@ufma.br", "name": "Benchmark", "is_active": True}
+
+PERGUNTAS = [
+    "Qual o prazo de trancamento de matrícula?",
+    "O que diz a resolução 1892 do CONSEPE?",
+    "Quando começa o semestre letivo?",
+    "Como funciona o aproveitamento de estudos?",
+    "Quais são as regras de frequência mínima?",
+    "Quem pode solicitar revisão de nota?",
+    "O que a resolução do CONSAD estabelece?",
+    "Qual o calendário de provas finais?",
+]
+
+class SimulatedEncoder:
+    """Codificador determinístico (hashing das palavras em 384 dimensões) com custo de CPU simulado."""
+
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+        self._cpu = threading.Lock()
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=False):
+        single = isinstance(texts, str)
+        items = [texts] if single else list(texts)
+        vectors = np.zeros((len(items), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(items):
+            for word in text.lower().split():
+                vectors[row, int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16) % self.dimensions] += 1.0
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+        with self._cpu:
+            time.sleep(0.004 + 0.0005 * len(items))
+        return vectors[0] if single else vectors
+
+def configure_environment(directory: str, args) -> None:
+    """Aponta todo o estado para o diretório temporário e liga o LLM simulado (antes de importar as rotas)."""
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "LLM_FAKE_LATENCY_MS": str(args.latencia_llm_ms),
+        "LLM_FAKE_TOKENS_PER_SECOND": str(args.tokens_por_segundo),
+        "VECTOR_STORE_BACKEND": "local",
+        "LOCAL_VECTOR_STORE_DIR": os.path.join(directory, "vector_store"),
+        "CHUNK_STORE_PATH": os.path.join(directory, "chunk_store.db"),
+        "CHUNK_EMBEDDING_CACHE_DIR": os.path.join(directory, "embedding_cache"),
+        "HISTORY_BACKEND": "memory",
+        # Sem o cache de respostas, toda pergunta percorre o pipeline inteiro
+        "ANSWER_CACHE_ENABLED": "true" if args.com_cache else "false",
+    })
+    if args.embeddings_simulados:
+        os.environ["EMBEDDING_DIMENSIONS"] = "384"
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000 if ordered else 0.0
+
+async def run_clients(concurrency: int, total: int, request) -> tuple:
+    """Executa `total` chamadas de `request(i)` com `concurrency` clientes; retorna (resultados, tempo total)."""
+    counter = iter(range(total))
+    results = []
+
+    async def client():
+        for i in counter:
+            results.append(await request(i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+async def benchmark(args) -> None:
+    import httpx
+    from fastapi import FastAPI
+    from routes import chat
+    from routes.login import get_current_active_user
+    from routes.document_processor import process_and_index_pdf
+    from routes.llm_gateway import llm_gateway
+    from routes.model_registry import model_registry, get_embedding_model_key
+
+    if args.embeddings_simulados:
+        model_registry.get(get_embedding_model_key(), lambda name: SimulatedEncoder())
+
+    pdfs = sorted(glob.glob(os.path.join(BACKEND_DIR, "uploads", "*.pdf")))
+    if not pdfs:
+        sys.exit("Nenhum PDF encontrado em uploads/")
+    start = time.perf_counter()
+    for path in pdfs:
+        result = await process_and_index_pdf(path, os.path.basename(path))
+        print(f"Indexado: {os.path.basename(path)} ({result.get('total_chunks', 0)} chunks)")
+    print(f"Indexação concluída em {time.perf_counter() - start:.1f}s\n")
+
+    app = FastAPI()
+    app.include_router(chat.router, prefix="/api/chat")
+    app.dependency_overrides[get_current_active_user] = lambda: USER
+
+    def question(i: int) -> str:
+        # Texto único por requisição, para não medir o cache de embeddings de consultas
+        return f"{PERGUNTAS[i % len(PERGUNTAS)]} (#{i})"
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def send(i: int) -> float:
+            started = time.perf_counter()
+            response = await client.post("/api/chat", json={"question": question(i)})
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        async def stream(i: int) -> tuple:
+            # O transporte ASGI do httpx acumula o corpo inteiro; para medir o primeiro token,
+            # o gerador de eventos da resposta é consumido diretamente
+            started = time.perf_counter()
+            response = await chat.send_message_stream(chat.ChatRequest(question=question(i)), current_user=USER)
+            first_token = None
+            async for event in response.body_iterator:
+                if first_token is None and event.startswith("event: token"):
+                    first_token = time.perf_counter() - started
+            return first_token or 0.0, time.perf_counter() - started
+
+        await send(0)  # Aquecimento (modelo, índices e conexões)
+
+        print(f"{'Clientes':>8} | {'Req/s':>7} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'1º token p50':>12} | {'1º token p95':>12} | {'Stream p50':>10}")
+        print("-" * 87)
+        for concurrency in args.concorrencia:
+            latencies, elapsed = await run_clients(concurrency, args.requisicoes, send)
+            streams, _ = await run_clients(concurrency, args.requisicoes, stream)
+            first_tokens = [first for first, _ in streams]
+            totals = [total for _, total in streams]
+            print(f"{concurrency:>8} | {len(latencies) / elapsed:>7.1f} | {percentile(latencies, 0.5):>9.1f} | "
+                  f"{percentile(latencies, 0.95):>9.1f} | {percentile(first_tokens, 0.5):>12.1f} | "
+                  f"{percentile(first_tokens, 0.95):>12.1f} | {percentile(totals, 0.5):>10.1f}")
+
+    stats = llm_gateway.stats()
+    for model, model_stats in stats["models"].items():
+        print(f"\nLLM {stats['provider']}/{model}: {model_stats}")
+    await llm_gateway.aclose()
+    chat.vector_query_executor.shutdown(wait=False)
+    chat.rerank_executor.shutdown(wait=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de chat com LLM simulado (sem rede)")
+    parser.add_argument("--concorrencia", type=int, nargs="+", default=[1, 8, 32], help="Clientes concorrentes")
+    parser.add_argument("--requisicoes", type=int, default=48, help="Requisições por nível de concorrência")
+    parser.add_argument("--latencia-llm-ms", type=float, default=300, help="Latência simulada até o primeiro token")
+    parser.add_argument("--tokens-por-segundo", type=float, default=400, help="Vazão simulada de geração")
+    parser.add_argument("--embeddings-simulados", action="store_true", help="Não carrega o modelo de embeddings real")
+    parser.add_argument("--com-cache", action="store_true", help="Mantém o cache de respostas ligado")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_environment(directory, args)
+        asyncio.run(benchmark(args))
+
+if __name__ == "__main__":
+    main()
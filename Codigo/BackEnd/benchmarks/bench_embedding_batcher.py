@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark do micro-batching de embeddings de consultas
+
+Mede a vazão (consultas/s) e a latência de geração de embeddings com 1, 8, 32 e 128
+solicitantes concorrentes, comparando:
+- Sem batching: cada solicitante chama o modelo com um único texto
+- Com batching: os textos passam pelo EmbeddingBatcher (routes/embedding_batcher.py)
+
+Uso (a partir da pasta BackEnd):
+  python benchmarks/bench_embedding_batcher.py
+  python benchmarks/bench_embedding_batcher.py --simulado   # Sem carregar o modelo real
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import statistics
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routes.embedding_batcher import EmbeddingBatcher
+
+load_dotenv()
+
+CONCURRENCY_LEVELS = [1, 8, 32, 128]
+
+def load_encoder(simulated: bool):
+    """Retorna uma função encode(lista_de_textos) -> matriz, real ou simulada."""
+    if simulated:
+        # Custo simulado: overhead fixo por chamada + custo por texto, com uso exclusivo da CPU
+        cpu = threading.Lock()
+
+        def encode(texts):
+            with cpu:
+                time.sleep(0.008 + 0.0004 * len(texts))
+            return np.zeros((len(texts), 384), dtype=np.float32)
+        return encode
+
+    from sentence_transformers import SentenceTransformer
+    model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    print(f"Carregando modelo {model_name}...")
+    model = SentenceTransformer(model_name, device="cpu")
+    return lambda texts: model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+def run_callers(embed_one, concurrency: int, requests_per_caller: int) -> dict:
+    """Dispara `concurrency` threads, cada uma gerando `requests_per_caller` embeddings."""
+    latencies = []
+    latencies_lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+
+    def caller(caller_id):
+        local = []
+        barrier.wait()
+        for i in range(requests_per_caller):
+            text = f"Qual o prazo de trancamento de matrícula no semestre {caller_id}-{i}?"
+            start = time.perf_counter()
+            embed_one(text)
+            local.append(time.perf_counter() - start)
+        with latencies_lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=caller, args=(c,)) for c in range(concurrency)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do micro-batching de embeddings")
+    parser.add_argument("--simulado", action="store_true", help="Usa um modelo simulado em vez do SentenceTransformer")
+    parser.add_argument("--requisicoes", type=int, default=256, help="Total aproximado de embeddings por cenário")
+    parser.add_argument("--max-lote", type=int, default=32, help="Tamanho máximo do lote do batcher")
+    parser.add_argument("--espera-ms", type=float, default=5.0, help="Janela de espera do batcher em ms")
+    args = parser.parse_args()
+
+    encode = load_encoder(args.simulado)
+    encode(["aquecimento"])  # Primeira chamada inclui inicializações preguiçosas do modelo
+
+    print(f"\n{'Concorrência':>12} | {'Modo':<13} | {'Consultas/s':>11} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'Lote médio':>10}")
+    print("-" * 80)
+    for concurrency in CONCURRENCY_LEVELS:
+        per_caller = max(1, args.requisicoes // concurrency)
+
+        direct = run_callers(lambda text: encode([text])[0], concurrency, per_caller)
+        print(f"{concurrency:>12} | {'sem batching':<13} | {direct['throughput']:>11.1f} | {direct['p50_ms']:>9.1f} | {direct['p95_ms']:>9.1f} | {1:>10.2f}")
+
+        batcher = EmbeddingBatcher(encode, max_batch_size=args.max_lote, max_wait_ms=args.espera_ms)
+        batched = run_callers(batcher.encode, concurrency, per_caller)
+        avg_batch = batcher.stats()["avg_batch_size"]
+        print(f"{concurrency:>12} | {'com batching':<13} | {batched['throughput']:>11.1f} | {batched['p50_ms']:>9.1f} | {batched['p95_ms']:>9.1f} | {avg_batch:>10.2f}")
+
+if __name__ == "__main__":
+    main()
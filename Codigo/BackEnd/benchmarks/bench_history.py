@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark do histórico de conversas com históricos grandes
+
+Para usuários com 10, 1.000, 10.000 e 100.000 conversas, mede o custo por operação de:
+- Remoção de uma conversa (DELETE /api/history/{id})
+- Estatísticas (GET /api/history/stats)
+- Primeira página do histórico (GET /api/history)
+comparando a implementação anterior (lista por usuário com busca linear e min/max) com os
+backends atuais de routes/history_store.py (memória e SQLite). O custo deve ser o mesmo
+com 10 ou 100.000 conversas.
+
+Uso (a partir da pasta BackEnd):
+  python benchmarks/bench_history.py
+  python benchmarks/bench_history.py --tamanhos 10 1000 100000 --operacoes 500
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routes.history_store import MemoryHistoryBackend, SQLiteHistoryBackend
+
+USER = "bench@ufma.br"
+
+class LegacyHistory:
+    """Implementação anterior: lista por usuário, remoção por busca linear e min/max a cada consulta."""
+
+    def __init__(self):
+        self.store = {}
+        self.next_id = 1
+
+    def add_entry(self, user_email, question, answer, sources=None):
+        self.store.setdefault(user_email, []).append({
+            "id": self.next_id, "question": question, "answer": answer,
+            "timestamp": datetime.now(), "sources": sources or []
+        })
+        self.next_id += 1
+        return self.next_id - 1
+
+    def delete_entry(self, user_email, entry_id):
+        entries = self.store.get(user_email, [])
+        for i, entry in enumerate(entries):
+            if entry["id"] == entry_id:
+                del entries[i]
+                return True
+        return False
+
+    def stats(self, user_email):
+        entries = self.store.get(user_email, [])
+        if not entries:
+            return {"total_entries": 0}
+        return {
+            "total_entries": len(entries),
+            "first_entry": min(entries, key=lambda e: e["timestamp"])["timestamp"].isoformat(),
+            "last_entry": max(entries, key=lambda e: e["timestamp"])["timestamp"].isoformat()
+        }
+
+    def list_entries(self, user_email, limit, **kwargs):
+        entries = self.store.get(user_email, [])
+        return [{**e, "timestamp": e["timestamp"].isoformat()} for e in entries], None
+
+def populate(backend, size: int) -> list:
+    ids = [backend.add_entry(USER, f"Pergunta {i} sobre o calendário acadêmico?", "Resposta " * 40, [{"filename": "doc.pdf"}])
+           for i in range(size)]
+    if hasattr(backend, "flush"):
+        backend.flush()
+    return ids
+
+def per_op_us(func, args_list) -> float:
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - start) / max(1, len(args_list)) * 1e6
+
+def run(backend, size: int, operations: int) -> dict:
+    ids = populate(backend, size)
+    # Remove ids espalhados pelo histórico (não só os mais recentes)
+    to_delete = random.sample(ids, min(operations, max(1, size // 2)))
+    return {
+        "delete": per_op_us(lambda i: backend.delete_entry(USER, i), [(i,) for i in to_delete]),
+        "stats": per_op_us(lambda: backend.stats(USER), [()] * operations),
+        "page": per_op_us(lambda: backend.list_entries(USER, limit=50), [()] * min(operations, 50))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de remoção e estatísticas do histórico")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10, 1000, 10000, 100000], help="Conversas por usuário")
+    parser.add_argument("--operacoes", type=int, default=200, help="Operações medidas por cenário")
+    args = parser.parse_args()
+    random.seed(42)
+
+    print(f"\n{'Conversas':>9} | {'Backend':<8} | {'Remoção (µs)':>12} | {'Estatísticas (µs)':>17} | {'1ª página (µs)':>14}")
+    print("-" * 74)
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.tamanhos:
+            backends = {
+                "anterior": LegacyHistory(),
+                "memória": MemoryHistoryBackend(),
+                "sqlite": SQLiteHistoryBackend(os.path.join(tmp, f"history_{size}.db"))
+            }
+            for name, backend in backends.items():
+                result = run(backend, size, args.operacoes)
+                print(f"{size:>9} | {name:<8} | {result['delete']:>12.1f} | {result['stats']:>17.1f} | {result['page']:>14.1f}")
+                if hasattr(backend, "close"):
+                    backend.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark da busca por palavras-chave usada como fallback da busca vetorial
+
+Para corpora sintéticos de 1.000, 10.000 e 50.000 chunks em português, compara:
+- A implementação anterior (texto inteiro em minúsculas e str.count por palavra a cada consulta)
+- O KeywordIndex de routes/text_search.py (tokenização única, listas de ocorrência em arrays
+  NumPy e pesos BM25 pré-calculados), informando também o tempo de construção do índice.
+  É o mesmo índice em memória que o ChunkBM25Index (routes/bm25_index.py) usa nas consultas
+
+Uso (a partir da pasta BackEnd):
+  python benchmarks/bench_keyword_search.py
+  python benchmarks/bench_keyword_search.py --tamanhos 1000 100000 --consultas 50
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routes.text_search import KeywordIndex
+
+VOCABULARIO = """
+resolução consepe consad matrícula calendário acadêmico semestre disciplina curso graduação
+aluno professor coordenação colegiado prazo período trancamento aproveitamento estudos estágio
+monografia avaliação frequência nota conceito reprovação aprovação departamento centro campus
+reitoria pró-reitoria ensino pesquisa extensão bolsa edital inscrição requerimento documento
+artigo parágrafo inciso capítulo seção norma regimento estatuto universidade federal maranhão
+""".split()
+
+PERGUNTAS = [
+    "Qual o prazo de trancamento de matrícula?",
+    "O que diz a resolução do CONSEPE sobre estágio?",
+    "calendário acadêmico do semestre",
+    "aproveitamento de estudos na graduação",
+    "frequência mínima para aprovação na disciplina",
+]
+
+def gerar_corpus(tamanho: int, palavras_por_chunk: int = 350) -> list:
+    # Distribuição de Zipf: poucas palavras muito frequentes, muitas raras (como em texto real)
+    pesos = [1 / (i + 1) for i in range(len(VOCABULARIO))]
+    return [
+        {"content": " ".join(random.choices(VOCABULARIO, weights=pesos, k=palavras_por_chunk)) + f" art. {i}",
+         "filename": f"doc_{i % 20}.pdf"}
+        for i in range(tamanho)
+    ]
+
+def busca_anterior(query: str, documents: list, max_results: int = 3) -> list:
+    """Implementação anterior da busca por palavras-chave (simple_search, em routes/utils.py)."""
+    query_words = query.lower().split()
+    results = []
+    for doc in documents:
+        content_lower = doc['content'].lower()
+        score = sum(content_lower.count(word) for word in query_words)
+        if score > 0:
+            results.append({'content': doc['content'], 'filename': doc['filename'], 'score': score})
+    results.sort(key=lambda x: x['score'], reverse=True)
+    return results[:max_results]
+
+def por_consulta_ms(func, consultas: int) -> float:
+    start = time.perf_counter()
+    for i in range(consultas):
+        func(PERGUNTAS[i % len(PERGUNTAS)])
+    return (time.perf_counter() - start) / consultas * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da busca por palavras-chave de fallback")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 10000, 50000], help="Chunks no corpus")
+    parser.add_argument("--consultas", type=int, default=20, help="Consultas medidas por cenário")
+    parser.add_argument("--top-k", type=int, default=10, help="Resultados por consulta")
+    args = parser.parse_args()
+    random.seed(42)
+
+    print(f"\n{'Chunks':>7} | {'Anterior (ms)':>13} | {'Índice (ms)':>11} | {'Ganho':>7} | {'Construção (s)':>14}")
+    print("-" * 66)
+    for tamanho in args.tamanhos:
+        corpus = gerar_corpus(tamanho)
+        anterior = por_consulta_ms(lambda q: busca_anterior(q, corpus, args.top_k), args.consultas)
+
+        start = time.perf_counter()
+        index = KeywordIndex.from_texts(doc["content"] for doc in corpus)
+        construcao = time.perf_counter() - start
+        atual = por_consulta_ms(lambda q: index.search(q, args.top_k), args.consultas)
+
+        print(f"{tamanho:>7} | {anterior:>13.2f} | {atual:>11.3f} | {anterior / atual:>6.0f}x | {construcao:>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Verificação de precisão do backend ONNX de embeddings
+
+Codifica os chunks dos PDFs da pasta uploads/ e um conjunto de perguntas com o backend de
+referência (SentenceTransformer em PyTorch) e com o ONNX Runtime (float32 e int8), e compara:
+- Similaridade de cosseno entre o vetor de referência e o do ONNX para o mesmo texto
+- Diferença máxima nos scores pergunta x chunk (o que o índice vetorial usa para ranquear)
+- Concordância do top-k recuperado para cada pergunta
+- Vazão de codificação (chunks/s) de cada backend
+
+Uso (a partir da pasta BackEnd, com `pip install "optimum[onnxruntime]"`):
+  python benchmarks/check_onnx_accuracy.py
+  python benchmarks/check_onnx_accuracy.py --limiar 0.99 --top-k 5 --max-chunks 500
+Sai com código 1 se a similaridade mínima de algum backend ficar abaixo do limiar.
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from routes.pdf_extraction import PdfTextExtractor
+from routes.utils import simple_text_splitter
+from routes.model_registry import load_sentence_transformer
+from routes.onnx_embedding import load_onnx_embedding_model
+
+load_dotenv()
+
+QUESTIONS = [
+    "Qual o prazo para trancamento de matrícula?",
+    "Quais são os requisitos para colação de grau?",
+    "Como funciona o aproveitamento de estudos?",
+    "Quem aprova o calendário acadêmico?",
+    "Quais as atribuições do conselho de administração?",
+    "Como é feita a avaliação de desempenho do estudante?",
+    "Qual a carga horária mínima do estágio obrigatório?",
+    "Quando a resolução entra em vigor?",
+]
+
+def load_chunks(uploads_dir: str, max_chunks: int) -> list:
+    extractor = PdfTextExtractor(workers=1)
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(uploads_dir, "*.pdf"))):
+        text, _ = extractor.extract(path)
+        chunks.extend(simple_text_splitter(text, chunk_size=1000, overlap=200))
+    return chunks[:max_chunks] if max_chunks else chunks
+
+def encode(model, texts: list) -> tuple:
+    model.encode(texts[:8], batch_size=8, convert_to_numpy=True, normalize_embeddings=True)  # Aquecimento
+    start = time.perf_counter()
+    vectors = model.encode(texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True)
+    return np.asarray(vectors, dtype=np.float32), len(texts) / (time.perf_counter() - start)
+
+def compare(reference: dict, candidate: dict, top_k: int) -> dict:
+    """Compara vetores e rankings de um backend com os de referência (vetores já normalizados)."""
+    pair_cosines = np.sum(reference["chunks"] * candidate["chunks"], axis=1)
+    ref_scores = reference["questions"] @ reference["chunks"].T
+    cand_scores = candidate["questions"] @ candidate["chunks"].T
+    k = min(top_k, ref_scores.shape[1])
+    overlaps = [
+        len(set(np.argsort(-ref_row)[:k]) & set(np.argsort(-cand_row)[:k])) / k
+        for ref_row, cand_row in zip(ref_scores, cand_scores)
+    ]
+    return {
+        "cosine_mean": float(pair_cosines.mean()),
+        "cosine_min": float(pair_cosines.min()),
+        "score_max_diff": float(np.abs(ref_scores - cand_scores).max()),
+        "topk_overlap": float(np.mean(overlaps)),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Precisão do backend ONNX frente ao SentenceTransformer")
+    parser.add_argument("--uploads", default="uploads", help="Pasta com os PDFs usados na comparação")
+    parser.add_argument("--max-chunks", type=int, default=0, help="Limite de chunks avaliados (0 = todos)")
+    parser.add_argument("--top-k", type=int, default=5, help="Tamanho do top-k comparado por pergunta")
+    parser.add_argument("--limiar", type=float, default=0.99, help="Similaridade mínima aceita entre os backends")
+    args = parser.parse_args()
+
+    model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    chunks = load_chunks(args.uploads, args.max_chunks)
+    if not chunks:
+        print(f"Nenhum chunk encontrado em {args.uploads}/")
+        sys.exit(1)
+    print(f"Modelo: {model_name} | {len(chunks)} chunks | {len(QUESTIONS)} perguntas\n")
+
+    backends = {
+        "torch": lambda: load_sentence_transformer(model_name),
+        "onnx": lambda: load_onnx_embedding_model(model_name, quantize=False),
+        "onnx-int8": lambda: load_onnx_embedding_model(model_name, quantize=True),
+    }
+    results = {}
+    for backend, loader in backends.items():
+        print(f"Carregando backend {backend}...")
+        model = loader()
+        chunk_vectors, throughput = encode(model, chunks)
+        question_vectors, _ = encode(model, QUESTIONS)
+        results[backend] = {"chunks": chunk_vectors, "questions": question_vectors, "throughput": throughput}
+
+    print(f"\n{'Backend':<10} | {'Chunks/s':>9} | {'Cosseno médio':>13} | {'Cosseno mín.':>12} | {'Dif. máx. score':>15} | {f'Top-{args.top_k} igual':>11}")
+    print("-" * 87)
+    print(f"{'torch':<10} | {results['torch']['throughput']:>9.1f} | {'referência':>13} | {'-':>12} | {'-':>15} | {'-':>11}")
+    failed = False
+    for backend in ("onnx", "onnx-int8"):
+        metrics = compare(results["torch"], results[backend], args.top_k)
+        failed |= metrics["cosine_min"] < args.limiar
+        print(f"{backend:<10} | {results[backend]['throughput']:>9.1f} | {metrics['cosine_mean']:>13.5f} | "
+              f"{metrics['cosine_min']:>12.5f} | {metrics['score_max_diff']:>15.5f} | {metrics['topk_overlap']:>10.0%}")
+
+    print(f"\n{'FALHOU' if failed else 'OK'}: limiar de similaridade {args.limiar}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,96 @@
 # Importações necessárias do FastAPI e bibliotecas auxiliares
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv  # Para carregar variáveis de ambiente do .env
 import logging  # Para registro de logs
+import threading
+import time
 from routes import admin, chat, history, login, admin_requests, admin_management  # Importação das rotas
+from routes.index_maintenance import index_reconciler
+from routes.ingestion_jobs import ingestion_jobs
+from routes.history_store import history_store
+from routes.bm25_index import bm25_index
+from routes.reranker import reranker
+from routes.llm_gateway import llm_gateway
+from routes.pdf_extraction import pdf_extractor
+from routes.model_registry import model_registry, get_embedding_model, get_embedding_model_key
+from routes.utils import get_pinecone_index, is_vector_index_ready, flush_vector_index, VECTOR_INDEX_RETRY_SECONDS
 import os
 
 # Carrega as variáveis de ambiente do arquivo .env
 load_dotenv()
 
+# Aquecimento em segundo plano: o modelo de embeddings e a conexão com o banco vetorial
+# são preparados depois que o servidor já aceita conexões. Até lá, /health/live responde
+# normalmente e /health/ready retorna 503, para que o balanceador só envie tráfego a workers prontos.
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "true").lower() in ("1", "true", "yes")
+warmup_state = {"started_at": None, "finished_at": None, "components": {}}
+shutdown_event = threading.Event()
+
+def run_warmup_step(name, step, retry_seconds=None):
+    """Executa uma etapa do aquecimento registrando duração e erro; opcionalmente tenta de novo até conseguir."""
+    started = time.perf_counter()
+    while not shutdown_event.is_set():
+        try:
+            step()
+            warmup_state["components"][name] = {"ready": True, "seconds": round(time.perf_counter() - started, 3)}
+            return
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Falha no aquecimento de '{name}': {e}")
+            warmup_state["components"][name] = {"ready": False, "error": str(e)}
+            if retry_seconds is None:
+                return
+            shutdown_event.wait(retry_seconds)
+
+def warm_up_resources():
+    warmup_state["started_at"] = time.time()
+    # A conexão com o banco vetorial é tentada de novo até conseguir: roda em uma thread própria
+    # para que as etapas locais (e a busca BM25, que atende o chat sem o índice) não fiquem esperando
+    vector_index_warmup = threading.Thread(
+        target=run_warmup_step,
+        args=("vector_index", get_pinecone_index, VECTOR_INDEX_RETRY_SECONDS),
+        name="vector-index-warmup",
+        daemon=True
+    )
+    vector_index_warmup.start()
+    if EMBEDDING_WARMUP:
+        run_warmup_step("embedding_model", get_embedding_model)
+    run_warmup_step("document_hashes", admin.backfill_content_hashes)
+    # Reenfileira as ingestões interrompidas pelo reinício (depende dos hashes para não reindexar o acervo)
+    run_warmup_step("pending_ingestions", admin.resume_pending_ingestions)
+    # Indexa no BM25 os chunks de documentos ingeridos antes da busca híbrida
+    run_warmup_step("bm25_index", bm25_index.sync_with_chunk_store)
+    if reranker.enabled:
+        run_warmup_step("rerank_model", reranker.load)
+    vector_index_warmup.join()
+    warmup_state["finished_at"] = time.time()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Subida: nada pesado aqui, apenas dispara as tarefas de segundo plano
+    shutdown_event.clear()
+    threading.Thread(target=warm_up_resources, name="startup-warmup", daemon=True).start()
+    # Reconciliação periódica do índice vetorial com o acervo (remove vetores órfãos)
+    index_reconciler.start(admin.get_known_filenames)
+    yield
+    # Encerramento: interrompe tarefas de segundo plano e libera os pools de execução
+    shutdown_event.set()
+    index_reconciler.stop()
+    ingestion_jobs.shutdown()
+    pdf_extractor.shutdown()
+    chat.vector_query_executor.shutdown(wait=False, cancel_futures=True)
+    chat.rerank_executor.shutdown(wait=False, cancel_futures=True)
+    # Grava o que ainda estiver pendente no índice vetorial local e na fila de escrita do histórico
+    flush_vector_index()
+    await run_in_threadpool(history_store.close)
+    # Fecha as conexões HTTP mantidas pelo gateway de LLM
+    await llm_gateway.aclose()
+
 # Cria a aplicação FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Configuração do middleware CORS (Cross-Origin Resource Sharing)
 # Isso permite que o frontend (mesmo hospedado em outro domínio) acesse a API
@@ -46,6 +126,23 @@ async def health_check():
         "services": ["admin", "chat", "history", "login", "admin-requests", "admin-management"]
     }
 
+# Liveness: o processo está de pé e o event loop responde
+@app.get("/health/live")
+async def liveness():
+    return {"status": "alive"}
+
+# Readiness: modelo de embeddings carregado e banco vetorial conectado
+@app.get("/health/ready")
+async def readiness():
+    checks = {"vector_index": is_vector_index_ready()}
+    if EMBEDDING_WARMUP:
+        checks["embedding_model"] = model_registry.is_loaded(get_embedding_model_key())
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting", "checks": checks, "warmup": warmup_state}
+    )
+
 # Bloco para execução local do servidor com Uvicorn
 # Este bloco só será executado se o script for rodado diretamente (ex: python main.py)
 if __name__ == "__main__":
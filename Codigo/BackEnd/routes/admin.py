@@ -3,11 +3,19 @@ from fastapi.responses import FileResponse, JSONResponse
 import os
 import uuid
 import json
+import hashlib
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 import logging
 from dotenv import load_dotenv
 from routes.document_processor import process_and_index_pdf
+from routes.answer_cache import answer_cache
+from routes.ingestion_jobs import ingestion_jobs, ACTIVE_JOB_STATUSES, JOB_FINALIZE_FAILED
+from routes.index_maintenance import purge_document_vectors, reconcile_index
+from routes.model_registry import model_registry
+from fastapi.concurrency import run_in_threadpool
 
 # Configuração básica
 load_dotenv()
@@ -17,11 +25,17 @@ router = APIRouter()
 # Configurações otimizadas
 UPLOAD_DIR = "uploads"
 METADATA_FILE = "document_metadata.json"  # Arquivo para persistir metadados
+PENDING_DIR = os.path.join(UPLOAD_DIR, "pending")  # Arquivos aguardando (ou que falharam na) ingestão
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(PENDING_DIR, exist_ok=True)
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+# Arquivos pendentes anteriores a este instante são de execuções anteriores (não há upload em andamento)
+PROCESS_STARTED_AT = time.time()
 
 # Armazenamento em memória para metadados dos documentos (carregado do arquivo)
 documents_metadata = {}
+# Os workers de ingestão atualizam os metadados fora do event loop
+metadata_lock = threading.RLock()
 
 def load_metadata():
     """Carrega metadados do arquivo JSON"""
@@ -41,12 +55,38 @@ def load_metadata():
 def save_metadata():
     """Salva metadados no arquivo JSON"""
     try:
-        with open(METADATA_FILE, 'w', encoding='utf-8') as f:
+        with metadata_lock, open(METADATA_FILE, 'w', encoding='utf-8') as f:
             json.dump(documents_metadata, f, ensure_ascii=False, indent=2, default=str)
         logger.info(f"Metadados salvos: {len(documents_metadata)} documentos")
     except Exception as e:
         logger.error(f"Erro ao salvar metadados: {e}")
 
+def compute_file_hash(file_path: str) -> str:
+    """Hash SHA-256 do conteúdo do arquivo (identifica uploads repetidos)"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def find_document(content_hash: str = None, original_name: str = None):
+    """Procura um documento indexado pelo hash do conteúdo ou pelo nome original. Retorna o file_id."""
+    with metadata_lock:
+        for file_id, metadata in documents_metadata.items():
+            if content_hash and metadata.get('content_hash') == content_hash:
+                return file_id
+            if original_name and metadata.get('original_name') == original_name:
+                return file_id
+    return None
+
+def get_known_filenames():
+    """Documentos válidos para o índice: acervo atual, ingestões em andamento e indexados ainda não publicados."""
+    with metadata_lock:
+        known = set(documents_metadata)
+    known.update(job["file_id"] for job in ingestion_jobs.list_jobs(limit=None)
+                 if job["status"] in ACTIVE_JOB_STATUSES or job["status"] == JOB_FINALIZE_FAILED)
+    return known
+
 def sync_metadata_with_files():
     """Sincroniza metadados com arquivos existentes no diretório"""
     try:
@@ -90,6 +130,24 @@ def sync_metadata_with_files():
     except Exception as e:
         logger.error(f"Erro na sincronização de metadados: {e}")
 
+def backfill_content_hashes():
+    """
+    Calcula o hash do conteúdo dos documentos anteriores à deduplicação.
+    Lê todos os PDFs, por isso roda no aquecimento em segundo plano e não na importação.
+    """
+    with metadata_lock:
+        missing = [filename for filename, metadata in documents_metadata.items() if 'content_hash' not in metadata]
+    for filename in missing:
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        if os.path.exists(file_path):
+            content_hash = compute_file_hash(file_path)
+            with metadata_lock:
+                if filename in documents_metadata:
+                    documents_metadata[filename]['content_hash'] = content_hash
+    if missing:
+        save_metadata()
+        logger.info(f"Hash de conteúdo calculado para {len(missing)} documentos")
+
 # Carrega metadados ao inicializar o módulo
 load_metadata()
 sync_metadata_with_files()
@@ -132,10 +190,98 @@ async def list_documents():
             detail="Erro ao listar documentos"
         )
 
-@router.post("/upload", status_code=status.HTTP_201_CREATED)
+def _pending_info_path(file_path: str) -> str:
+    """Arquivo com os dados do job ao lado do PDF pendente, usado para retomar a ingestão após um reinício."""
+    return os.path.splitext(file_path)[0] + ".json"
+
+def _remove_pending(file_path: str):
+    """Remove o PDF pendente e os dados do seu job."""
+    for path in (file_path, _pending_info_path(file_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+def _submit_ingestion(file_path: str, file_id: str, original_name: str, file_size: int, content_hash: str) -> dict:
+    return ingestion_jobs.submit(
+        process_and_index_pdf,
+        file_path,
+        file_id,
+        original_name,
+        on_success=_on_ingestion_success,
+        on_failure=_on_ingestion_failure,
+        file_size=file_size,
+        content_hash=content_hash
+    )
+
+def resume_pending_ingestions():
+    """
+    Retoma as ingestões interrompidas por um reinício: os jobs ficam só em memória, mas os arquivos
+    continuam em PENDING_DIR. PDFs com os dados do job são reenfileirados; uploads incompletos,
+    arquivos já publicados e PDFs sem dados do job (anteriores a esta recuperação) são descartados.
+    """
+    in_progress = {job["file_path"] for job in ingestion_jobs.list_jobs(limit=None)}
+    resumed, discarded = 0, 0
+    for name in os.listdir(PENDING_DIR):
+        path = os.path.join(PENDING_DIR, name)
+        if path in in_progress or name.endswith('.json') or os.path.getmtime(path) >= PROCESS_STARTED_AT:
+            continue
+        info_path = _pending_info_path(path)
+        info = None
+        if name.endswith('.pdf') and os.path.exists(info_path):
+            try:
+                with open(info_path, 'r', encoding='utf-8') as f:
+                    info = json.load(f)
+            except Exception as e:
+                logger.warning(f"Dados do job pendente {name} ilegíveis: {e}")
+        if info is None or find_document(content_hash=info["content_hash"]):
+            _remove_pending(path)
+            discarded += 1
+            continue
+        _submit_ingestion(path, info["file_id"], info["original_name"], info["file_size"], info["content_hash"])
+        resumed += 1
+    # Dados de jobs cujo PDF não existe mais
+    for name in os.listdir(PENDING_DIR):
+        if name.endswith('.json') and not os.path.exists(os.path.join(PENDING_DIR, name[:-len('.json')] + '.pdf')):
+            os.remove(os.path.join(PENDING_DIR, name))
+    if resumed or discarded:
+        logger.info(f"Ingestões pendentes: {resumed} retomadas, {discarded} arquivos descartados")
+    return {"resumed": resumed, "discarded": discarded}
+
+def _on_ingestion_success(job: dict, processing_result: dict):
+    """Publica o documento processado: move o arquivo para o acervo e persiste os metadados."""
+    file_id = job["file_id"]
+    destination = os.path.join(UPLOAD_DIR, file_id)
+    # Idempotente: numa nova tentativa da publicação o arquivo pode já ter sido movido
+    if os.path.exists(job["file_path"]) or not os.path.exists(destination):
+        os.replace(job["file_path"], destination)
+    _remove_pending(job["file_path"])
+
+    with metadata_lock:
+        documents_metadata[file_id] = {
+            'original_name': job["original_name"],
+            'summary': processing_result.get('summary', 'Resumo não disponível'),
+            'upload_date': datetime.now().isoformat(),
+            'file_size': job["file_size"],
+            'content_hash': job["content_hash"]
+        }
+        save_metadata()
+
+    # O acervo mudou: respostas em cache podem estar desatualizadas
+    answer_cache.invalidate_document(file_id)
+    logger.info(f"Documento {file_id} publicado após ingestão")
+
+def _on_ingestion_failure(job: dict, error: str):
+    # O arquivo permanece em PENDING_DIR para permitir nova tentativa manual
+    logger.error(f"Ingestão de {job['original_name']} falhou: {error}")
+
+def _job_response(job: dict) -> dict:
+    """Estado público do job (sem caminhos internos)."""
+    return {key: value for key, value in job.items() if key != "file_path"}
+
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(file: UploadFile = File(...)):
     """
-    Upload de documento PDF com processamento automático e indexação
+    Upload de documento PDF. O arquivo é persistido e a indexação é enfileirada;
+    o andamento pode ser acompanhado em /api/admin/jobs/{job_id}.
     """
     # Validações 
     if not file.filename.lower().endswith('.pdf'):
@@ -146,84 +292,142 @@ async def upload_document(file: UploadFile = File(...)):
 
     file_path = None
     try:
-        # Gera nome único preservando a extensão 
-        file_ext = Path(file.filename).suffix
-        file_id = f"{datetime.now().strftime('%Y%m%d')}_{uuid.uuid4().hex[:8]}_{file.filename}"
-        file_path = os.path.join(UPLOAD_DIR, file_id)
-        
-        # Salva em stream com verificação de tamanho 
+        # Salva em stream com verificação de tamanho, calculando o hash do conteúdo
+        file_path = os.path.join(PENDING_DIR, f"{uuid.uuid4().hex}.upload")
         file_size = 0
+        digest = hashlib.sha256()
         with open(file_path, "wb") as buffer:
             while chunk := await file.read(8192):  # 8KB chunks
                 file_size += len(chunk)
                 if file_size > MAX_FILE_SIZE:
+                    buffer.close()
                     os.remove(file_path)
                     raise HTTPException(
                         status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                         detail=f"Arquivo excede o tamanho máximo de {MAX_FILE_SIZE//(1024*1024)}MB"
                     )
+                digest.update(chunk)
                 buffer.write(chunk)
-        
-        # PROCESSAMENTO AUTOMÁTICO
-        logger.info(f"Iniciando processamento automático de {file.filename}")
-        try:
-            processing_result = await process_and_index_pdf(file_path, file_id)
-            logger.info(f"Processamento concluído: {processing_result}")
-            
-            # Salva metadados incluindo resumo E persiste no arquivo
-            documents_metadata[file_id] = {
-                'original_name': file.filename,
-                'summary': processing_result.get('summary', 'Resumo não disponível'),
-                'upload_date': datetime.now().isoformat(),
-                'file_size': file_size
-            }
-            
-            # Persiste metadados no arquivo
-            save_metadata()
-            
-            # Retorna metadados completos + resultado do processamento
-            return {
+        content_hash = digest.hexdigest()
+
+        # Conteúdo idêntico já indexado (ou em indexação): nada a fazer
+        existing_id = find_document(content_hash=content_hash)
+        active_job = next((job for job in ingestion_jobs.list_jobs(limit=None)
+                           if job.get("content_hash") == content_hash and job["status"] in ACTIVE_JOB_STATUSES), None)
+        if existing_id or active_job:
+            os.remove(file_path)
+            file_id = existing_id or active_job["file_id"]
+            logger.info(f"Upload de {file.filename} ignorado: conteúdo idêntico a {file_id}")
+            return JSONResponse(status_code=status.HTTP_200_OK, content={
                 "id": file_id,
+                "job_id": active_job["id"] if active_job else None,
                 "original_name": file.filename,
                 "size": file_size,
-                "upload_date": datetime.now().isoformat(),
-                "file_path": file_path,
-                "processing_result": processing_result,
-                "summary": processing_result.get('summary', 'Resumo não disponível'),
-                "status": "success",
-                "message": f"Documento '{file.filename}' carregado e indexado com sucesso!"
-            }
-            
-        except Exception as processing_error:
-            # Se falhar no processamento, remove o arquivo e informa erro
-            logger.error(f"Erro no processamento de {file.filename}: {processing_error}")
-            
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"Arquivo removido após falha no processamento: {file_path}")
-            
-            # Re-lança erro para informar o usuário
-            if isinstance(processing_error, HTTPException):
-                raise processing_error
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Falha no processamento do documento: {str(processing_error)}"
-                )
+                "content_hash": content_hash,
+                "status": "unchanged",
+                "message": f"Documento '{file.filename}' já está no acervo; nenhuma reindexação necessária."
+            })
+
+        # Mesmo nome com conteúdo novo: atualiza o documento existente (reindexação incremental);
+        # caso contrário, gera o id a partir do hash preservando o formato data_hash_nome
+        file_id = find_document(original_name=file.filename) or \
+            f"{datetime.now().strftime('%Y%m%d')}_{content_hash[:8]}_{file.filename}"
+        pending_path = os.path.join(PENDING_DIR, f"{content_hash}.pdf")
+        os.replace(file_path, pending_path)
+        file_path = pending_path
+        with open(_pending_info_path(file_path), 'w', encoding='utf-8') as f:
+            json.dump({'file_id': file_id, 'original_name': file.filename, 'file_size': file_size,
+                       'content_hash': content_hash}, f, ensure_ascii=False)
+        
+        # PROCESSAMENTO EM SEGUNDO PLANO
+        logger.info(f"Enfileirando processamento de {file.filename}")
+        job = _submit_ingestion(file_path, file_id, file.filename, file_size, content_hash)
+
+        return {
+            "id": file_id,
+            "job_id": job["id"],
+            "original_name": file.filename,
+            "size": file_size,
+            "content_hash": content_hash,
+            "upload_date": datetime.now().isoformat(),
+            "status": job["status"],
+            "status_url": f"/api/admin/jobs/{job['id']}",
+            "message": f"Documento '{file.filename}' recebido! A indexação foi iniciada em segundo plano."
+        }
 
     except HTTPException:
         raise
     except Exception as e:
         # Remove arquivo em caso de erro geral
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
+        if file_path:
+            _remove_pending(file_path)
             
         logger.error(f"Upload error: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Falha no processamento do documento"
+            detail="Falha ao receber o documento"
         )
 
+@router.get("/jobs")
+async def list_jobs(limit: int = 50):
+    """Lista os jobs de ingestão mais recentes com etapa e progresso"""
+    return {
+        "jobs": [_job_response(job) for job in ingestion_jobs.list_jobs(limit)],
+        "stats": ingestion_jobs.stats()
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Consulta o estado de um job de ingestão"""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job não encontrado"
+        )
+    return _job_response(job)
+
+@router.post("/jobs/{job_id}/retry", status_code=status.HTTP_202_ACCEPTED)
+async def retry_job(job_id: str):
+    """Reenfileira um job que falhou definitivamente"""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job não encontrado"
+        )
+    published = job["status"] == JOB_FINALIZE_FAILED and os.path.exists(os.path.join(UPLOAD_DIR, job["file_id"]))
+    if not os.path.exists(job["file_path"]) and not published:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Arquivo do job não está mais disponível; envie o documento novamente"
+        )
+
+    job = ingestion_jobs.retry(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Apenas jobs com falha podem ser reprocessados"
+        )
+    return _job_response(job)
+
+@router.delete("/jobs/{job_id}")
+async def discard_job(job_id: str):
+    """Descarta um job que falhou, removendo o arquivo pendente"""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job não encontrado"
+        )
+    if not ingestion_jobs.discard(job_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Apenas jobs com falha podem ser descartados"
+        )
+    _remove_pending(job["file_path"])
+    return {"success": True, "message": "Job descartado com sucesso"}
+
 @router.get("/download/{file_id}")
 async def download_document(file_id: str):
     """Endpoint para download direto de documentos"""
@@ -268,15 +472,24 @@ async def delete_document(file_id: str):
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Documento não encontrado"
             )
+
+        # Remove os vetores e o texto dos chunks antes do arquivo: se falhar, o documento continua consistente
+        purge_result = await run_in_threadpool(purge_document_vectors, file_id)
             
         os.remove(file_path)
         
         # Remove metadados também e persiste a alteração
-        if file_id in documents_metadata:
-            del documents_metadata[file_id]
-            save_metadata()
+        with metadata_lock:
+            if file_id in documents_metadata:
+                del documents_metadata[file_id]
+                save_metadata()
+
+        # Respostas que citavam o documento removido não podem mais ser servidas do cache
+        answer_cache.invalidate_document(file_id)
             
-        return {"success": True, "message": "Documento removido com sucesso"}
+        return {"success": True, "message": "Documento removido com sucesso", "vectors_deleted": purge_result["vectors_deleted"]}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Delete error: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -299,4 +512,23 @@ async def sync_metadata():
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Erro ao sincronizar metadados"
-        )
\ No newline at end of file
+        )
+
+
+@router.post("/index/reconcile")
+async def reconcile_vector_index():
+    """Remove do índice vetorial os chunks de documentos que não existem mais no acervo"""
+    try:
+        result = await run_in_threadpool(reconcile_index, get_known_filenames)
+        return {"success": True, **result}
+    except Exception as e:
+        logger.error(f"Reconcile error: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Erro ao reconciliar o índice vetorial"
+        )
+
+@router.get("/models")
+async def list_models():
+    """Modelos carregados no processo, com tempo de carga e consumo de memória"""
+    return model_registry.stats()
@@ -0,0 +1,251 @@
+# Cache semântico de respostas do chat.
+# Evita repetir embedding + busca vetorial + chamada ao LLM para perguntas que os estudantes
+# fazem centenas de vezes por dia (calendário, matrícula, trancamento...).
+# A busca no cache acontece em duas etapas:
+#   1. Texto normalizado exato (antes mesmo de gerar o embedding da pergunta).
+#   2. Similaridade de cosseno entre embeddings acima de um limiar configurável.
+# As entradas são isoladas por escopo (documento selecionado ou "all"), expiram por TTL,
+# são descartadas por LRU quando o cache enche e invalidadas quando o acervo muda.
+
+import os
+import time
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Escopo usado quando a pergunta não filtra por documento
+ALL_DOCUMENTS_SCOPE = "all"
+
+def normalize_question(text: str) -> str:
+    """
+    Normaliza a pergunta para a comparação exata: minúsculas, sem acentos,
+    espaços colapsados e sem pontuação final.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.split()).rstrip("?!. ")
+
+def question_scope(selected_document: Optional[str]) -> str:
+    """Escopo do cache para o documento selecionado na requisição."""
+    if not selected_document or selected_document == ALL_DOCUMENTS_SCOPE:
+        return ALL_DOCUMENTS_SCOPE
+    return selected_document
+
+class SemanticAnswerCache:
+    """Cache LRU com TTL de respostas do chat, com busca exata e por similaridade."""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()  # Ordem = recência de uso (LRU)
+        self._exact_index: Dict[tuple, int] = {}        # (escopo, texto normalizado) -> id da entrada
+        self._scope_index: Dict[str, set] = {}          # escopo -> ids das entradas
+        self._scope_matrix: Dict[str, tuple] = {}       # escopo -> (ids, matriz de embeddings) em cache
+        self._next_id = 1
+
+        # Geração do acervo: respostas calculadas antes de uma invalidação não são armazenadas.
+        self.generation = 0
+
+        self._counters = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "insertions": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0
+        }
+
+    # ---------- Consultas ----------
+
+    def get_exact(self, question: str, selected_document: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Busca uma resposta pelo texto normalizado da pergunta.
+        Não conta miss: a busca semântica ainda pode encontrar a resposta.
+        """
+        key = (question_scope(selected_document), normalize_question(question))
+        with self._lock:
+            entry_id = self._exact_index.get(key)
+            entry = self._get_live_entry(entry_id)
+            if entry is None:
+                return None
+            self._counters["exact_hits"] += 1
+            return {**entry["payload"], "cache": {"type": "exact", "similarity": 1.0}}
+
+    def get_similar(self, embedding, selected_document: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Busca a resposta mais similar no escopo da pergunta usando similaridade de cosseno.
+        Registra um miss quando nenhuma entrada supera o limiar.
+        """
+        scope = question_scope(selected_document)
+        query = self._normalize_vector(embedding)
+        with self._lock:
+            ids, matrix = self._get_scope_matrix(scope)
+            if not ids:
+                self._counters["misses"] += 1
+                return None
+
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            entry = self._get_live_entry(ids[best]) if similarity >= self.similarity_threshold else None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+
+            self._counters["semantic_hits"] += 1
+            return {**entry["payload"], "cache": {"type": "semantic", "similarity": round(similarity, 4)}}
+
+    # ---------- Escrita e invalidação ----------
+
+    def put(self, question: str, selected_document: Optional[str], embedding, payload: Dict[str, Any], generation: Optional[int] = None) -> bool:
+        """
+        Armazena a resposta de uma pergunta.
+
+        Args:
+            question (str): Pergunta original.
+            selected_document (str): Documento selecionado (define o escopo).
+            embedding: Embedding da pergunta.
+            payload (dict): Dados retornados em um acerto (resposta, fontes, contexto...).
+            generation (int): Geração do acervo lida antes da recuperação; se o acervo mudou
+                              desde então, a resposta é descartada por estar potencialmente desatualizada.
+
+        Returns:
+            bool: True se a entrada foi armazenada.
+        """
+        scope = question_scope(selected_document)
+        key = (scope, normalize_question(question))
+        vector = self._normalize_vector(embedding)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+
+            if key in self._exact_index:
+                self._remove_entry(self._exact_index[key])
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "scope": scope,
+                "key": key,
+                "embedding": vector,
+                "payload": payload,
+                "created_at": time.monotonic()
+            }
+            self._exact_index[key] = entry_id
+            self._scope_index.setdefault(scope, set()).add(entry_id)
+            self._scope_matrix.pop(scope, None)
+            self._counters["insertions"] += 1
+
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove_entry(oldest_id)
+                self._counters["evictions"] += 1
+            return True
+
+    def invalidate_document(self, filename: str) -> int:
+        """
+        Invalida as respostas afetadas por uma alteração no documento:
+        as do escopo do próprio documento e as do escopo "todos os documentos".
+
+        Returns:
+            int: Número de entradas removidas.
+        """
+        with self._lock:
+            self.generation += 1
+            entry_ids = set(self._scope_index.get(filename, ())) | set(self._scope_index.get(ALL_DOCUMENTS_SCOPE, ()))
+            for entry_id in entry_ids:
+                self._remove_entry(entry_id)
+            self._counters["invalidations"] += len(entry_ids)
+
+        logger.info(f"Cache de respostas invalidado para '{filename}': {len(entry_ids)} entradas removidas")
+        return len(entry_ids)
+
+    def clear(self) -> None:
+        """Remove todas as entradas do cache."""
+        with self._lock:
+            self.generation += 1
+            self._counters["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._exact_index.clear()
+            self._scope_index.clear()
+            self._scope_matrix.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de acerto/erro e ocupação do cache."""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        hits = counters["exact_hits"] + counters["semantic_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_threshold": self.similarity_threshold
+        }
+
+    # ---------- Auxiliares (chamados com o lock adquirido) ----------
+
+    @staticmethod
+    def _normalize_vector(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _get_live_entry(self, entry_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        """Retorna a entrada se ainda válida (TTL), marcando-a como usada recentemente."""
+        if entry_id is None or entry_id not in self._entries:
+            return None
+        entry = self._entries[entry_id]
+        if time.monotonic() - entry["created_at"] > self.ttl_seconds:
+            self._remove_entry(entry_id)
+            self._counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(entry_id)
+        return entry
+
+    def _get_scope_matrix(self, scope: str) -> tuple:
+        """Matriz contígua de embeddings do escopo, reconstruída apenas quando o escopo muda."""
+        cached = self._scope_matrix.get(scope)
+        if cached is None:
+            ids = list(self._scope_index.get(scope, ()))
+            matrix = np.stack([self._entries[i]["embedding"] for i in ids]) if ids else None
+            cached = (ids, matrix)
+            self._scope_matrix[scope] = cached
+        return cached
+
+    def _remove_entry(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._exact_index.pop(entry["key"], None)
+        scope_ids = self._scope_index.get(entry["scope"])
+        if scope_ids is not None:
+            scope_ids.discard(entry_id)
+            if not scope_ids:
+                del self._scope_index[entry["scope"]]
+        self._scope_matrix.pop(entry["scope"], None)
+
+# Instância global compartilhada pelas rotas de chat e administração
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+answer_cache = SemanticAnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+)
@@ -0,0 +1,208 @@
+# Índice BM25 dos chunks, para busca híbrida (palavras-chave + vetores) no chat.
+# A busca vetorial sozinha recupera mal perguntas com identificadores exatos ("Resolução nº 1892",
+# números de artigos), que para o modelo de embeddings são quase indistinguíveis entre si.
+# O índice invertido fica no mesmo SQLite do chunk store e é atualizado de forma incremental na
+# ingestão (apenas os chunks novos ou removidos). No chat, os resultados são combinados com os da
+# busca vetorial por reciprocal rank fusion e, se o banco vetorial estiver fora do ar, servem
+# sozinhos como busca de fallback.
+# As consultas não varrem o SQLite: usam uma cópia do índice em memória (KeywordIndex, arrays NumPy
+# com os pesos BM25 pré-calculados), recarregada quando a versão do índice no banco muda.
+
+import os
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from routes.chunk_store import chunk_store, MAX_SQL_VARIABLES
+from routes.text_search import KeywordIndex, tokenize
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+class ChunkBM25Index:
+    """Índice invertido persistente (termo -> chunks com a frequência do termo) com ranking BM25."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()  # Uma conexão por thread
+        self._snapshot_lock = threading.Lock()
+        self._snapshot = None  # (versão, KeywordIndex, ids dos chunks, documento de cada chunk, nomes dos documentos)
+        self._init_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")      # Leitores não bloqueiam o escritor
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bm25_postings (
+                    term TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (term, chunk_id)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_bm25_postings_chunk ON bm25_postings (chunk_id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bm25_docs (
+                    chunk_id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    length INTEGER NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_bm25_docs_filename ON bm25_docs (filename)")
+            # Totais do corpus (número de chunks e soma dos tamanhos), atualizados a cada escrita
+            conn.execute("CREATE TABLE IF NOT EXISTS bm25_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO bm25_meta (key, value) VALUES ('documents', 0), ('total_length', 0), ('version', 0)")
+
+    # ---------- Escrita ----------
+
+    def _delete_ids(self, conn: sqlite3.Connection, ids: List[str]) -> int:
+        removed = 0
+        for i in range(0, len(ids), MAX_SQL_VARIABLES):
+            batch = ids[i:i + MAX_SQL_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            conn.execute(f"DELETE FROM bm25_postings WHERE chunk_id IN ({placeholders})", batch)
+            removed += conn.execute(f"DELETE FROM bm25_docs WHERE chunk_id IN ({placeholders})", batch).rowcount
+        return removed
+
+    def _update_meta(self, conn: sqlite3.Connection) -> None:
+        documents, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM bm25_docs").fetchone()
+        conn.execute("UPDATE bm25_meta SET value = ? WHERE key = 'documents'", (documents,))
+        conn.execute("UPDATE bm25_meta SET value = ? WHERE key = 'total_length'", (total_length,))
+        conn.execute("UPDATE bm25_meta SET value = value + 1 WHERE key = 'version'")
+
+    def add_chunks(self, filename: str, chunks: Iterable[dict]) -> int:
+        """
+        Indexa chunks de um documento (dicionários com `id` e `content`) em uma única transação.
+        Ids já indexados são substituídos.
+
+        Returns:
+            int: Número de chunks indexados.
+        """
+        docs, postings = [], []
+        for chunk in chunks:
+            terms = Counter(tokenize(chunk["content"]))
+            docs.append((chunk["id"], filename, sum(terms.values())))
+            postings.extend((term, chunk["id"], tf) for term, tf in terms.items())
+        if not docs:
+            return 0
+        conn = self._connection()
+        with conn:
+            self._delete_ids(conn, [doc[0] for doc in docs])
+            conn.executemany("INSERT INTO bm25_docs (chunk_id, filename, length) VALUES (?, ?, ?)", docs)
+            conn.executemany("INSERT INTO bm25_postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+            self._update_meta(conn)
+        return len(docs)
+
+    def delete_chunks(self, ids: List[str]) -> int:
+        if not ids:
+            return 0
+        conn = self._connection()
+        with conn:
+            removed = self._delete_ids(conn, list(ids))
+            self._update_meta(conn)
+        return removed
+
+    def delete_document(self, filename: str) -> int:
+        ids = [row["chunk_id"] for row in self._connection().execute(
+            "SELECT chunk_id FROM bm25_docs WHERE filename = ?", (filename,)
+        )]
+        return self.delete_chunks(ids)
+
+    def sync_with_chunk_store(self) -> int:
+        """
+        Indexa os chunks do chunk store que ainda não estão no índice (documentos ingeridos antes
+        do BM25) e remove do índice os que não existem mais. Retorna o número de chunks indexados.
+        """
+        conn = self._connection()
+        missing = conn.execute("""
+            SELECT c.id, c.filename, c.content FROM chunks c
+            WHERE NOT EXISTS (SELECT 1 FROM bm25_docs d WHERE d.chunk_id = c.id)
+        """).fetchall()
+        orphans = [row["chunk_id"] for row in conn.execute("""
+            SELECT d.chunk_id FROM bm25_docs d
+            WHERE NOT EXISTS (SELECT 1 FROM chunks c WHERE c.id = d.chunk_id)
+        """)]
+        self.delete_chunks(orphans)
+
+        by_document: Dict[str, List[dict]] = {}
+        for row in missing:
+            by_document.setdefault(row["filename"], []).append({"id": row["id"], "content": row["content"]})
+        indexed = sum(self.add_chunks(filename, chunks) for filename, chunks in by_document.items())
+        if indexed or orphans:
+            logger.info(f"Índice BM25 sincronizado: {indexed} chunks indexados, {len(orphans)} removidos")
+        return indexed
+
+    # ---------- Busca ----------
+
+    def _load_snapshot(self, version: int) -> tuple:
+        """Lê o índice inteiro do banco para a memória (um KeywordIndex) e o associa à versão lida."""
+        conn = self._connection()
+        positions: Dict[str, int] = {}
+        lengths, document_ids, filenames = [], [], {}
+        for chunk_id, filename, length in conn.execute("SELECT chunk_id, filename, length FROM bm25_docs"):
+            positions[chunk_id] = len(positions)
+            lengths.append(length)
+            document_ids.append(filenames.setdefault(filename, len(filenames)))
+        terms, docs, frequencies = [], [], []
+        for term, chunk_id, tf in conn.execute("SELECT term, chunk_id, tf FROM bm25_postings"):
+            position = positions.get(chunk_id)
+            if position is not None:
+                terms.append(term)
+                docs.append(position)
+                frequencies.append(tf)
+        index = KeywordIndex.from_postings(lengths, terms, docs, frequencies)
+        return version, index, list(positions), np.asarray(document_ids, dtype=np.int32), filenames
+
+    def _current_snapshot(self) -> tuple:
+        version = self._connection().execute("SELECT value FROM bm25_meta WHERE key = 'version'").fetchone()[0]
+        with self._snapshot_lock:
+            if self._snapshot is None or self._snapshot[0] != version:
+                self._snapshot = self._load_snapshot(version)
+                logger.info(f"Índice BM25 carregado em memória: {len(self._snapshot[1])} chunks (versão {version})")
+            return self._snapshot
+
+    def search(self, query: str, top_k: int, filename: Optional[str] = None) -> List[Tuple[str, float, str]]:
+        """
+        Chunks mais relevantes para a consulta segundo o BM25.
+
+        Args:
+            filename: Restringe a busca a um documento (as estatísticas do corpus continuam globais).
+
+        Returns:
+            list: [(id do chunk, score, documento)] em ordem decrescente de score.
+        """
+        _, index, chunk_ids, document_ids, filenames = self._current_snapshot()
+        mask = None
+        if filename:
+            if filename not in filenames:
+                return []
+            mask = document_ids == filenames[filename]
+        names = list(filenames)
+        return [(chunk_ids[i], score, names[document_ids[i]]) for i, score in index.search(query, top_k, mask)]
+
+    def stats(self) -> dict:
+        meta = dict(self._connection().execute("SELECT key, value FROM bm25_meta").fetchall())
+        snapshot = self._snapshot
+        return {
+            "chunks": meta["documents"], "version": meta["version"], "path": self.path,
+            "loaded_version": snapshot[0] if snapshot else None,
+            "postings": len(snapshot[1].doc_ids) if snapshot else 0
+        }
+
+# Instância global, no mesmo banco do chunk store
+bm25_index = ChunkBM25Index(chunk_store.path)
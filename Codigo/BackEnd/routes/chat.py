@@ -1,31 +1,83 @@
 # Módulo responsável por gerenciar as interações de chat.
 # Este componente coordena a recuperação de informações de documentos e a geração de respostas
-# utilizando um modelo de linguagem grande (LLM) da Groq.
+# utilizando um modelo de linguagem grande (LLM), acessado pelo gateway de LLM (Groq por padrão).
 
 from fastapi import APIRouter, Body, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from groq import Groq # Cliente para interagir com a API Groq
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import json
+from typing import Dict
 import os
+import time
 import logging
 
 # Importa as funções auxiliares necessárias para o pipeline RAG (Retrieval-Augmented Generation):
-#   - generate_embedding: Para converter texto em vetores numéricos.
+#   - generate_embedding_async: Para converter texto em vetores numéricos (com cache e micro-batching).
 #   - get_pinecone_index: Para acessar a instância do índice Pinecone.
-from routes.utils import generate_embedding, get_pinecone_index
+from routes.utils import generate_embedding_async, get_pinecone_index, get_embedding_cache_stats, get_embedding_batcher_stats
+
+# Texto dos chunks, armazenado fora dos metadados do índice vetorial
+from routes.chunk_store import chunk_store
+
+# Montagem do contexto dentro do orçamento de tokens do LLM
+from routes.context_packer import pack_context, token_counter
+
+# Reordenação opcional por cross-encoder, com orçamento de tempo por requisição
+from routes.reranker import reranker
+
+# Índice BM25 dos chunks: busca por palavras-chave combinada com a busca vetorial
+from routes.bm25_index import bm25_index
+
+# Cache semântico de respostas (texto exato + similaridade de embeddings, por documento)
+from routes.answer_cache import answer_cache, ANSWER_CACHE_ENABLED
 
 # Importa autenticação e função para salvar histórico
 from routes.login import get_current_active_user
 
+# Gateway de LLM: provedor configurável, pool de conexões, timeouts, retentativas e limite
+# de chamadas simultâneas por modelo (compartilhado com a ingestão)
+from routes.llm_gateway import llm_gateway
+
 # Carrega as variáveis de ambiente definidas no arquivo .env do projeto.
 load_dotenv()
 
-# Inicializa o cliente Groq. A chave da API é carregada de forma segura das variáveis de ambiente.
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
 # Configura o logger específico para este módulo para facilitar o rastreamento de eventos e erros.
 logger = logging.getLogger(__name__)
 
+# --- Limites de concorrência por etapa do pipeline RAG ---
+# As etapas bloqueantes rodam fora do event loop, para que uma pergunta lenta não congele
+# as demais rotas (login, histórico...) do mesmo worker:
+#   - embedding: thread única do micro-batcher (routes.utils), que agrupa perguntas concorrentes;
+#   - consulta vetorial: pool de threads dedicado, cujo tamanho é o limite de concorrência da etapa;
+#   - rerank: pool próprio e pequeno, para que o cross-encoder (CPU) não ocupe as threads da consulta
+#     vetorial (I/O);
+#   - LLM: chamadas assíncronas, limitadas por modelo no gateway (LLM_MAX_CONCURRENT_PER_MODEL).
+MAX_CONCURRENT_VECTOR_QUERIES = int(os.getenv("CHAT_MAX_CONCURRENT_VECTOR_QUERIES", "16"))
+
+MAX_CONCURRENT_RERANKS = int(os.getenv("CHAT_MAX_CONCURRENT_RERANKS", "2"))
+
+vector_query_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_VECTOR_QUERIES, thread_name_prefix="chat-vector-query")
+rerank_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_RERANKS, thread_name_prefix="chat-rerank")
+
+async def run_in_stage_executor(executor: ThreadPoolExecutor, func, *args, **kwargs):
+    """
+    Executa uma função bloqueante no pool de threads da etapa, sem bloquear o event loop.
+
+    Args:
+        executor (ThreadPoolExecutor): Pool da etapa (ex.: consulta vetorial).
+        func: Função síncrona a ser executada.
+
+    Returns:
+        O valor retornado por `func`.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
 # Cria um APIRouter, que permite organizar rotas relacionadas ao chat de forma modular.
 router = APIRouter()
 
@@ -35,136 +87,386 @@ class ChatRequest(BaseModel):
     question: str # O único campo esperado na requisição é a pergunta do usuário.
     selected_document: str = None  #Campo opcional para documento selecionado
 
-@router.post("")
-async def send_message(
-    request: ChatRequest = Body(...),
-    current_user: dict = Depends(get_current_active_user)
-):
+# Parâmetros de geração compartilhados pelas rotas síncrona e em streaming
+# (o modelo é o padrão do gateway, LLM_MODEL).
+LLM_GENERATION_PARAMS = {
+    "max_tokens": 2000, # Define o limite máximo de tokens para respostas mais completas.
+    "temperature": 0.05, # Temperatura muito baixa para máxima precisão e consistência.
+    "top_p": 0.95 # Controle adicional da diversidade de resposta
+}
+
+async def embed_question(question: str) -> list[float]:
     """
-    Endpoint principal para o processamento de mensagens de chat.
-    Implementa o fluxo de trabalho de Retrieval-Augmented Generation (RAG):
-    1.  A pergunta do usuário é convertida em um embedding vetorial.
-    2.  Este embedding é usado para buscar documentos relevantes em um banco de dados vetorial (Pinecone).
-    3.  Os trechos de documentos recuperados são combinados com a pergunta original
-        para formar um prompt contextualizado para o LLM.
-    4.  O modelo de linguagem da Groq processa este prompt e gera uma resposta coerente e informada.
-    5.  A resposta do LLM, juntamente com as fontes consultadas, é retornada ao cliente.
-    6.  A conversa é automaticamente salva no histórico do usuário autenticado.
+    Etapa 1: Geração do embedding da pergunta do usuário.
+    Este vetor numérico é a representação semântica da pergunta.
+    Aguarda o micro-batcher de embeddings sem bloquear o event loop.
+    """
+    return await generate_embedding_async(question)
 
-    Args:
-        request (ChatRequest): Objeto contendo a pergunta do usuário e documento selecionado opcional.
-        current_user (dict): Dados do usuário autenticado.
+async def lookup_answer_cache(question: str, selected_document: str = None) -> tuple:
+    """
+    Consulta o cache de respostas antes do pipeline RAG.
+    A busca exata pelo texto normalizado dispensa até o embedding; caso contrário,
+    o embedding gerado é reaproveitado na busca semântica e, num miss, na busca vetorial.
 
     Returns:
-        dict: Um dicionário contendo a resposta gerada (`answer`),
-              as fontes dos documentos utilizados (`sources`), um trecho do contexto completo (`context`),
-              e informações de debug (`debug_info`).
+        tuple: (resposta em cache ou None, embedding da pergunta ou None)
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
 
-    Raises:
-        HTTPException: Erros HTTP são levantados para cenários como perguntas ausentes,
-                       ou falhas na inicialização/acesso a serviços externos (Pinecone, Groq).
+    cached = answer_cache.get_exact(question, selected_document)
+    if cached is not None:
+        return cached, None
+
+    question_embedding = await embed_question(question)
+    return answer_cache.get_similar(question_embedding, selected_document), question_embedding
+
+# Parâmetros da seleção de chunks: busca principal (top 15) e, se ela trouxer poucos
+# chunks, expansão até o top 25 com no máximo 12 chunks no total.
+PRIMARY_TOP_K = 15
+EXPANDED_TOP_K = 25
+MIN_PRIMARY_CHUNKS = 5
+MAX_CONTEXT_CHUNKS = 12
+
+# Orçamento de tokens do contexto: o prompt inteiro (instruções, pergunta e contexto) mais a
+# resposta (max_tokens) precisam caber na janela do modelo. O contexto usa no máximo
+# CHAT_CONTEXT_TOKEN_BUDGET tokens, ou menos se a pergunta for longa.
+CONTEXT_WINDOW_TOKENS = int(os.getenv("CHAT_CONTEXT_WINDOW", "8192"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "4000"))
+
+# --- Busca híbrida (BM25 + vetores) ---
+# Os rankings das duas buscas são combinados por reciprocal rank fusion (RRF): cada chunk soma
+# 1 / (RRF_K + posição) em cada lista em que aparece. Sem o banco vetorial, o BM25 responde sozinho.
+HYBRID_SEARCH_ENABLED = os.getenv("CHAT_HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+BM25_TOP_K = int(os.getenv("CHAT_BM25_TOP_K", "25"))
+RRF_K = int(os.getenv("CHAT_RRF_K", "60"))
+
+class RetrievedMatch:
+    """
+    Resultado da busca com a mesma interface dos matches do Pinecone (id, score, metadata).
+    `score` continua sendo a similaridade de cosseno da busca vetorial (0.0 para chunks achados
+    só pelo BM25); o valor do RRF, usado na ordenação, fica em `fusion_score`.
+    """
+    __slots__ = ("id", "score", "metadata", "fusion_score", "keyword_score")
+
+    def __init__(self, id: str, score: float, metadata: dict, fusion_score: float = None, keyword_score: float = None):
+        self.id = id
+        self.score = score
+        self.metadata = metadata
+        self.fusion_score = fusion_score
+        self.keyword_score = keyword_score
+
+def reciprocal_rank_fusion(dense_matches: list, keyword_results: list, k: int = RRF_K) -> list:
     """
+    Funde os resultados da busca vetorial e da busca BM25 por reciprocal rank fusion.
+
+    Args:
+        dense_matches (list): Matches da busca vetorial, ordenados por similaridade.
+        keyword_results (list): [(id do chunk, score BM25, documento)] ordenados por score.
+
+    Returns:
+        list: RetrievedMatch ordenados pelo score fundido (`fusion_score`), com a similaridade
+              de cosseno preservada em `score`.
+    """
+    scores, metadata, dense_scores, keyword_scores = {}, {}, {}, {}
+    for match in dense_matches:
+        if match.id not in metadata:
+            metadata[match.id] = match.metadata or {}
+            dense_scores[match.id] = match.score
+            scores[match.id] = 1 / (k + len(scores) + 1)
+    for rank, (chunk_id, keyword_score, filename) in enumerate(keyword_results, start=1):
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + 1 / (k + rank)
+        keyword_scores[chunk_id] = keyword_score
+        metadata.setdefault(chunk_id, {"filename": filename})
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [
+        RetrievedMatch(chunk_id, dense_scores.get(chunk_id, 0.0), metadata[chunk_id],
+                       fusion_score=fusion_score, keyword_score=keyword_scores.get(chunk_id))
+        for chunk_id, fusion_score in ranked
+    ]
+
+def search_keywords(question: str, filename: str = None) -> list:
+    """Busca BM25 da pergunta; uma falha aqui só desativa a parte de palavras-chave da busca."""
     try:
-        question = request.question
-        selected_document = request.selected_document  
+        return bm25_index.search(question, BM25_TOP_K, filename)
+    except Exception as e:
+        logger.warning(f"Busca BM25 indisponível: {e}")
+        return []
+
+def hydrate_chunks(matches: list) -> Dict[str, dict]:
+    """
+    Busca em lote, no chunk store, o texto e a posição (chunk_order) dos chunks selecionados.
+    Vetores indexados antes do chunk store ainda trazem o conteúdo nos metadados; ele é usado
+    como alternativa quando o id não está no store.
+
+    Returns:
+        dict: id do chunk -> {"content", "chunk_order"} (ids sem conteúdo são omitidos).
+    """
+    stored = chunk_store.get_chunks([match.id for match in matches])
+    contents = {}
+    for match in matches:
+        if match.id in stored:
+            contents[match.id] = {'content': stored[match.id]['content'], 'chunk_order': stored[match.id]['chunk_order']}
+        elif match.metadata and match.metadata.get('content'):
+            contents[match.id] = {'content': match.metadata['content'], 'chunk_order': match.metadata.get('chunk_order')}
+    return contents
+
+def select_matches(matches: list, allow_expansion: bool = True) -> tuple:
+    """
+    Seleciona localmente os chunks do contexto a partir de uma única consulta sobredimensionada
+    e hidrata apenas o texto dos chunks que serão usados.
+    1. Seleção principal: chunks com conteúdo entre os PRIMARY_TOP_K primeiros resultados.
+    2. Fallback: se houver menos de MIN_PRIMARY_CHUNKS e a busca não for filtrada, completa com
+       os resultados seguintes (até EXPANDED_TOP_K) até MAX_CONTEXT_CHUNKS, sem repetir ids.
+       A hidratação extra só ocorre nesse caso e é uma leitura local.
+
+    Args:
+        matches (list): Resultados da consulta vetorial, ordenados por score.
+        allow_expansion (bool): Se o fallback de busca expandida pode ser aplicado.
+
+    Returns:
+        tuple: (candidates, selection) onde `candidates` são os chunks selecionados, em ordem de
+               relevância, para o empacotamento do contexto e `selection` contém informações de debug.
+    """
+    candidates = [] # Chunks selecionados (id, documento, posição, conteúdo e score).
+    selected_ids = set()
+    selection = {
+        'vector_queries': 1,
+        'fetched': len(matches),
+        'primary_candidates': min(len(matches), PRIMARY_TOP_K),
+        'primary_selected': 0,
+        'expanded_selected': 0,
+        'expansion_triggered': False,
+        'empty_skipped': 0,
+        'duplicates_skipped': 0,
+        'hydrated': 0
+    }
+
+    # Candidatos da seleção principal, sem ids repetidos, hidratados em uma única leitura.
+    primary_matches = []
+    for match in matches[:PRIMARY_TOP_K]:
+        if match.id in selected_ids:
+            selection['duplicates_skipped'] += 1
+            continue
+        selected_ids.add(match.id)
+        primary_matches.append(match)
+    contents = hydrate_chunks(primary_matches)
+    selection['hydrated'] += len(primary_matches)
+
+    # Processa cada resultado (match) da seleção principal.
+    for match in primary_matches:
+        # Extrai o conteúdo e os metadados do chunk.
+        hydrated = contents.get(match.id, {})
+        content = hydrated.get('content', '')
         
-        if not question:
-            raise HTTPException(status_code=400, detail='A pergunta do usuário não foi fornecida.')
+        # Verifica se o conteúdo não está vazio antes de adicionar
+        if content.strip():
+            candidates.append({
+                'id': match.id,
+                'filename': match.metadata.get('filename', 'N/A'),
+                'chunk_order': hydrated.get('chunk_order'),
+                'content': content,
+                'score': match.score, # A pontuação de similaridade.
+                'fusion_score': getattr(match, 'fusion_score', None), # Score do RRF (busca híbrida)
+                'expanded': False
+            })
+        else:
+            selection['empty_skipped'] += 1
+    selection['primary_selected'] = len(candidates)
 
-        # Etapa 1: Geração do embedding da pergunta do usuário.
-        # Este vetor numérico é a representação semântica da pergunta.
-        question_embedding = generate_embedding(question)
+    # Sistema de fallback: se temos poucos resultados, usa o restante do conjunto expandido
+    if len(candidates) < MIN_PRIMARY_CHUNKS and allow_expansion:
+        logger.info("Poucos chunks encontrados, usando resultados da busca expandida")
+        selection['expansion_triggered'] = True
+        
+        # Hidrata apenas os candidatos que ainda cabem no limite de 12 chunks totais
+        expanded_matches = [m for m in matches[:EXPANDED_TOP_K] if m.id not in selected_ids]
+        expanded_matches = expanded_matches[:MAX_CONTEXT_CHUNKS - len(candidates)]
+        contents = hydrate_chunks(expanded_matches)
+        selection['hydrated'] += len(expanded_matches)
 
-        # Etapa 2: Busca de contexto relevante no Pinecone.
-        # Verifica se a instância do índice Pinecone está disponível.
-        pinecone_index_instance = get_pinecone_index()
-        if not pinecone_index_instance:
-            raise HTTPException(status_code=500, detail="O índice Pinecone não foi inicializado ou está inacessível. O serviço de busca de documentos está inoperante.")
+        # Adiciona resultados adicionais sem threshold muito restritivo
+        for match in expanded_matches:
+            hydrated = contents.get(match.id, {})
+            content = hydrated.get('content', '')
+            
+            if content.strip():
+                selected_ids.add(match.id)
+                candidates.append({
+                    'id': match.id,
+                    'filename': match.metadata.get('filename', 'Documento'),
+                    'chunk_order': hydrated.get('chunk_order'),
+                    'content': content,
+                    'score': match.score,
+                    'fusion_score': getattr(match, 'fusion_score', None),
+                    'expanded': True
+                })
+                selection['expanded_selected'] += 1
+
+    return candidates, selection
+
+def build_context(candidates: list, token_budget: int) -> tuple:
+    """
+    Empacota os chunks selecionados no orçamento de tokens (sem duplicatas, vizinhos unidos,
+    por ordem de relevância) e monta as fontes apenas com os chunks que entraram no contexto.
+
+    Returns:
+        tuple: (context_parts, sources, usage) onde `usage` traz a contagem de tokens do contexto.
+    """
+    packed = pack_context(candidates, token_budget)
+    included = set(packed['included_ids'])
+    sources = []
+    for candidate in candidates:
+        if candidate['id'] not in included:
+            continue
+        content = candidate['content']
+        # Trecho do conteúdo para exibição como fonte.
+        if candidate['expanded']:
+            excerpt = content[:150] + "..."
+        else:
+            excerpt = content[:200] + "..." if len(content) > 200 else content
+        source = {'filename': candidate['filename'], 'score': candidate['score'], 'conteudo': excerpt}
+        if candidate.get('fusion_score') is not None:
+            source['fusion_score'] = candidate['fusion_score']
+        sources.append(source)
+    return packed['context_parts'], sources, packed['usage']
 
-        #  Busca com filtro opcional por documento
+async def retrieve_context(question: str, selected_document: str = None, question_embedding: list[float] = None) -> dict:
+    """
+    Etapas de recuperação do pipeline RAG: embedding da pergunta e busca de chunks relevantes.
+
+    Args:
+        question (str): Pergunta do usuário.
+        selected_document (str): Documento para filtrar a busca (None ou "all" para todos).
+        question_embedding (list[float]): Embedding já calculado da pergunta (opcional).
+
+    Returns:
+        dict: `context_parts`, `sources`, `context` concatenado, `total_results` da busca principal,
+              `selection` (debug da seleção primária/expandida) e `token_usage` (tokens do prompt).
+
+    Raises:
+        HTTPException: Se o índice Pinecone estiver indisponível e a busca BM25 não encontrar nada.
+    """
+    document_filter = selected_document and selected_document != "all"
+
+    # A busca BM25 não depende do embedding: começa já, em paralelo com as etapas 1 e 2.
+    keyword_task = None
+    if HYBRID_SEARCH_ENABLED:
+        keyword_task = asyncio.ensure_future(run_in_stage_executor(
+            vector_query_executor, search_keywords, question, selected_document if document_filter else None
+        ))
+
+    try:
+        # Etapa 1: Geração do embedding da pergunta do usuário (se ainda não calculado).
+        if question_embedding is None:
+            question_embedding = await embed_question(question)
+
+        # Etapa 2: Busca de contexto relevante no Pinecone.
+        # Uma única consulta vetorial por pergunta: sem filtro por documento, já busca o
+        # conjunto expandido (top 25) para que a seleção primária/expandida seja feita localmente.
         query_params = {
             "vector": question_embedding,
-            "top_k": 15,
+            "top_k": PRIMARY_TOP_K if document_filter else EXPANDED_TOP_K,
             "include_metadata": True
         }
-        
+
         #  Aplica filtro se um documento específico foi selecionado
-        if selected_document and selected_document != "all":
+        if document_filter:
             query_params["filter"] = {"filename": selected_document}
             logger.info(f"Busca filtrada para documento: {selected_document}")
         else:
             logger.info("Busca em todos os documentos")
 
-        query_results = pinecone_index_instance.query(**query_params)
+        # O índice indisponível (get_pinecone_index levanta RuntimeError enquanto o banco está fora
+        # do ar ou na janela de retentativa) e falhas da consulta levam ao fallback BM25 abaixo.
+        dense_matches, vector_error = None, None
+        try:
+            pinecone_index_instance = get_pinecone_index()
+            query_results = await run_in_stage_executor(vector_query_executor, pinecone_index_instance.query, **query_params)
+            dense_matches = query_results.matches
+        except Exception as e:
+            vector_error = e
 
-        context_parts = [] # Lista para armazenar o conteúdo dos chunks recuperados.
-        sources = []       # Lista para armazenar informações das fontes para o frontend.
+        keyword_results = await keyword_task if keyword_task is not None else []
+    except BaseException:
+        if keyword_task is not None and not keyword_task.done():
+            keyword_task.cancel()
+        raise
 
-        # Processa cada resultado (match) retornado pelo Pinecone.
-        for match in query_results.matches:
-            # Extrai o conteúdo e os metadados do chunk. Um valor padrão é usado se a chave não existir.
-            content = match.metadata.get('content', 'Conteúdo do chunk não encontrado.')
-            filename = match.metadata.get('filename', 'N/A')
-            score = match.score # A pontuação de similaridade do Pinecone.
-            
-            # Verifica se o conteúdo não está vazio antes de adicionar
-            if content.strip():
-                # Adiciona identificação do documento para melhor contexto
-                context_parts.append(f"[DOCUMENTO: {filename}]\n{content}")
-                sources.append({
-                    'filename': filename,
-                    'score': score,
-                    'conteudo': content[:200] + "..." if len(content) > 200 else content # Trecho do conteúdo para exibição como fonte.
-                })
+    if dense_matches is None:
+        # Banco vetorial fora do ar: a busca BM25 local responde sozinha (fallback offline)
+        if not keyword_results:
+            detail = f" ({vector_error})" if vector_error else ""
+            raise HTTPException(status_code=500, detail=f"O índice Pinecone não foi inicializado ou está inacessível{detail}. O serviço de busca de documentos está inoperante.")
+        logger.warning(f"Banco vetorial indisponível; usando apenas a busca BM25{f' ({vector_error})' if vector_error else ''}")
+        matches = reciprocal_rank_fusion([], keyword_results)
+        fusion = {"method": "bm25_fallback", "dense": 0, "keyword": len(keyword_results), "overlap": 0}
+    elif keyword_task is not None:
+        matches = reciprocal_rank_fusion(dense_matches, keyword_results)
+        overlap = len({m.id for m in dense_matches} & {chunk_id for chunk_id, _, _ in keyword_results})
+        fusion = {"method": "rrf", "dense": len(dense_matches), "keyword": len(keyword_results), "overlap": overlap}
+    else:
+        matches = dense_matches
+        fusion = {"method": "dense", "dense": len(dense_matches), "keyword": 0, "overlap": 0}
 
-        # Sistema de fallback: se temos poucos resultados, busca mais agressivamente
-        if len(context_parts) < 5 and (not selected_document or selected_document == "all"):
-            logger.info("Poucos chunks encontrados, executando busca expandida")
-            
-            expanded_query_params = {
-                "vector": question_embedding,
-                "top_k": 25,
-                "include_metadata": True
-            }
-            
-            # Aplica o mesmo filtro se necessário
-            if selected_document and selected_document != "all":
-                expanded_query_params["filter"] = {"filename": selected_document}
-            
-            expanded_query = pinecone_index_instance.query(**expanded_query_params)
-            
-            # Adiciona resultados adicionais sem threshold muito restritivo
-            for match in expanded_query.matches[len(context_parts):]:
-                content = match.metadata.get('content', '')
-                filename = match.metadata.get('filename', 'Documento')
-                score = match.score
-                
-                if content.strip() and len(context_parts) < 12:  # Limita a 12 chunks totais
-                    context_parts.append(f"[FONTE: {filename} - Score: {score:.2f}]\n{content}")
-                    sources.append({
-                        'filename': filename,
-                        'score': score,
-                        'conteudo': content[:150] + "..."
-                    })
-        
-        # Concatena todos os conteúdos dos chunks relevantes para formar o contexto completo para o LLM.
-        context = "\n\n".join(context_parts) 
-
-        # Log detalhado para monitoramento e debug da qualidade da busca
-        logger.info(f"Pergunta recebida: {question}")
-        logger.info(f"Documento selecionado: {selected_document or 'Todos'}")  
-        logger.info(f"Chunks encontrados: {len(context_parts)}")
-        logger.info(f"Tamanho do contexto gerado: {len(context)} caracteres")
-        if query_results.matches:
-            scores = [f'{m.score:.3f}' for m in query_results.matches[:3]]
-            logger.info(f"Principais scores de similaridade: {scores}")
-
-        # Etapa 3: Construção do prompt muito flexível e otimizado.
-        # O prompt é formatado para instruir o LLM a ser maximamente útil
-        # priorizando qualquer informação que possa ajudar o usuário.
-        document_context = f" do documento '{selected_document}'" if selected_document and selected_document != "all" else ""
-        
-        prompt = f"""Você é um assistente especializado em documentos da UFMA (Universidade Federal do Maranhão).
+    # Seleção e hidratação (leitura local em SQLite) também rodam fora do event loop.
+    candidates, selection = await run_in_stage_executor(
+        vector_query_executor, select_matches, matches, allow_expansion=not document_filter
+    )
+    selection['fusion'] = fusion
+
+    # Rerank opcional: mantém os melhores chunks segundo o cross-encoder (ou a ordem original,
+    # se o orçamento de tempo estourar). O orçamento conta desde a submissão, incluindo a espera no pool.
+    candidates, selection['rerank'] = await run_in_stage_executor(
+        rerank_executor, reranker.rerank, question, candidates, submitted_at=time.perf_counter()
+    )
+
+    # Etapa 2b: Empacotamento do contexto no orçamento de tokens que sobra na janela do modelo
+    # depois das instruções, da pergunta e da reserva para a resposta.
+    prompt_tokens = token_counter.count(build_prompt(question, "", selected_document))
+    max_output_tokens = LLM_GENERATION_PARAMS["max_tokens"]
+    token_budget = max(0, min(CONTEXT_TOKEN_BUDGET, CONTEXT_WINDOW_TOKENS - max_output_tokens - prompt_tokens))
+    context_parts, sources, token_usage = await run_in_stage_executor(
+        vector_query_executor, build_context, candidates, token_budget
+    )
+    token_usage.update({
+        'prompt_tokens': prompt_tokens + token_usage['context_tokens'],
+        'max_output_tokens': max_output_tokens,
+        'context_window': CONTEXT_WINDOW_TOKENS
+    })
+    
+    # Concatena todos os conteúdos dos chunks relevantes para formar o contexto completo para o LLM.
+    context = "\n\n".join(context_parts) 
+
+    # Log detalhado para monitoramento e debug da qualidade da busca
+    logger.info(f"Pergunta recebida: {question}")
+    logger.info(f"Documento selecionado: {selected_document or 'Todos'}")  
+    logger.info(f"Chunks encontrados: {len(context_parts)}")
+    logger.info(f"Tamanho do contexto gerado: {len(context)} caracteres ({token_usage['context_tokens']} tokens de {token_budget})")
+    if dense_matches:
+        scores = [f'{m.score:.3f}' for m in dense_matches[:3]]
+        logger.info(f"Principais scores de similaridade: {scores}")
+
+    return {
+        'context_parts': context_parts,
+        'sources': sources,
+        'context': context,
+        'total_results': selection['primary_candidates'],
+        'selection': selection,
+        'token_usage': token_usage,
+        'question_embedding': question_embedding
+    }
+
+def build_prompt(question: str, context: str, selected_document: str = None) -> str:
+    """
+    Etapa 3: Construção do prompt muito flexível e otimizado.
+    O prompt é formatado para instruir o LLM a ser maximamente útil
+    priorizando qualquer informação que possa ajudar o usuário.
+    """
+    document_context = f" do documento '{selected_document}'" if selected_document and selected_document != "all" else ""
+    
+    return f"""Você é um assistente especializado em documentos da UFMA (Universidade Federal do Maranhão).
 
 Pergunta do usuário: {question}
 {f"Contexto: Respondendo especificamente com base{document_context}" if document_context else ""}
@@ -182,55 +484,256 @@ Instruções:
 {f"- Foque sua resposta nas informações{document_context}" if document_context else ""}
 
 Resposta detalhada:"""
+
+def save_to_history(user_email: str, question: str, answer: str, sources: list[dict]) -> None:
+    """
+    Etapa 5: Salva a conversa no histórico do usuário sem falhar a resposta em caso de erro.
+    Pode reservar um bloco de ids no banco: as rotas a chamam fora do event loop (run_in_threadpool).
+    """
+    try:
+        # Importa a função para salvar histórico (evita importação circular)
+        from routes.history import add_chat_entry
         
-        # Etapa 4: Geração da resposta utilizando o modelo de linguagem da Groq.
+        add_chat_entry(
+            user_email=user_email,
+            question=question,
+            answer=answer,
+            sources=sources
+        )
+        logger.info(f"Conversa salva no histórico para usuário {user_email}")
+    except Exception as history_error:
+        # Não falha a resposta se houver erro ao salvar histórico
+        logger.warning(f"Erro ao salvar no histórico: {history_error}")
+
+def build_debug_info(retrieval: dict, selected_document: str = None) -> dict:
+    """Informações de debug para monitoramento da qualidade da busca."""
+    return {
+        'chunks_found': len(retrieval['sources']),
+        'context_length': len(retrieval['context']),
+        'similarity_scores': [f"{s['score']:.3f}" for s in retrieval['sources'][:5]],
+        'total_results': retrieval['total_results'],
+        'document_filter': selected_document or 'all',
+        'retrieval': retrieval['selection'],
+        'token_usage': retrieval['token_usage'],
+        'cache': None
+    }
+
+def store_in_answer_cache(question: str, selected_document: str, retrieval: dict, answer: str, generation: int) -> None:
+    """Armazena uma resposta bem-sucedida no cache de respostas."""
+    if not ANSWER_CACHE_ENABLED:
+        return
+    context = retrieval['context']
+    answer_cache.put(
+        question,
+        selected_document,
+        retrieval['question_embedding'],
+        {
+            'answer': answer,
+            'sources': retrieval['sources'],
+            'context': context[:800] + "..." if len(context) > 800 else context,
+            'debug_info': build_debug_info(retrieval, selected_document)
+        },
+        generation=generation
+    )
+
+@router.post("")
+async def send_message(
+    request: ChatRequest = Body(...),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Endpoint principal para o processamento de mensagens de chat.
+    Implementa o fluxo de trabalho de Retrieval-Augmented Generation (RAG):
+    1.  A pergunta do usuário é convertida em um embedding vetorial.
+    2.  Este embedding é usado para buscar documentos relevantes em um banco de dados vetorial (Pinecone).
+    3.  Os trechos de documentos recuperados são combinados com a pergunta original
+        para formar um prompt contextualizado para o LLM.
+    4.  O modelo de linguagem da Groq processa este prompt e gera uma resposta coerente e informada.
+    5.  A resposta do LLM, juntamente com as fontes consultadas, é retornada ao cliente.
+    6.  A conversa é automaticamente salva no histórico do usuário autenticado.
+
+    Args:
+        request (ChatRequest): Objeto contendo a pergunta do usuário e documento selecionado opcional.
+        current_user (dict): Dados do usuário autenticado.
+
+    Returns:
+        dict: Um dicionário contendo a resposta gerada (`answer`),
+              as fontes dos documentos utilizados (`sources`), um trecho do contexto completo (`context`),
+              e informações de debug (`debug_info`).
+
+    Raises:
+        HTTPException: Erros HTTP são levantados para cenários como perguntas ausentes,
+                       ou falhas na inicialização/acesso a serviços externos (Pinecone, Groq).
+    """
+    try:
+        question = request.question
+        selected_document = request.selected_document  
+        
+        if not question:
+            raise HTTPException(status_code=400, detail='A pergunta do usuário não foi fornecida.')
+
+        # Etapa 0: Cache de respostas. Um acerto dispensa busca vetorial e LLM.
+        cache_generation = answer_cache.generation
+        cached, question_embedding = await lookup_answer_cache(question, selected_document)
+        if cached is not None:
+            logger.info(f"Resposta servida do cache ({cached['cache']['type']}): {question}")
+            await run_in_threadpool(save_to_history, current_user["email"], question, cached['answer'], cached['sources'])
+            return {
+                'answer': cached['answer'],
+                'sources': cached['sources'],
+                'context': cached['context'],
+                'selected_document': selected_document,
+                'debug_info': {**cached['debug_info'], 'cache': cached['cache']}
+            }
+
+        # Etapas 1 e 2: embedding da pergunta e busca de contexto.
+        retrieval = await retrieve_context(question, selected_document, question_embedding)
+        sources = retrieval['sources']
+        context = retrieval['context']
+
+        # Etapa 3: Construção do prompt.
+        prompt = build_prompt(question, context, selected_document)
+        
+        # Etapa 4: Geração da resposta pelo LLM.
+        # A chamada é assíncrona; o gateway aplica timeout, retentativas e o limite de concorrência do modelo.
         try:
-            response = client.chat.completions.create(
-                model="llama3-8b-8192", # Especifica o modelo LLM a ser utilizado.
-                messages=[{"role": "user", "content": prompt}], # O prompt é passado como uma mensagem do usuário.
-                max_tokens=2000, # Define o limite máximo de tokens para respostas mais completas.
-                temperature=0.05, # Temperatura muito baixa para máxima precisão e consistência.
-                top_p=0.95 # Controle adicional da diversidade de resposta
+            completion = await llm_gateway.acomplete(
+                [{"role": "user", "content": prompt}], # O prompt é passado como uma mensagem do usuário.
+                **LLM_GENERATION_PARAMS
             )
             
-            answer = response.choices[0].message.content # Extrai o texto da resposta do LLM.
+            answer = completion.text # Extrai o texto da resposta do LLM.
             logger.info(f"Resposta gerada: {answer[:100]}...")
+            # Tokens efetivamente cobrados pelo provedor, ao lado da estimativa local
+            retrieval['token_usage']['llm'] = {**completion.usage, 'model': completion.model, 'attempts': completion.attempts}
+
+            # Apenas respostas bem-sucedidas entram no cache
+            store_in_answer_cache(question, selected_document, retrieval, answer, cache_generation)
             
         except Exception as e:
-            logger.error(f"Erro ao processar a requisição com o modelo Groq: {e}", exc_info=True)
+            logger.error(f"Erro ao processar a requisição com o modelo de linguagem: {e}", exc_info=True)
             answer = f"Ocorreu um erro ao processar a resposta do modelo de linguagem: {str(e)}"
         
         # Etapa 5: Salvar no histórico do usuário
-        try:
-            # Importa a função para salvar histórico (evita importação circular)
-            from routes.history import add_chat_entry
-            
-            user_email = current_user["email"]
-            add_chat_entry(
-                user_email=user_email,
-                question=question,
-                answer=answer,
-                sources=sources
-            )
-            logger.info(f"Conversa salva no histórico para usuário {user_email}")
-        except Exception as history_error:
-            # Não falha a resposta se houver erro ao salvar histórico
-            logger.warning(f"Erro ao salvar no histórico: {history_error}")
+        await run_in_threadpool(save_to_history, current_user["email"], question, answer, sources)
 
         return {
             'answer': answer,
             'sources': sources,
             'context': context[:800] + "..." if len(context) > 800 else context, # Trecho maior do contexto para visualização.
             'selected_document': selected_document,  #  Retorna documento selecionado
-            'debug_info': {  # Informações de debug para monitoramento da qualidade
-                'chunks_found': len(context_parts),
-                'context_length': len(context),
-                'similarity_scores': [f"{s['score']:.3f}" for s in sources[:5]],
-                'total_results': len(query_results.matches),
-                'document_filter': selected_document or 'all'  
-            }
+            'debug_info': build_debug_info(retrieval, selected_document)
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro interno ao processar a mensagem do chat: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {str(e)}")
+
+def format_sse_event(event: str, data: dict) -> str:
+    """Formata um evento no padrão Server-Sent Events (SSE)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post("/stream")
+async def send_message_stream(
+    request: ChatRequest = Body(...),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    Variante em streaming do chat, usando Server-Sent Events (SSE).
+    Prioriza o tempo até o primeiro byte: as fontes são enviadas assim que a busca
+    vetorial retorna, e a resposta do LLM é repassada token a token.
+
+    Eventos emitidos (nesta ordem):
+    - `sources`: fontes consultadas, documento selecionado e informações de debug.
+    - `token`: trechos incrementais da resposta (`{"content": "..."}`).
+    - `done`: fim da resposta; a conversa é salva no histórico antes deste evento.
+    - `error`: falha em qualquer etapa; encerra o stream.
+
+    Args:
+        request (ChatRequest): Objeto contendo a pergunta do usuário e documento selecionado opcional.
+        current_user (dict): Dados do usuário autenticado.
+
+    Raises:
+        HTTPException: Se a pergunta não for fornecida.
+    """
+    question = request.question
+    selected_document = request.selected_document
+
+    if not question:
+        raise HTTPException(status_code=400, detail='A pergunta do usuário não foi fornecida.')
+
+    async def event_stream():
+        # Etapas 0, 1 e 2: cache de respostas e recuperação de contexto; as fontes são enviadas imediatamente.
+        try:
+            cache_generation = answer_cache.generation
+            cached, question_embedding = await lookup_answer_cache(question, selected_document)
+            if cached is not None:
+                # Acerto no cache: a resposta completa é enviada em um único evento `token`.
+                yield format_sse_event("sources", {
+                    "sources": cached['sources'],
+                    "selected_document": selected_document,
+                    "debug_info": {**cached['debug_info'], 'cache': cached['cache']}
+                })
+                yield format_sse_event("token", {"content": cached['answer']})
+                await run_in_threadpool(save_to_history, current_user["email"], question, cached['answer'], cached['sources'])
+                yield format_sse_event("done", {"answer_length": len(cached['answer'])})
+                return
+
+            retrieval = await retrieve_context(question, selected_document, question_embedding)
+        except Exception as e:
+            logger.error(f"Erro na recuperação de contexto (stream): {e}", exc_info=True)
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield format_sse_event("error", {"detail": f"Erro interno do servidor: {detail}"})
+            return
+
+        sources = retrieval['sources']
+        yield format_sse_event("sources", {
+            "sources": sources,
+            "selected_document": selected_document,
+            "debug_info": build_debug_info(retrieval, selected_document)
+        })
+
+        # Etapas 3 e 4: prompt e geração em streaming.
+        prompt = build_prompt(question, retrieval['context'], selected_document)
+        answer_parts = []
+        try:
+            async for token in llm_gateway.astream([{"role": "user", "content": prompt}], **LLM_GENERATION_PARAMS):
+                answer_parts.append(token)
+                yield format_sse_event("token", {"content": token})
+        except Exception as e:
+            logger.error(f"Erro no streaming da resposta do modelo de linguagem: {e}", exc_info=True)
+            yield format_sse_event("error", {"detail": f"Ocorreu um erro ao processar a resposta do modelo de linguagem: {str(e)}"})
+            return
+
+        answer = "".join(answer_parts)
+        logger.info(f"Resposta gerada (stream): {answer[:100]}...")
+
+        # Etapa 5: salva no histórico (e no cache de respostas) somente após o fim do stream.
+        await run_in_threadpool(save_to_history, current_user["email"], question, answer, sources)
+        store_in_answer_cache(question, selected_document, retrieval, answer, cache_generation)
+        yield format_sse_event("done", {"answer_length": len(answer)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Desativa o buffering em proxies como o Nginx
+        }
+    )
+
+@router.get("/stats")
+async def get_chat_stats(current_user: dict = Depends(get_current_active_user)):
+    """Estatísticas do pipeline de chat: caches (acertos, erros, ocupação), índice BM25 e rerank (latência e scores). Apenas para admins."""
+    if not current_user["is_admin"]:
+        raise HTTPException(status_code=403, detail="Acesso negado: apenas administradores")
+    return {
+        "answer_cache": {"enabled": ANSWER_CACHE_ENABLED, **answer_cache.stats()},
+        "embedding_cache": get_embedding_cache_stats(),
+        "embedding_batcher": get_embedding_batcher_stats(),
+        "bm25_index": {"enabled": HYBRID_SEARCH_ENABLED, **bm25_index.stats()},
+        "reranker": reranker.stats(),
+        "llm": llm_gateway.stats()
+    }
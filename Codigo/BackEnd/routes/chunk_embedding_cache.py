@@ -0,0 +1,181 @@
+# Cache persistente de embeddings de chunks usado na ingestão.
+# Reindexações e novos uploads repetem muito texto (cabeçalhos institucionais, artigos copiados
+# entre resoluções, versões revisadas do mesmo documento), e cada trecho era codificado de novo.
+# Os embeddings ficam em disco por modelo: um arquivo float32 bruto, só com acréscimos, lido via
+# np.memmap, e um índice com o hash do texto de cada linha. A ingestão codifica apenas os ausentes.
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import fcntl  # Trava entre processos (workers do gunicorn) ao acrescentar linhas
+except ImportError:
+    fcntl = None
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.txt"
+META_FILE = "meta.json"
+
+def text_key(text: str) -> str:
+    """Chave do texto no cache: hash SHA-256 do conteúdo exato enviado ao modelo."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+class ModelEmbeddingStore:
+    """Embeddings persistidos de um único modelo (linhas de dimensão fixa, apenas acréscimos)."""
+
+    def __init__(self, directory: str, model: str):
+        self.directory = directory
+        self.model = model
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}   # hash do texto -> linha
+        self._keys_offset = 0             # bytes de keys.txt já lidos
+        self.dimension: Optional[int] = None
+        self._matrix: Optional[np.memmap] = None
+
+        self._refresh()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _refresh(self) -> None:
+        """Lê chaves acrescentadas (inclusive por outros processos) e remapeia a matriz se cresceu."""
+        keys_path = self._path(KEYS_FILE)
+        if self.dimension is None and os.path.exists(self._path(META_FILE)):
+            with open(self._path(META_FILE), "r", encoding="utf-8") as f:
+                self.dimension = json.load(f)["dimension"]
+        if self.dimension is None or not os.path.exists(keys_path):
+            return
+        with open(keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        # Só consome linhas completas; uma escrita em andamento é lida na próxima atualização
+        complete = data[:data.rfind(b"\n") + 1]
+        self._keys_offset += len(complete)
+        for key in complete.decode("ascii").splitlines():
+            self._rows.setdefault(key, len(self._rows))
+
+        # O arquivo de vetores é gravado antes das chaves, então sempre cobre as linhas conhecidas
+        if self._rows and (self._matrix is None or self._matrix.shape[0] < len(self._rows)):
+            self._matrix = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r",
+                                     shape=(len(self._rows), self.dimension))
+
+    def get_many(self, texts: List[str]) -> Dict[int, np.ndarray]:
+        """Retorna {posição do texto: embedding} para os textos presentes no cache."""
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh()
+            found = {i: self._rows[key] for i, key in enumerate(keys) if key in self._rows}
+            if not found:
+                return {}
+            vectors = np.asarray(self._matrix[list(found.values())])
+        return {i: vectors[j] for j, i in enumerate(found)}
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> int:
+        """Acrescenta embeddings ainda não armazenados. Retorna o número de linhas gravadas."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(texts):
+            return 0
+        with self._lock:
+            self._refresh()
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+                with open(self._path(META_FILE), "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model, "dimension": self.dimension}, f)
+            if vectors.shape[1] != self.dimension:
+                raise ValueError(f"Dimensão {vectors.shape[1]} difere da dimensão do cache ({self.dimension})")
+
+            with open(self._path(KEYS_FILE), "ab") as keys_file:
+                if fcntl:
+                    fcntl.flock(keys_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    pending, new_keys = [], {}
+                    for text, vector in zip(texts, vectors):
+                        key = text_key(text)
+                        if key not in self._rows and key not in new_keys:
+                            new_keys[key] = None
+                            pending.append(vector)
+                    if not new_keys:
+                        return 0
+
+                    vectors_path = self._path(VECTORS_FILE)
+                    with open(vectors_path, "r+b" if os.path.exists(vectors_path) else "wb") as vectors_file:
+                        # Descarta linhas de uma escrita interrompida antes da gravação das chaves
+                        vectors_file.truncate(len(self._rows) * self.dimension * 4)
+                        vectors_file.seek(0, os.SEEK_END)
+                        vectors_file.write(np.stack(pending).tobytes())
+                        vectors_file.flush()
+                        os.fsync(vectors_file.fileno())
+                    keys_file.write("".join(f"{key}\n" for key in new_keys).encode("ascii"))
+                    keys_file.flush()
+                    self._refresh()
+                    return len(new_keys)
+                finally:
+                    if fcntl:
+                        fcntl.flock(keys_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+class ChunkEmbeddingCache:
+    """Cache em disco de embeddings de chunks, com um armazenamento por modelo."""
+
+    def __init__(self, directory: str, enabled: bool = True):
+        self.directory = directory
+        self.enabled = enabled
+        self._stores: Dict[str, ModelEmbeddingStore] = {}
+        self._lock = threading.Lock()
+
+    def _store(self, model: str) -> ModelEmbeddingStore:
+        with self._lock:
+            store = self._stores.get(model)
+            if store is None:
+                safe_name = "".join(c if c.isalnum() or c in "-._" else "__" for c in model)
+                store = ModelEmbeddingStore(os.path.join(self.directory, safe_name), model)
+                self._stores[model] = store
+            return store
+
+    def lookup(self, model: str, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        Busca os embeddings dos textos.
+
+        Returns:
+            tuple: ({posição: embedding} dos acertos, posições ausentes a codificar).
+        """
+        if not self.enabled:
+            return {}, list(range(len(texts)))
+        found = self._store(model).get_many(texts)
+        return found, [i for i in range(len(texts)) if i not in found]
+
+    def store(self, model: str, texts: List[str], vectors) -> int:
+        if not self.enabled:
+            return 0
+        return self._store(model).put_many(texts, vectors)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stores = dict(self._stores)
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "models": {model: {"entries": len(store), "dimension": store.dimension} for model, store in stores.items()}
+        }
+
+# Instância global usada pela ingestão
+chunk_embedding_cache = ChunkEmbeddingCache(
+    os.getenv("CHUNK_EMBEDDING_CACHE_DIR", "embedding_cache"),
+    enabled=os.getenv("CHUNK_EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+)
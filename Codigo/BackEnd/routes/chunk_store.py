@@ -0,0 +1,160 @@
+# Armazenamento local do texto dos chunks, fora dos metadados do índice vetorial.
+# Antes, cada vetor carregava o conteúdo completo do chunk (~2500 caracteres) e o resumo inteiro
+# do documento, o que inchava toda resposta de consulta e repetia o resumo centenas de vezes.
+# Agora o índice vetorial guarda apenas ids e campos pequenos de filtro; o texto fica aqui
+# (SQLite, chave = id do chunk) e o chat hidrata somente os chunks selecionados, em lote.
+
+import os
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Limite conservador de parâmetros por consulta SQLite (versões antigas aceitam no máximo 999)
+MAX_SQL_VARIABLES = 900
+
+class ChunkStore:
+    """Repositório SQLite de chunks (texto por id) e resumos de documentos."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()  # Uma conexão por thread
+        self._init_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")      # Leitores não bloqueiam o escritor
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    chunk_order INTEGER NOT NULL,
+                    content TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_filename ON chunks (filename, chunk_order)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    filename TEXT PRIMARY KEY,
+                    summary TEXT,
+                    indexed_at TEXT
+                )
+            """)
+
+    # ---------- Escrita ----------
+
+    def put_chunks(self, filename: str, chunks: Iterable[dict]) -> int:
+        """
+        Insere ou substitui chunks de um documento em uma única transação.
+
+        Args:
+            filename (str): Documento ao qual os chunks pertencem.
+            chunks: Dicionários com `id`, `chunk_order` e `content`.
+
+        Returns:
+            int: Número de chunks gravados.
+        """
+        rows = [(c["id"], filename, c["chunk_order"], c["content"]) for c in chunks]
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, filename, chunk_order, content) VALUES (?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def put_document(self, filename: str, summary: str) -> None:
+        """Grava o resumo do documento uma única vez (em vez de repeti-lo em cada vetor)."""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (filename, summary, indexed_at) VALUES (?, ?, ?)",
+                (filename, summary, datetime.now().isoformat())
+            )
+
+    def delete_chunks(self, ids: List[str]) -> int:
+        """Remove chunks específicos (ex.: trechos que deixaram de existir em uma nova versão do documento)."""
+        conn = self._connection()
+        removed = 0
+        with conn:
+            for i in range(0, len(ids), MAX_SQL_VARIABLES):
+                batch = ids[i:i + MAX_SQL_VARIABLES]
+                placeholders = ",".join("?" * len(batch))
+                removed += conn.execute(f"DELETE FROM chunks WHERE id IN ({placeholders})", batch).rowcount
+        return removed
+
+    def delete_document(self, filename: str) -> List[str]:
+        """Remove os chunks e o resumo de um documento. Retorna os ids dos chunks removidos."""
+        conn = self._connection()
+        with conn:
+            ids = [row["id"] for row in conn.execute("SELECT id FROM chunks WHERE filename = ?", (filename,))]
+            conn.execute("DELETE FROM chunks WHERE filename = ?", (filename,))
+            conn.execute("DELETE FROM documents WHERE filename = ?", (filename,))
+        return ids
+
+    # ---------- Leitura ----------
+
+    def get_chunks(self, ids: List[str]) -> Dict[str, dict]:
+        """
+        Hidrata vários chunks de uma vez.
+
+        Returns:
+            dict: id -> {"content", "filename", "chunk_order"} (ids inexistentes são omitidos).
+        """
+        result = {}
+        conn = self._connection()
+        unique_ids = list(dict.fromkeys(ids))
+        for i in range(0, len(unique_ids), MAX_SQL_VARIABLES):
+            batch = unique_ids[i:i + MAX_SQL_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            for row in conn.execute(
+                f"SELECT id, filename, chunk_order, content FROM chunks WHERE id IN ({placeholders})",
+                batch
+            ):
+                result[row["id"]] = {
+                    "content": row["content"],
+                    "filename": row["filename"],
+                    "chunk_order": row["chunk_order"]
+                }
+        return result
+
+    def get_document_summary(self, filename: str) -> Optional[str]:
+        row = self._connection().execute("SELECT summary FROM documents WHERE filename = ?", (filename,)).fetchone()
+        return row["summary"] if row else None
+
+    def get_chunk_ids(self, filename: str) -> List[str]:
+        """Ids dos chunks de um documento, na ordem do texto."""
+        return [row["id"] for row in self._connection().execute(
+            "SELECT id FROM chunks WHERE filename = ? ORDER BY chunk_order", (filename,)
+        )]
+
+    def get_filenames(self) -> List[str]:
+        """Documentos com chunks ou resumo armazenados."""
+        return [row["filename"] for row in self._connection().execute(
+            "SELECT filename FROM chunks UNION SELECT filename FROM documents"
+        )]
+
+    def stats(self) -> dict:
+        conn = self._connection()
+        chunks = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        documents = conn.execute("SELECT COUNT(DISTINCT filename) FROM chunks").fetchone()[0]
+        return {"chunks": chunks, "documents": documents, "path": self.path}
+
+# Instância global compartilhada pela ingestão e pelo chat
+chunk_store = ChunkStore(os.getenv("CHUNK_STORE_PATH", "chunk_store.db"))
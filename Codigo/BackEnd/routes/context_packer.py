@@ -0,0 +1,213 @@
+# Montagem do contexto do chat dentro de um orçamento de tokens.
+# Os chunks recuperados eram concatenados sem contagem de tokens: com chunks de ~2500 caracteres,
+# 12 deles podem passar da janela do modelo (8192 tokens, dos quais 2000 reservados à resposta),
+# e o excesso só aumenta o custo e a latência de prefill ou é truncado sem aviso.
+# O empacotador:
+# 1. Remove chunks de texto idêntico (vetores antigos e novos do mesmo trecho).
+# 2. Junta chunks vizinhos do mesmo documento (chunk_order consecutivo) em um só trecho, sem repetir
+#    a sobreposição de ~600 caracteres que o chunking deixa entre eles.
+# 3. Preenche o orçamento de tokens pelos trechos de maior score; um trecho que não cabe inteiro é
+#    cortado (se sobrar espaço útil) e os seguintes ainda podem entrar se forem menores.
+
+import os
+import math
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Tokenizador usado na contagem: "tiktoken:<encoding>" (requer tiktoken), "hf:<modelo>" (tokenizador
+# do Hugging Face via transformers) ou "chars" (estimativa pelo número de caracteres).
+# O cl100k_base é próximo do tokenizador do Llama 3 (cujo vocabulário parte dele) e conta um pouco
+# a mais em português, o que mantém a margem do orçamento.
+CONTEXT_TOKENIZER = os.getenv("CHAT_TOKENIZER", "tiktoken:cl100k_base")
+# Caracteres por token na estimativa (conservador para português)
+CHARS_PER_TOKEN = 3.5
+
+# Sobreposição máxima procurada entre chunks vizinhos e tamanho mínimo para considerá-la
+MAX_OVERLAP_CHARS = 1200
+MIN_OVERLAP_CHARS = 20
+# Um trecho só é cortado para caber se ainda sobrarem pelo menos estes tokens no orçamento
+MIN_TRUNCATED_TOKENS = 100
+# Marca acrescentada ao fim de um trecho cortado
+TRUNCATION_MARK = " [...]"
+
+class TokenCounter:
+    """Contagem de tokens com um tokenizador local, carregado sob demanda, ou estimativa por caracteres."""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        self._encode: Optional[Callable[[str], list]] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.name = "chars"
+
+    def _load(self) -> None:
+        kind, _, name = self.spec.partition(":")
+        try:
+            if kind == "tiktoken":
+                import tiktoken
+                self._encode = tiktoken.get_encoding(name).encode
+            elif kind == "hf":
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(name)
+                self._encode = lambda text: tokenizer.encode(text, add_special_tokens=False)
+            elif kind != "chars":
+                raise ValueError(f"tokenizador desconhecido: {self.spec}")
+            if self._encode is not None:
+                self.name = self.spec
+        except Exception as e:
+            logger.warning(f"Tokenizador '{self.spec}' indisponível ({e}); estimando tokens por caracteres")
+        self._loaded = True
+
+    def count(self, text: str) -> int:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+        if not text:
+            return 0
+        if self._encode is not None:
+            return len(self._encode(text))
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Prefixo do texto com no máximo `max_tokens` tokens (já contando a marca de corte),
+        cortado em fim de frase ou de palavra.
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        limit = max(0, max_tokens - self.count(TRUNCATION_MARK))
+        # Busca binária no número de caracteres (a contagem cresce com o prefixo)
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count(text[:middle]) <= limit:
+                low = middle
+            else:
+                high = middle - 1
+        prefix = text[:low]
+        cut = max(prefix.rfind(". "), prefix.rfind("\n"))
+        if cut < len(prefix) // 2:
+            cut = prefix.rfind(" ")
+        return (prefix[:cut + 1] if cut > 0 else prefix).rstrip() + TRUNCATION_MARK
+
+# Instância global (o tokenizador é carregado no primeiro uso)
+token_counter = TokenCounter(CONTEXT_TOKENIZER)
+
+def find_overlap(previous: str, following: str) -> int:
+    """Tamanho do maior sufixo de `previous` que é prefixo de `following` (0 se menor que o mínimo)."""
+    tail = previous[-MAX_OVERLAP_CHARS:]
+    probe = following[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    position = tail.find(probe)
+    while position != -1:
+        if following.startswith(tail[position:]):
+            return len(tail) - position
+        position = tail.find(probe, position + 1)
+    return 0
+
+def merge_neighbors(candidates: List[dict]) -> tuple:
+    """
+    Agrupa os candidatos em trechos: chunks do mesmo documento com chunk_order consecutivo
+    viram um só trecho, com a sobreposição entre eles removida. Chunks de texto idêntico
+    a um já visto são descartados.
+
+    Args:
+        candidates: Dicionários com `id`, `filename`, `chunk_order` (ou None), `content` e `score`,
+            em ordem de relevância.
+
+    Returns:
+        tuple: (trechos, estatísticas). Cada trecho tem `ids`, `filename`, `content`, `score`
+            (o maior entre os chunks) e `rank` (posição do seu melhor chunk).
+    """
+    stats = {"duplicates_removed": 0, "merged": 0, "overlap_chars_removed": 0}
+    seen_contents = set()
+    unique = []
+    for rank, candidate in enumerate(candidates):
+        key = candidate["content"].strip()
+        if key in seen_contents:
+            stats["duplicates_removed"] += 1
+            continue
+        seen_contents.add(key)
+        unique.append({**candidate, "rank": rank})
+
+    # Sem chunk_order (vetores antigos sem o campo) o chunk fica sozinho
+    ordered = sorted(
+        (c for c in unique if c.get("chunk_order") is not None),
+        key=lambda c: (c["filename"], c["chunk_order"])
+    )
+    segments = [{"ids": [c["id"]], "filename": c["filename"], "content": c["content"], "score": c["score"],
+                 "rank": c["rank"], "last_order": None} for c in unique if c.get("chunk_order") is None]
+    for candidate in ordered:
+        last = segments[-1] if segments else None
+        if (last is not None and last["last_order"] is not None and last["filename"] == candidate["filename"]
+                and candidate["chunk_order"] == last["last_order"] + 1):
+            overlap = find_overlap(last["content"], candidate["content"])
+            separator = "" if overlap else "\n"
+            last["content"] += separator + candidate["content"][overlap:]
+            last["ids"].append(candidate["id"])
+            last["score"] = max(last["score"], candidate["score"])
+            last["rank"] = min(last["rank"], candidate["rank"])
+            last["last_order"] = candidate["chunk_order"]
+            stats["merged"] += 1
+            stats["overlap_chars_removed"] += overlap
+        else:
+            segments.append({"ids": [candidate["id"]], "filename": candidate["filename"], "content": candidate["content"],
+                             "score": candidate["score"], "rank": candidate["rank"], "last_order": candidate["chunk_order"]})
+    for segment in segments:
+        del segment["last_order"]
+    segments.sort(key=lambda s: s["rank"])
+    return segments, stats
+
+def pack_context(candidates: List[dict], token_budget: int, counter: TokenCounter = token_counter) -> Dict:
+    """
+    Seleciona e formata os trechos do contexto dentro do orçamento de tokens, por ordem de relevância.
+
+    Returns:
+        dict: `context_parts` (textos com o cabeçalho do documento), `included_ids` (chunks que
+            entraram, inteiros ou cortados) e `usage` (tokens e estatísticas para o debug).
+    """
+    segments, stats = merge_neighbors(candidates)
+    context_parts, included_ids = [], []
+    used_tokens = 0
+    separator_tokens = counter.count("\n\n")
+    dropped = truncated = 0
+    for segment in segments:
+        header = f"[DOCUMENTO: {segment['filename']}]\n"
+        cost = separator_tokens if context_parts else 0
+        header_tokens = counter.count(header)
+        content_tokens = counter.count(segment["content"])
+        remaining = token_budget - used_tokens - cost - header_tokens
+        content = segment["content"]
+        if content_tokens > remaining:
+            if remaining < MIN_TRUNCATED_TOKENS:
+                dropped += len(segment["ids"])
+                continue
+            content = counter.truncate(content, remaining)
+            content_tokens = counter.count(content)
+            truncated += 1
+        context_parts.append(header + content)
+        included_ids.extend(segment["ids"])
+        used_tokens += cost + header_tokens + content_tokens
+
+    return {
+        "context_parts": context_parts,
+        "included_ids": included_ids,
+        "usage": {
+            "tokenizer": counter.name,
+            "context_tokens": used_tokens,
+            "context_budget": token_budget,
+            "chunks_in": len(candidates),
+            "segments": len(context_parts),
+            "chunks_dropped": dropped,
+            "segments_truncated": truncated,
+            **stats
+        }
+    }
@@ -1,29 +1,41 @@
 import os
 import logging
-import uuid
+import hashlib
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Tuple
+import numpy as np
 from fastapi import HTTPException
 
 # Imports para processamento de PDF
-from pypdf import PdfReader
+from routes.pdf_extraction import pdf_extractor
 
 # Imports do sistema RAG
-from routes.utils import generate_embedding, get_pinecone_index
+from routes.utils import generate_embedding, get_pinecone_index, flush_vector_index
+from routes.chunk_store import chunk_store
+from routes.index_maintenance import delete_vectors, delete_unmanifested_vectors
+from routes.chunk_embedding_cache import chunk_embedding_cache
+from routes.bm25_index import bm25_index
+from routes.llm_gateway import llm_gateway, LLM_SUMMARY_MODEL
+from routes.model_registry import get_embedding_model, get_embedding_model_key
 
-# LangChain para chunking inteligente
-try:
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
-    LANGCHAIN_AVAILABLE = True
-except ImportError:
-    LANGCHAIN_AVAILABLE = False
-    logging.warning("LangChain não disponível, usando chunking manual")
+logger = logging.getLogger(__name__)
 
-# Import do Groq para gerar resumos
-from groq import Groq
+# LangChain para chunking inteligente.
+# Importado apenas no primeiro chunking: a importação é pesada e atrasava a subida da API.
+_text_splitter_class = None
 
-logger = logging.getLogger(__name__)
+def get_text_splitter_class():
+    """Retorna o RecursiveCharacterTextSplitter do LangChain, ou None se indisponível."""
+    global _text_splitter_class
+    if _text_splitter_class is None:
+        try:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            _text_splitter_class = RecursiveCharacterTextSplitter
+        except ImportError:
+            _text_splitter_class = False
+            logger.warning("LangChain não disponível, usando chunking manual")
+    return _text_splitter_class or None
 
 class HybridDocumentProcessor:
     """Processador HÍBRIDO: LangChain chunking + Sentence Transformers embeddings + Resumo com LLM"""
@@ -34,46 +46,27 @@ class HybridDocumentProcessor:
         self.chunk_overlap = 600    # Overlap para excelente continuidade
         self.batch_size = 32        # Processamento em lotes grandes
         
-        # Cliente Groq para resumos
-        self.groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        
-    def extract_text_from_pdf(self, file_path: str) -> str:
-        """Extração de texto do PDF"""
+    def extract_pdf_pages(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
+        """Extração de texto do PDF em paralelo por faixas de páginas, com estatísticas de vazão"""
         try:
-            reader = PdfReader(file_path)
-            all_text = ""
-            
-            # Processa todas as páginas mas com limite razoável
-            max_pages = min(len(reader.pages), 100)
-            
-            for page_num in range(max_pages):
-                try:
-                    page = reader.pages[page_num]
-                    page_text = page.extract_text()
-                    if page_text and page_text.strip():
-                        # Adiciona separador de página
-                        all_text += f"\n\n--- Página {page_num + 1} ---\n{page_text.strip()}\n"
-                except Exception as e:
-                    logger.warning(f"Erro na página {page_num + 1}: {e}")
-                    continue
+            all_text, stats = pdf_extractor.extract(file_path)
                     
             if not all_text.strip():
                 raise ValueError("Nenhum texto extraído do PDF")
                 
-            logger.info(f"Texto extraído: {len(all_text):,} caracteres de {max_pages} páginas")
-            return all_text
+            return all_text, stats
             
         except Exception as e:
             logger.error(f"Erro ao extrair texto: {e}")
             raise HTTPException(status_code=400, detail=f"Erro ao processar PDF: {str(e)}")
 
+    def extract_text_from_pdf(self, file_path: str) -> str:
+        """Extração de texto do PDF"""
+        return self.extract_pdf_pages(file_path)[0]
+
     def generate_document_summary(self, text: str, filename: str) -> str:
-        """Gera um resumo do documento usando Groq LLM com fallback robusto"""
+        """Gera um resumo do documento usando o LLM (via gateway) com fallback robusto"""
         try:
-            # Verifica se o cliente Groq está disponível
-            if not self.groq_client:
-                return self._generate_fallback_summary(text, filename)
-            
             # Pega primeiros caracteres para o resumo
             text_for_summary = text[:8000] if len(text) > 8000 else text
             
@@ -92,14 +85,15 @@ Crie um resumo de 3-4 parágrafos que inclua:
 
 Mantenha o resumo claro, objetivo e útil para quem precisa consultar este documento."""
 
-            response = self.groq_client.chat.completions.create(
-                model="llama3-8b-8192",
-                messages=[{"role": "user", "content": prompt}],
+            # Chamada síncrona (thread da ingestão), com timeout e retentativas do gateway
+            completion = llm_gateway.complete(
+                [{"role": "user", "content": prompt}],
+                model=LLM_SUMMARY_MODEL,
                 max_tokens=800,
                 temperature=0.3
             )
             
-            summary = response.choices[0].message.content
+            summary = completion.text
             
             # Validação do resumo gerado
             if not summary or len(summary.strip()) < 50:
@@ -110,11 +104,11 @@ Mantenha o resumo claro, objetivo e útil para quem precisa consultar este docum
             return summary
             
         except Exception as e:
-            logger.error(f"Erro ao gerar resumo com Groq: {e}")
+            logger.error(f"Erro ao gerar resumo com o LLM: {e}")
             return self._generate_fallback_summary(text, filename)
     
     def _generate_fallback_summary(self, text: str, filename: str) -> str:
-        """Gera resumo básico quando o Groq falha"""
+        """Gera resumo básico quando o LLM falha"""
         try:
             # Informações básicas do documento
             char_count = len(text)
@@ -166,7 +160,8 @@ Para obter informações específicas sobre este documento, utilize o sistema de
     def create_smart_chunks(self, text: str, filename: str) -> List[Dict[str, Any]]:
         """Chunking inteligente usando LangChain para melhor qualidade de contexto"""
         
-        if LANGCHAIN_AVAILABLE:
+        RecursiveCharacterTextSplitter = get_text_splitter_class()
+        if RecursiveCharacterTextSplitter:
             # Usa LangChain para chunking inteligente com separadores otimizados
             text_splitter = RecursiveCharacterTextSplitter(
                 separators=["\n\n", "\n", ".", "!", "?", ";", ",", " "],  # Separadores inteligentes
@@ -246,88 +241,161 @@ Para obter informações específicas sobre este documento, utilize o sistema de
     
     def batch_generate_embeddings(self, contents: List[str]) -> List[List[float]]:
         """Embeddings em lote otimizado para alta performance"""
+        return self.batch_generate_embeddings_with_stats(contents)[0]
+
+    def batch_generate_embeddings_with_stats(self, contents: List[str]) -> Tuple[List[List[float]], Dict[str, Any]]:
+        """
+        Embeddings em lote com cache persistente: apenas os textos ausentes do cache são codificados.
+
+        Returns:
+            tuple: (embeddings na ordem de `contents`, estatísticas de acerto do cache).
+        """
         try:
-            # Carrega modelo uma vez só para eficiência
-            if not hasattr(self, '_model'):
-                from sentence_transformers import SentenceTransformer
-                model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+            model_name = get_embedding_model_key()
+            cached, missing = chunk_embedding_cache.lookup(model_name, contents)
+            vectors_by_position = dict(cached)
+
+            if missing:
+                # Mesma instância do modelo usada pelo chat (registro compartilhado do processo)
+                model = get_embedding_model()
                 
-                logger.info(f"Carregando modelo {model_name}...")
-                self._model = SentenceTransformer(
-                    model_name,
-                    device='cpu',
-                    trust_remote_code=False
+                # Processa em lotes otimizados
+                logger.info(f"Gerando {len(missing)} embeddings em lote ({len(cached)} do cache)...")
+                
+                missing_texts = [contents[i] for i in missing]
+                encoded = model.encode(
+                    missing_texts,
+                    batch_size=self.batch_size,
+                    show_progress_bar=True,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True
                 )
-                logger.info("Modelo carregado e otimizado!")
-            
-            # Processa em lotes otimizados
-            logger.info(f"Gerando {len(contents)} embeddings em lote...")
-            
-            embeddings = self._model.encode(
-                contents,
-                batch_size=self.batch_size,
-                show_progress_bar=True,
-                convert_to_numpy=True,
-                normalize_embeddings=True,
-                device='cpu'  # Força CPU para estabilidade
-            )
+                chunk_embedding_cache.store(model_name, missing_texts, encoded)
+                vectors_by_position.update(zip(missing, encoded))
+
+            embeddings = np.stack([vectors_by_position[i] for i in range(len(contents))]) if contents else np.zeros((0, 0))
             
-            logger.info(f"{len(embeddings)} embeddings gerados com sucesso!")
-            return embeddings.tolist()
+            stats = {
+                "embedding_cache_hits": len(cached),
+                "embedding_cache_misses": len(missing),
+                "embedding_cache_hit_ratio": round(len(cached) / len(contents), 4) if contents else 0.0
+            }
+            logger.info(f"{len(embeddings)} embeddings gerados com sucesso! (acerto do cache: {stats['embedding_cache_hit_ratio']:.0%})")
+            return embeddings.tolist(), stats
             
         except Exception as e:
             logger.error(f"Erro ao gerar embeddings: {e}")
             raise HTTPException(status_code=500, detail=f"Erro nos embeddings: {str(e)}")
     
-    def optimized_pinecone_insert(self, chunks: List[Dict], embeddings: List[List[float]], filename: str, summary: str) -> Dict[str, Any]:
-        """Inserção otimizada no Pinecone com controle de qualidade"""
+    def assign_chunk_ids(self, chunks: List[Dict], filename: str) -> None:
+        """
+        Atribui IDs determinísticos aos chunks a partir do hash do conteúdo.
+        O mesmo texto no mesmo documento gera sempre o mesmo ID, o que permite reindexar
+        apenas o que mudou; textos repetidos dentro do documento recebem um sufixo sequencial.
+        """
+        stem = filename.replace('.pdf', '')
+        occurrences = {}
+        for chunk in chunks:
+            digest = hashlib.sha256(chunk["content"].encode("utf-8")).hexdigest()[:16]
+            count = occurrences.get(digest, 0)
+            occurrences[digest] = count + 1
+            chunk["id"] = f"{stem}_{digest}" if count == 0 else f"{stem}_{digest}-{count}"
+
+    def optimized_pinecone_insert(self, chunks: List[Dict], embeddings: Dict[str, List[float]], filename: str,
+                                  summary: str, stale_ids: Optional[List[str]] = None,
+                                  purge_unmanifested: bool = False) -> Dict[str, Any]:
+        """
+        Inserção incremental no Pinecone com controle de qualidade.
+        O texto dos chunks e o resumo vão para o chunk store local; o índice vetorial
+        recebe apenas o id e campos pequenos de filtro em cada vetor.
+
+        Args:
+            chunks: Todos os chunks atuais do documento (com `id`).
+            embeddings: Embeddings dos chunks novos, por id; apenas esses são enviados ao índice.
+            stale_ids: IDs da versão anterior do documento que não existem mais e devem ser removidos.
+            purge_unmanifested: O documento não tem manifesto no chunk store (nunca indexado ou indexado
+                antes dele): remove antes da inserção os vetores antigos do documento, de ids aleatórios.
+        """
         try:
             pinecone_index = get_pinecone_index()
             if not pinecone_index:
                 raise RuntimeError("Pinecone não inicializado")
             
             vectors_to_insert = []
+            indexed_at = datetime.now().isoformat()
             
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                # ID único mais simples
-                chunk_id = f"{filename.replace('.pdf', '')}_{i}_{uuid.uuid4().hex[:6]}"
-                
+            for chunk in chunks:
+                if chunk["id"] not in embeddings:
+                    continue  # Chunk inalterado: vetor já está no índice
                 vectors_to_insert.append({
-                    "id": chunk_id,
-                    "values": embedding,
+                    "id": chunk["id"],
+                    "values": embeddings[chunk["id"]],
                     "metadata": {
-                        "content": chunk["content"],
                         "filename": filename,
                         "chunk_order": chunk["metadata"]["chunk_order"],
                         "char_count": chunk["metadata"]["char_count"],
                         "source": chunk["metadata"].get("source", "unknown"),
-                        "indexed_at": datetime.now().isoformat(),
-                        "summary": summary  # Inclui o resumo nos metadados
+                        "indexed_at": indexed_at
                     }
                 })
+
+            # O texto é gravado antes dos vetores, para que toda busca encontre o conteúdo ao hidratar.
+            # Todos os chunks são regravados para atualizar a ordem dos inalterados (o chunk store é a referência).
+            chunk_store.put_chunks(filename, [
+                {"id": chunk["id"], "chunk_order": chunk["metadata"]["chunk_order"], "content": chunk["content"]}
+                for chunk in chunks
+            ])
+            chunk_store.put_document(filename, summary)
+            # Índice de palavras-chave (busca híbrida): só os chunks novos precisam ser indexados
+            bm25_index.add_chunks(filename, [chunk for chunk in chunks if chunk["id"] in embeddings])
             
             # Inserção em lotes grandes para melhor performance
             batch_size = 100
             total_inserted = 0
+            failed_ids = []
             
             logger.info(f"Inserindo {len(vectors_to_insert)} vetores...")
             
-            for i in range(0, len(vectors_to_insert), batch_size):
-                batch = vectors_to_insert[i:i + batch_size]
-                try:
-                    pinecone_index.upsert(vectors=batch)
-                    total_inserted += len(batch)
-                    logger.info(f"Lote {i//batch_size + 1}: {len(batch)} vetores")
-                except Exception as e:
-                    logger.error(f"Erro no lote: {e}")
-                    continue
+            try:
+                if purge_unmanifested:
+                    deleted, method = delete_unmanifested_vectors(pinecone_index, filename)
+                    logger.info(f"Vetores anteriores ao manifesto de {filename} removidos ({method}): "
+                                f"{deleted if deleted is not None else 'por filtro'}")
+
+                for i in range(0, len(vectors_to_insert), batch_size):
+                    batch = vectors_to_insert[i:i + batch_size]
+                    try:
+                        pinecone_index.upsert(vectors=batch)
+                        total_inserted += len(batch)
+                        logger.info(f"Lote {i//batch_size + 1}: {len(batch)} vetores")
+                    except Exception as e:
+                        logger.error(f"Erro no lote: {e}")
+                        failed_ids.extend(vector["id"] for vector in batch)
+                        continue
+
+                if failed_ids:
+                    # Sem vetor, o chunk não pode constar como indexado: a próxima tentativa o reenvia
+                    chunk_store.delete_chunks(failed_ids)
+                    bm25_index.delete_chunks(failed_ids)
+                    raise RuntimeError(f"{len(failed_ids)} vetores não foram inseridos")
+
+                # Remove do índice e do chunk store os chunks da versão anterior que deixaram de existir
+                stale_ids = list(stale_ids or [])
+                delete_vectors(pinecone_index, stale_ids)
+                chunk_store.delete_chunks(stale_ids)
+                bm25_index.delete_chunks(stale_ids)
+            finally:
+                # Índice local: uma única gravação em disco por documento, e não uma por lote
+                flush_vector_index(pinecone_index)
             
             return {
                 "success": True,
                 "filename": filename,
                 "total_chunks": len(chunks),
                 "vectors_inserted": total_inserted,
-                "chunking_method": "langchain" if LANGCHAIN_AVAILABLE else "manual",
+                "chunks_unchanged": len(chunks) - len(vectors_to_insert),
+                "chunks_removed": len(stale_ids),
+                "chunking_method": "langchain" if get_text_splitter_class() else "manual",
                 "chunk_size": self.chunk_size,
                 "chunk_overlap": self.chunk_overlap,
                 "summary": summary
@@ -337,19 +405,32 @@ Para obter informações específicas sobre este documento, utilize o sistema de
             logger.error(f"Erro na indexação: {e}")
             raise HTTPException(status_code=500, detail=f"Falha na indexação: {str(e)}")
     
-    async def process_pdf_hybrid(self, file_path: str, filename: str) -> Dict[str, Any]:
-        """Pipeline completo: processamento + resumo garantido + indexação"""
+    async def process_pdf_hybrid(self, file_path: str, filename: str,
+                                 progress_callback: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+        """
+        Pipeline completo: processamento + resumo garantido + indexação
+
+        Args:
+            progress_callback: Recebe (etapa, progresso de 0 a 1) no início de cada etapa;
+                               usado pela fila de ingestão para reportar o andamento do job.
+        """
         start_time = datetime.now()
+
+        def report(stage: str, progress: float) -> None:
+            if progress_callback:
+                progress_callback(stage, progress)
         
         try:
             logger.info(f"=== PROCESSAMENTO HÍBRIDO DE {filename} ===")
             
             # Etapa 1: Extração de texto otimizada
             logger.info("Extraindo texto...")
-            text_content = self.extract_text_from_pdf(file_path)
+            report("extracting", 0.05)
+            text_content, extraction_stats = self.extract_pdf_pages(file_path)
             
             # Etapa 2: Geração de resumo com fallback garantido
             logger.info("Gerando resumo...")
+            report("summarizing", 0.25)
             summary = self.generate_document_summary(text_content, filename)
             
             # Garantia: sempre ter um resumo válido
@@ -358,19 +439,33 @@ Para obter informações específicas sobre este documento, utilize o sistema de
             
             # Etapa 3: Chunking inteligente
             logger.info("Chunking inteligente...")
+            report("chunking", 0.45)
             chunks = self.create_smart_chunks(text_content, filename)
             
             if not chunks:
                 raise ValueError("Nenhum chunk válido criado")
             
-            # Etapa 4: Embeddings em lote otimizado
+            # Etapa 4: Embeddings em lote otimizado, apenas dos chunks que ainda não estão indexados
             logger.info("Gerando embeddings...")
-            contents = [chunk["content"] for chunk in chunks]
-            embeddings = self.batch_generate_embeddings(contents)
+            report("embedding", 0.55)
+            self.assign_chunk_ids(chunks, filename)
+            existing_ids = set(chunk_store.get_chunk_ids(filename))
+            current_ids = {chunk["id"] for chunk in chunks}
+            new_chunks = [chunk for chunk in chunks if chunk["id"] not in existing_ids]
+            stale_ids = sorted(existing_ids - current_ids)
+            logger.info(f"{len(new_chunks)} chunks novos, {len(chunks) - len(new_chunks)} inalterados, {len(stale_ids)} removidos")
+
+            embeddings = {}
+            embedding_stats = {"embedding_cache_hits": 0, "embedding_cache_misses": 0, "embedding_cache_hit_ratio": 0.0}
+            if new_chunks:
+                vectors, embedding_stats = self.batch_generate_embeddings_with_stats([chunk["content"] for chunk in new_chunks])
+                embeddings = {chunk["id"]: vector for chunk, vector in zip(new_chunks, vectors)}
             
             # Etapa 5: Indexação otimizada
             logger.info("Indexando...")
-            index_result = self.optimized_pinecone_insert(chunks, embeddings, filename, summary)
+            report("indexing", 0.85)
+            index_result = self.optimized_pinecone_insert(chunks, embeddings, filename, summary, stale_ids,
+                                                          purge_unmanifested=not existing_ids)
             
             # Resultado final com métricas detalhadas
             processing_time = (datetime.now() - start_time).total_seconds()
@@ -378,6 +473,8 @@ Para obter informações específicas sobre este documento, utilize o sistema de
             final_result = {
                 **index_result,
                 "text_length": len(text_content),
+                **extraction_stats,
+                **embedding_stats,
                 "processing_time_seconds": round(processing_time, 2),
                 "chunks_per_second": round(len(chunks) / processing_time, 2),
                 "optimization": "hybrid_langchain_sentence_transformers",
@@ -397,6 +494,8 @@ Para obter informações específicas sobre este documento, utilize o sistema de
                 "success": False,
                 "filename": filename,
                 "error": str(e),
+                # PDFs inválidos ou sem texto falham sempre; erros de infraestrutura podem ser retentados
+                "retryable": not isinstance(e, ValueError) and not (isinstance(e, HTTPException) and e.status_code < 500),
                 "summary": summary,
                 "processing_time_seconds": round(processing_time, 2)
             }
@@ -405,6 +504,7 @@ Para obter informações específicas sobre este documento, utilize o sistema de
 hybrid_processor = HybridDocumentProcessor()
 
 # Função wrapper
-async def process_and_index_pdf(file_path: str, filename: str) -> Dict[str, Any]:
+async def process_and_index_pdf(file_path: str, filename: str,
+                                progress_callback: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
     """Versão HÍBRIDA: melhor qualidade de contexto e performance + Resumo garantido"""
-    return await hybrid_processor.process_pdf_hybrid(file_path, filename)
\ No newline at end of file
+    return await hybrid_processor.process_pdf_hybrid(file_path, filename, progress_callback)
\ No newline at end of file
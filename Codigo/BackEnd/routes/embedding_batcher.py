@@ -0,0 +1,118 @@
+# Micro-batching de embeddings para consultas concorrentes do chat.
+# Sob carga, cada requisição de /api/chat codificaria sua pergunta sozinha, desperdiçando
+# o ganho de vazão que o SentenceTransformer.encode obtém com lotes. O batcher agrupa os
+# textos que chegam em uma janela de poucos milissegundos (até um tamanho máximo de lote),
+# codifica tudo em uma única chamada e resolve o future de cada solicitante.
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBatcher:
+    """Agrupa pedidos de embedding concorrentes em lotes processados por uma thread dedicada."""
+
+    def __init__(self, encode_batch: Callable[[List[str]], np.ndarray], max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """
+        Args:
+            encode_batch: Função que recebe uma lista de textos e retorna uma matriz (n, dim).
+            max_batch_size (int): Número máximo de textos por chamada ao modelo.
+            max_wait_ms (float): Tempo máximo que o primeiro texto do lote aguarda por companhia.
+        """
+        self.encode_batch = encode_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+        self._last_batch_size = 0
+
+    def submit(self, text: str) -> Future:
+        """Enfileira um texto e retorna um future resolvido com seu embedding (np.ndarray)."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text: str, timeout: float = None) -> np.ndarray:
+        """Versão bloqueante de `submit`."""
+        return self.submit(text).result(timeout=timeout)
+
+    def stats(self) -> dict:
+        """Número de lotes, textos processados e tamanho médio/máximo dos lotes."""
+        with self._stats_lock:
+            batches, items, largest = self._batches, self._items, self._largest_batch
+        return {
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": round(items / batches, 2) if batches else 0.0,
+            "largest_batch": largest,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize()
+        }
+
+    def _ensure_started(self) -> None:
+        # A thread só é criada no primeiro uso, para não pesar na importação do módulo.
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self) -> list:
+        """
+        Bloqueia até o primeiro pedido e então aguarda outros até a janela fechar ou o lote encher.
+        Com carga baixa (lote anterior unitário e fila vazia) o pedido segue sem esperar,
+        para que um solicitante isolado não pague a janela de espera.
+        """
+        batch = [self._queue.get()]
+        if self._last_batch_size <= 1 and self._queue.empty():
+            return batch
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                # Pedidos já enfileirados entram sem espera, mesmo com a janela encerrada.
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            # Pedidos cancelados pelo solicitante não precisam ser codificados
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            self._last_batch_size = len(batch)
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.encode_batch(texts)
+            except Exception as e:
+                logger.error(f"Erro ao gerar lote de {len(texts)} embeddings: {e}", exc_info=True)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._largest_batch = max(self._largest_batch, len(batch))
@@ -1,17 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
+from dotenv import load_dotenv
 import logging
+import os
 
 # ========== IMPORTAÇÃO DO SISTEMA DE AUTENTICAÇÃO ==========
 # Importa função de autenticação do módulo de login
 # Esta função verifica se o usuário está logado e retorna dados do usuário
 from routes.login import get_current_active_user
+from routes.history_store import history_store, HISTORY_FIELDS
 
+load_dotenv()
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# ========== PAGINAÇÃO ==========
+# O histórico é devolvido em páginas (mais recentes primeiro) com cursor, para que o tamanho
+# e a latência da resposta não cresçam com o histórico do usuário
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+HISTORY_TITLE_MAX_CHARS = int(os.getenv("HISTORY_TITLE_MAX_CHARS", "80"))
+
 # ========== MODELOS DE DADOS (PYDANTIC) ==========
 # Define a estrutura dos dados que serão manipulados
 
@@ -29,15 +40,10 @@ class SaveChatRequest(BaseModel):
     answer: str
     sources: Optional[List[dict]] = []
 
-# ========== ARMAZENAMENTO EM MEMÓRIA ==========
-
-# Dicionário principal que armazena o histórico de todos os usuários
-# Estrutura: {email_do_usuario: [lista_de_conversas]}
-user_history_store = {}
+# ========== ARMAZENAMENTO ==========
 
-# Contador global para gerar IDs únicos para cada mensagem
-# Incrementa a cada nova conversa salva
-message_id_counter = 1
+# O histórico fica no backend configurado em HISTORY_BACKEND (SQLite por padrão, veja
+# routes/history_store.py): persiste entre reinícios e é compartilhado pelos workers.
 
 # ========== FUNÇÕES AUXILIARES PARA MANIPULAÇÃO DO HISTÓRICO ==========
 
@@ -51,12 +57,13 @@ def get_user_history(user_email: str) -> List[dict]:
     Returns:
         Lista de conversas do usuário ou lista vazia se não existir
     """
-    return user_history_store.get(user_email, [])
+    return history_store.get_entries(user_email)
 
 def add_chat_entry(user_email: str, question: str, answer: str, sources: List[dict] = None) -> int:
     """
     Adiciona uma nova conversa ao histórico do usuário
-    Esta é a função PRINCIPAL usada pelo sistema de chat
+    Esta é a função PRINCIPAL usada pelo sistema de chat.
+    A gravação em disco acontece em segundo plano; o chat não espera o banco.
     
     Args:
         user_email: Email do usuário
@@ -66,85 +73,77 @@ def add_chat_entry(user_email: str, question: str, answer: str, sources: List[di
     Returns:
         ID da nova entrada criada
     """
-    global message_id_counter
-    
-    # Se é a primeira conversa do usuário, cria a lista
-    if user_email not in user_history_store:
-        user_history_store[user_email] = []
-    
-    # Cria nova entrada com timestamp atual
-    new_entry = {
-        "id": message_id_counter,
-        "question": question,
-        "answer": answer,
-        "timestamp": datetime.now(),
-        "sources": sources or []
-    }
-    
-    # Adiciona ao histórico do usuário
-    user_history_store[user_email].append(new_entry)
-    message_id_counter += 1
-    
+    entry_id = history_store.add_entry(user_email, question, answer, sources)
     logger.info(f"Nova entrada adicionada ao histórico de {user_email}")
-    return new_entry["id"]
+    return entry_id
+
+def parse_fields(fields: Optional[str]) -> tuple:
+    """Converte o parâmetro `fields` (lista separada por vírgulas) nos campos projetados."""
+    if not fields:
+        return HISTORY_FIELDS
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    invalid = [field for field in requested if field not in HISTORY_FIELDS]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Campos inválidos: {', '.join(invalid)}. Disponíveis: {', '.join(HISTORY_FIELDS)}"
+        )
+    return requested
 
 def clear_user_history(user_email: str) -> bool:
     """Limpa todo o histórico de um usuário"""
-    if user_email in user_history_store:
-        user_history_store[user_email] = []
+    if history_store.clear(user_email):
         logger.info(f"Histórico limpo para usuário {user_email}")
         return True
     return False
 
 def delete_chat_entry(user_email: str, entry_id: int) -> bool:
     """Remove uma conversa específica do histórico"""
-    if user_email not in user_history_store:
-        return False
-    
-    user_history = user_history_store[user_email]
-    for i, entry in enumerate(user_history):
-        if entry["id"] == entry_id:
-            del user_history[i]
-            logger.info(f"Entrada {entry_id} removida do histórico de {user_email}")
-            return True
+    if history_store.delete_entry(user_email, entry_id):
+        logger.info(f"Entrada {entry_id} removida do histórico de {user_email}")
+        return True
     return False
 
 # ========== ENDPOINTS DA API ==========
+# Os endpoints são funções síncronas: o backend faz I/O bloqueante no SQLite (transações, espera da
+# fila de escrita) e o FastAPI executa rotas `def` no pool de threads, fora do event loop.
 
 @router.get("", response_model=dict)
-async def get_history(current_user: dict = Depends(get_current_active_user)):
+def get_history(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    max_chars: Optional[int] = Query(None, ge=1),
+    current_user: dict = Depends(get_current_active_user)
+):
     """
-    ENDPOINT PRINCIPAL: Busca todo o histórico do usuário logado
+    ENDPOINT PRINCIPAL: Busca o histórico do usuário logado, em páginas
     
     - Verifica autenticação automaticamente via Depends()
-    - Busca histórico usando email do usuário como chave
-    - Converte datetime para string (JSON não suporta datetime)
-    - Retorna histórico formatado para o frontend
+    - Retorna as conversas mais recentes primeiro, `limit` por página
+    - `cursor`: valor de `next_cursor` da página anterior
+    - `fields`: campos incluídos, separados por vírgula (ex.: `question,timestamp`)
+    - `max_chars`: trunca pergunta e resposta (útil para listagens)
     """
     try:
         user_email = current_user["email"]  # Extrai email do usuário logado
-        history = get_user_history(user_email)
-        
-        # CONVERSÃO IMPORTANTE: datetime -> string para JSON
-        serialized_history = []
-        for entry in history:
-            serialized_entry = {
-                "id": entry["id"],
-                "question": entry["question"],
-                "answer": entry["answer"],
-                "timestamp": entry["timestamp"].isoformat(),  # datetime -> string ISO
-                "sources": entry["sources"]
-            }
-            serialized_history.append(serialized_entry)
+        entries, next_cursor = history_store.list_entries(
+            user_email, limit, cursor=cursor, fields=parse_fields(fields), max_chars=max_chars
+        )
         
-        logger.info(f"Histórico recuperado para {user_email}: {len(history)} entradas")
+        logger.info(f"Histórico recuperado para {user_email}: {len(entries)} entradas")
         
         return {
-            "history": serialized_history,
-            "total_entries": len(history),
+            "history": entries,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
             "user": user_email
         }
         
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao buscar histórico: {e}", exc_info=True)
         raise HTTPException(
@@ -152,8 +151,74 @@ async def get_history(current_user: dict = Depends(get_current_active_user)):
             detail="Erro interno ao buscar histórico"
         )
 
+@router.get("/titles", response_model=dict)
+def get_history_titles(
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    ENDPOINT PARA A BARRA LATERAL: apenas id, título (início da pergunta) e data
+    
+    - Mesma paginação por cursor de GET /api/history
+    - Não lê respostas nem fontes
+    """
+    try:
+        user_email = current_user["email"]
+        entries, next_cursor = history_store.list_entries(
+            user_email, limit, cursor=cursor, fields=("question", "timestamp"), max_chars=HISTORY_TITLE_MAX_CHARS
+        )
+        return {
+            "titles": [{"id": e["id"], "title": e["question"], "timestamp": e["timestamp"]} for e in entries],
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
+            "user": user_email
+        }
+        
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro ao buscar títulos do histórico: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Erro interno ao buscar histórico"
+        )
+
+@router.get("/search", response_model=dict)
+def search_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_active_user)
+):
+    """
+    ENDPOINT DE BUSCA NO HISTÓRICO
+    
+    - Busca textual em perguntas e respostas do usuário logado (sem acentos e sem diferenciar maiúsculas)
+    - Resultados ordenados por relevância (BM25), com um trecho da resposta
+    - Paginação por `offset`; `next_offset` é None na última página
+    """
+    try:
+        user_email = current_user["email"]
+        results, has_more = history_store.search(user_email, q, limit, offset)
+        return {
+            "query": q,
+            "results": results,
+            "next_offset": offset + limit if has_more else None,
+            "user": user_email
+        }
+        
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro na busca do histórico: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Erro interno ao buscar no histórico"
+        )
+
 @router.post("/save")
-async def save_chat(
+def save_chat(
     chat_data: SaveChatRequest,
     current_user: dict = Depends(get_current_active_user)
 ):
@@ -198,7 +263,7 @@ async def save_chat(
         )
 
 @router.delete("/clear")
-async def clear_history(current_user: dict = Depends(get_current_active_user)):
+def clear_history(current_user: dict = Depends(get_current_active_user)):
     """
     ENDPOINT PARA LIMPAR TODO O HISTÓRICO
     
@@ -228,7 +293,7 @@ async def clear_history(current_user: dict = Depends(get_current_active_user)):
         )
 
 @router.delete("/{entry_id}")
-async def delete_entry(
+def delete_entry(
     entry_id: int,
     current_user: dict = Depends(get_current_active_user)
 ):
@@ -263,7 +328,7 @@ async def delete_entry(
         )
 
 @router.get("/stats")
-async def get_history_stats(current_user: dict = Depends(get_current_active_user)):
+def get_history_stats(current_user: dict = Depends(get_current_active_user)):
     """
     ENDPOINT PARA ESTATÍSTICAS DO HISTÓRICO
     
@@ -275,27 +340,8 @@ async def get_history_stats(current_user: dict = Depends(get_current_active_user
     """
     try:
         user_email = current_user["email"]
-        history = get_user_history(user_email)
-        
-        total_entries = len(history)
-        if total_entries == 0:
-            return {
-                "total_entries": 0,
-                "first_entry": None,
-                "last_entry": None,
-                "user": user_email
-            }
-        
-        # Encontra primeira e última entrada por timestamp
-        first_entry = min(history, key=lambda x: x["timestamp"])
-        last_entry = max(history, key=lambda x: x["timestamp"])
-        
-        return {
-            "total_entries": total_entries,
-            "first_entry": first_entry["timestamp"].isoformat(),
-            "last_entry": last_entry["timestamp"].isoformat(),
-            "user": user_email
-        }
+        # Totais mantidos incrementalmente pelo backend: custo constante, independente do tamanho do histórico
+        return {**history_store.stats(user_email), "user": user_email}
         
     except Exception as e:
         logger.error(f"Erro ao buscar estatísticas: {e}", exc_info=True)
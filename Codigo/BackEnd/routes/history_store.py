@@ -0,0 +1,606 @@
+# Armazenamento do histórico de conversas.
+# O histórico ficava em um dicionário do módulo com um contador global de ids: era perdido a cada
+# reinício, não era compartilhado entre os workers do gunicorn e crescia sem limite na RAM.
+# Aqui o histórico passa por um backend plugável (HISTORY_BACKEND): SQLite por padrão (WAL, índice
+# por usuário e data) ou memória. No SQLite as inserções são gravadas em segundo plano, em lotes,
+# por uma thread escritora; o chat só enfileira a entrada e nunca espera um fsync. Os ids vêm de
+# blocos reservados por processo em uma tabela de contadores, então cada worker gera ids únicos
+# sem consultar o banco a cada conversa.
+
+import os
+import json
+import queue
+import base64
+import bisect
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+from routes.text_search import InvertedIndex, make_snippet, query_terms
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Ids reservados por processo a cada ida ao banco
+ID_BLOCK_SIZE = 1000
+
+# Campos que podem ser projetados nas listagens (o id é sempre retornado)
+HISTORY_FIELDS = ("question", "answer", "timestamp", "sources")
+
+def encode_cursor(timestamp: str, entry_id: int) -> str:
+    """Cursor opaco de paginação: posição (data, id) da última entrada da página."""
+    return base64.urlsafe_b64encode(f"{timestamp}|{entry_id}".encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    Raises:
+        ValueError: Cursor malformado.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        timestamp, entry_id = raw.rsplit("|", 1)
+        datetime.fromisoformat(timestamp)
+        return timestamp, int(entry_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+class HistoryBackend(ABC):
+    """Interface dos backends de histórico. As entradas são dicts com datetime em `timestamp`."""
+
+    @abstractmethod
+    def add_entry(self, user_email: str, question: str, answer: str, sources: Optional[List[dict]] = None) -> int:
+        """Registra uma conversa e retorna o id da nova entrada."""
+
+    @abstractmethod
+    def get_entries(self, user_email: str) -> List[dict]:
+        """Conversas do usuário, da mais antiga para a mais recente."""
+
+    @abstractmethod
+    def list_entries(self, user_email: str, limit: int, cursor: Optional[str] = None,
+                     fields: Sequence[str] = HISTORY_FIELDS, max_chars: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        Uma página de conversas, da mais recente para a mais antiga, já pronta para JSON.
+
+        Args:
+            limit: Máximo de entradas na página.
+            cursor: `next_cursor` da página anterior (None = primeira página).
+            fields: Campos incluídos além do id.
+            max_chars: Trunca pergunta e resposta nesse número de caracteres.
+
+        Returns:
+            tuple: (entradas, cursor da próxima página ou None se não houver mais).
+
+        Raises:
+            ValueError: Cursor inválido.
+        """
+
+    @abstractmethod
+    def delete_entry(self, user_email: str, entry_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def clear(self, user_email: str) -> bool:
+        ...
+
+    @abstractmethod
+    def stats(self, user_email: str) -> dict:
+        """Total de conversas e datas da primeira e da última (ISO), mantidos incrementalmente."""
+
+    @abstractmethod
+    def search(self, user_email: str, query: str, limit: int, offset: int = 0) -> Tuple[List[dict], bool]:
+        """
+        Busca textual nas perguntas e respostas do usuário, ordenada por relevância (BM25).
+
+        Returns:
+            tuple: (resultados com id, pergunta, data, trecho e score; se há mais resultados).
+        """
+
+    def flush(self, user_email: Optional[str] = None) -> None:
+        """Garante que as escritas pendentes (de um usuário ou de todos, se None) foram gravadas."""
+
+    def close(self) -> None:
+        """Grava as pendências e libera recursos (chamado no encerramento da aplicação)."""
+        self.flush()
+
+    @staticmethod
+    def _project(entry: dict, fields: Sequence[str], max_chars: Optional[int]) -> dict:
+        """Copia apenas os campos pedidos de uma entrada, serializando a data."""
+        projected = {"id": entry["id"]}
+        for field in fields:
+            value = entry[field]
+            if field == "timestamp" and isinstance(value, datetime):
+                value = value.isoformat(timespec="microseconds")
+            elif max_chars and field in ("question", "answer"):
+                value = value[:max_chars]
+            projected[field] = value
+        return projected
+
+    @staticmethod
+    def _new_entry(entry_id: int, question: str, answer: str, sources: Optional[List[dict]]) -> dict:
+        return {
+            "id": entry_id,
+            "question": question,
+            "answer": answer,
+            "timestamp": datetime.now(),
+            "sources": sources or []
+        }
+
+class UserHistory:
+    """
+    Histórico de um usuário em memória: entradas indexadas por id, mais a ordem cronológica dos ids.
+    Remoções tiram a entrada do dicionário em O(1); os ids removidos saem da ordem no fim da lista
+    imediatamente e, no meio, na próxima compactação (custo amortizado constante).
+    """
+
+    def __init__(self):
+        self.entries: Dict[int, dict] = {}
+        self.order: List[int] = []  # Ids em ordem crescente (= cronológica); pode conter ids removidos
+        self._head = 0              # Posições anteriores a _head em `order` são todas de ids removidos
+        self.index = InvertedIndex()  # Busca textual em perguntas e respostas
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def searchable_text(entry: dict) -> str:
+        return f"{entry['question']}\n{entry['answer']}"
+
+    def add(self, entry: dict) -> None:
+        self.entries[entry["id"]] = entry
+        self.order.append(entry["id"])
+        self.index.add(entry["id"], self.searchable_text(entry))
+
+    def remove(self, entry_id: int) -> bool:
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return False
+        self.index.remove(entry_id, self.searchable_text(entry))
+        while self.order and self.order[-1] not in self.entries:
+            self.order.pop()
+        self._head = min(self._head, len(self.order))
+        if len(self.order) - self._head > 2 * len(self.entries) + 32:
+            self.order = [i for i in self.order[self._head:] if i in self.entries]
+            self._head = 0
+        return True
+
+    def first(self) -> Optional[dict]:
+        while self._head < len(self.order) and self.order[self._head] not in self.entries:
+            self._head += 1
+        return self.entries[self.order[self._head]] if self._head < len(self.order) else None
+
+    def last(self) -> Optional[dict]:
+        return self.entries[self.order[-1]] if self.order else None
+
+    def page(self, before_id: Optional[int], limit: int) -> Tuple[List[dict], bool]:
+        """Até `limit` entradas anteriores a `before_id`, da mais recente para a mais antiga, e se há mais."""
+        position = len(self.order) if before_id is None else bisect.bisect_left(self.order, before_id, lo=self._head)
+        page = []
+        for i in range(position - 1, self._head - 1, -1):
+            entry = self.entries.get(self.order[i])
+            if entry is not None:
+                if len(page) == limit:
+                    return page, True
+                page.append(entry)
+        return page, False
+
+class MemoryHistoryBackend(HistoryBackend):
+    """Histórico em memória do processo (útil em desenvolvimento e testes)."""
+
+    def __init__(self):
+        self._users: Dict[str, UserHistory] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def add_entry(self, user_email, question, answer, sources=None) -> int:
+        with self._lock:
+            entry = self._new_entry(self._next_id, question, answer, sources)
+            self._next_id += 1
+            self._users.setdefault(user_email, UserHistory()).add(entry)
+        return entry["id"]
+
+    def get_entries(self, user_email) -> List[dict]:
+        with self._lock:
+            history = self._users.get(user_email)
+            return list(history.entries.values()) if history else []
+
+    def list_entries(self, user_email, limit, cursor=None, fields=HISTORY_FIELDS, max_chars=None):
+        # Os ids deste backend crescem junto com a data, então o id do cursor basta para posicionar a página
+        before_id = decode_cursor(cursor)[1] if cursor else None
+        with self._lock:
+            history = self._users.get(user_email)
+            page, has_more = history.page(before_id, limit) if history else ([], False)
+        items = [self._project(entry, fields, max_chars) for entry in page]
+        next_cursor = None
+        if has_more:
+            last = page[-1]
+            next_cursor = encode_cursor(last["timestamp"].isoformat(timespec="microseconds"), last["id"])
+        return items, next_cursor
+
+    def delete_entry(self, user_email, entry_id) -> bool:
+        with self._lock:
+            history = self._users.get(user_email)
+            return history.remove(entry_id) if history else False
+
+    def clear(self, user_email) -> bool:
+        with self._lock:
+            return self._users.pop(user_email, None) is not None
+
+    def stats(self, user_email) -> dict:
+        with self._lock:
+            history = self._users.get(user_email)
+            first, last = (history.first(), history.last()) if history else (None, None)
+            total = len(history) if history else 0
+        return {
+            "total_entries": total,
+            "first_entry": first["timestamp"].isoformat() if first else None,
+            "last_entry": last["timestamp"].isoformat() if last else None
+        }
+
+    def search(self, user_email, query, limit, offset=0):
+        terms = query_terms(query)
+        with self._lock:
+            history = self._users.get(user_email)
+            if history is None:
+                return [], False
+            ranked, has_more = history.index.search(query, limit, offset, terms=terms)
+            entries = [(history.entries[entry_id], score) for entry_id, score in ranked]
+        return [{
+            "id": entry["id"],
+            "question": entry["question"],
+            "timestamp": entry["timestamp"].isoformat(timespec="microseconds"),
+            "snippet": make_snippet(entry["answer"], terms),
+            "score": round(score, 4)
+        } for entry, score in entries], has_more
+
+class SQLiteHistoryBackend(HistoryBackend):
+    """Histórico persistido em SQLite, com inserções em lote gravadas por uma thread em segundo plano."""
+
+    def __init__(self, path: str, batch_size: int = 100):
+        """
+        Args:
+            path (str): Arquivo do banco SQLite (compartilhado entre os workers).
+            batch_size (int): Máximo de conversas gravadas por transação.
+        """
+        self.path = path
+        self.batch_size = max(1, batch_size)
+
+        self._local = threading.local()  # Uma conexão por thread
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        # Conversas ainda na fila por usuário: as leituras de um usuário esperam só as dele
+        self._pending: Dict[str, int] = {}
+        self._pending_changed = threading.Condition()
+
+        self._id_lock = threading.Lock()
+        self._next_id = 0
+        self._block_end = 0  # Ids disponíveis no bloco atual: [_next_id, _block_end)
+
+        self._init_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")      # Leitores não bloqueiam o escritor
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self) -> None:
+        conn = self._connection()
+        with conn:
+            has_stats = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_stats'").fetchone()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY,
+                    user_email TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    sources TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_timestamp ON history (user_email, timestamp, id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('history_id', 1)")
+            # Totais por usuário mantidos a cada escrita, para que as estatísticas não varram o histórico
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    user_email TEXT PRIMARY KEY,
+                    total_entries INTEGER NOT NULL,
+                    first_entry TEXT,
+                    last_entry TEXT
+                )
+            """)
+            # Índice de texto completo (FTS5) sobre perguntas e respostas, sincronizado por triggers.
+            # O tokenizador remove acentos, então "matricula" encontra "matrícula". O e-mail do dono
+            # também é indexado, para que a busca case só as conversas do usuário no próprio MATCH.
+            has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_fts'").fetchone()
+            try:
+                if has_fts and "user_email" not in {row["name"] for row in conn.execute("PRAGMA table_info(history_fts)")}:
+                    # Índice criado antes da coluna do usuário: recria e reconstrói a partir do histórico
+                    conn.execute("DROP TRIGGER IF EXISTS history_fts_insert")
+                    conn.execute("DROP TRIGGER IF EXISTS history_fts_delete")
+                    conn.execute("DROP TABLE history_fts")
+                    has_fts = None
+                conn.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                        question, answer, user_email, content='history', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2'
+                    )
+                """)
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+                        INSERT INTO history_fts (rowid, question, answer, user_email)
+                        VALUES (new.id, new.question, new.answer, new.user_email);
+                    END
+                """)
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+                        INSERT INTO history_fts (history_fts, rowid, question, answer, user_email)
+                        VALUES ('delete', old.id, old.question, old.answer, old.user_email);
+                    END
+                """)
+                if not has_fts:
+                    conn.execute("INSERT INTO history_fts (history_fts) VALUES ('rebuild')")
+                self.fts_enabled = True
+            except sqlite3.OperationalError as e:
+                logger.warning(f"SQLite sem suporte a FTS5 ({e}); busca no histórico indisponível")
+                self.fts_enabled = False
+            if not has_stats:
+                # Bancos criados antes da tabela de totais: calcula uma única vez a partir do histórico
+                conn.execute("""
+                    INSERT INTO user_stats (user_email, total_entries, first_entry, last_entry)
+                    SELECT user_email, COUNT(*), MIN(timestamp), MAX(timestamp) FROM history GROUP BY user_email
+                """)
+
+    # ---------- Ids ----------
+
+    def _reserve_id_block(self) -> None:
+        """Reserva o próximo bloco de ids na tabela de contadores (transação exclusiva entre processos)."""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            start = conn.execute("SELECT value FROM counters WHERE name = 'history_id'").fetchone()[0]
+            conn.execute("UPDATE counters SET value = ? WHERE name = 'history_id'", (start + ID_BLOCK_SIZE,))
+        self._next_id, self._block_end = start, start + ID_BLOCK_SIZE
+
+    def _allocate_id(self) -> int:
+        with self._id_lock:
+            if self._next_id >= self._block_end:
+                self._reserve_id_block()
+            entry_id = self._next_id
+            self._next_id += 1
+            return entry_id
+
+    # ---------- Escrita em segundo plano ----------
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            row = self._queue.get()
+            if row is None:
+                self._queue.task_done()
+                return
+            batch = [row]
+            # O lote reúne o que se acumulou na fila enquanto a transação anterior era gravada
+            try:
+                while len(batch) < self.batch_size:
+                    row = self._queue.get_nowait()
+                    if row is None:
+                        self._queue.put(None)  # Reprocessa a parada depois de gravar o lote
+                        self._queue.task_done()
+                        break
+                    batch.append(row)
+            except queue.Empty:
+                pass
+            self._write_batch(batch)
+
+    def _write_batch(self, rows: List[tuple]) -> None:
+        try:
+            per_user: Dict[str, list] = {}
+            for row in rows:
+                totals = per_user.setdefault(row[1], [0, row[4], row[4]])
+                totals[0] += 1
+                totals[1], totals[2] = min(totals[1], row[4]), max(totals[2], row[4])
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO history (id, user_email, question, answer, timestamp, sources) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                conn.executemany("""
+                    INSERT INTO user_stats (user_email, total_entries, first_entry, last_entry) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_email) DO UPDATE SET
+                        total_entries = total_entries + excluded.total_entries,
+                        first_entry = min(coalesce(first_entry, excluded.first_entry), excluded.first_entry),
+                        last_entry = max(coalesce(last_entry, excluded.last_entry), excluded.last_entry)
+                """, [(user, *totals) for user, totals in per_user.items()])
+        except Exception as e:
+            logger.error(f"Erro ao gravar {len(rows)} entradas do histórico: {e}", exc_info=True)
+        finally:
+            with self._pending_changed:
+                for row in rows:
+                    remaining = self._pending[row[1]] - 1
+                    if remaining:
+                        self._pending[row[1]] = remaining
+                    else:
+                        del self._pending[row[1]]
+                self._pending_changed.notify_all()
+            for _ in rows:
+                self._queue.task_done()
+
+    def add_entry(self, user_email, question, answer, sources=None) -> int:
+        entry = self._new_entry(self._allocate_id(), question, answer, sources)
+        with self._pending_changed:
+            self._pending[user_email] = self._pending.get(user_email, 0) + 1
+        self._queue.put((
+            entry["id"], user_email, question, answer,
+            entry["timestamp"].isoformat(timespec="microseconds"), json.dumps(entry["sources"], ensure_ascii=False)
+        ))
+        self._ensure_writer()
+        return entry["id"]
+
+    def flush(self, user_email=None) -> None:
+        if self._writer is None:
+            return
+        if user_email is None:
+            self._queue.join()
+            return
+        # Espera apenas as conversas do usuário, sem depender do tamanho da fila dos demais
+        with self._pending_changed:
+            self._pending_changed.wait_for(lambda: user_email not in self._pending)
+
+    def close(self) -> None:
+        with self._writer_lock:
+            if self._writer is None:
+                return
+            self._queue.put(None)
+            self._queue.join()
+            self._writer.join(timeout=5)
+            self._writer = None
+
+    # ---------- Leitura e remoção ----------
+
+    @staticmethod
+    def _row_to_entry(row: sqlite3.Row) -> dict:
+        return {
+            "id": row["id"],
+            "question": row["question"],
+            "answer": row["answer"],
+            "timestamp": datetime.fromisoformat(row["timestamp"]),
+            "sources": json.loads(row["sources"])
+        }
+
+    def get_entries(self, user_email) -> List[dict]:
+        self.flush(user_email)  # Leituras enxergam as conversas do usuário ainda na fila
+        rows = self._connection().execute(
+            "SELECT id, question, answer, timestamp, sources FROM history WHERE user_email = ? ORDER BY timestamp, id",
+            (user_email,)
+        )
+        return [self._row_to_entry(row) for row in rows]
+
+    def list_entries(self, user_email, limit, cursor=None, fields=HISTORY_FIELDS, max_chars=None):
+        self.flush(user_email)
+        # Seleciona só as colunas pedidas; a data e o id vêm sempre, para montar o cursor
+        columns = ["id", "timestamp"]
+        for field in fields:
+            if field in ("question", "answer") and max_chars:
+                columns.append(f"substr({field}, 1, {int(max_chars)}) AS {field}")
+            elif field != "timestamp":
+                columns.append(field)
+        sql = f"SELECT {', '.join(columns)} FROM history WHERE user_email = ?"
+        params: list = [user_email]
+        if cursor:
+            # Percorre o índice (user_email, timestamp, id) a partir da posição do cursor
+            sql += " AND (timestamp, id) < (?, ?)"
+            params.extend(decode_cursor(cursor))
+        sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        items = []
+        for row in rows:
+            item = {"id": row["id"]}
+            for field in fields:
+                item[field] = json.loads(row[field]) if field == "sources" else row[field]
+            items.append(item)
+        next_cursor = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"]) if has_more else None
+        return items, next_cursor
+
+    def delete_entry(self, user_email, entry_id) -> bool:
+        self.flush(user_email)
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT timestamp FROM history WHERE id = ? AND user_email = ?", (entry_id, user_email)).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM history WHERE id = ?", (entry_id,))
+            conn.execute("UPDATE user_stats SET total_entries = total_entries - 1 WHERE user_email = ?", (user_email,))
+            # Só consulta o índice de novo se a entrada removida era a primeira ou a última do usuário
+            stats = conn.execute("SELECT first_entry, last_entry FROM user_stats WHERE user_email = ?", (user_email,)).fetchone()
+            if stats and row["timestamp"] in (stats["first_entry"], stats["last_entry"]):
+                conn.execute("""
+                    UPDATE user_stats SET
+                        first_entry = (SELECT timestamp FROM history WHERE user_email = ?1 ORDER BY timestamp LIMIT 1),
+                        last_entry = (SELECT timestamp FROM history WHERE user_email = ?1 ORDER BY timestamp DESC LIMIT 1)
+                    WHERE user_email = ?1
+                """, (user_email,))
+            return True
+
+    def clear(self, user_email) -> bool:
+        self.flush(user_email)
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM user_stats WHERE user_email = ?", (user_email,))
+            return conn.execute("DELETE FROM history WHERE user_email = ?", (user_email,)).rowcount > 0
+
+    def stats(self, user_email) -> dict:
+        self.flush(user_email)
+        row = self._connection().execute(
+            "SELECT total_entries, first_entry, last_entry FROM user_stats WHERE user_email = ?", (user_email,)
+        ).fetchone()
+        if row is None or row["total_entries"] == 0:
+            return {"total_entries": 0, "first_entry": None, "last_entry": None}
+        return {"total_entries": row["total_entries"], "first_entry": row["first_entry"], "last_entry": row["last_entry"]}
+
+    def search(self, user_email, query, limit, offset=0):
+        if not self.fts_enabled:
+            raise RuntimeError("Busca textual indisponível: SQLite sem suporte a FTS5")
+        terms = query_terms(query)
+        if not terms:
+            return [], False
+        self.flush(user_email)
+        # Cada termo vai entre aspas (sem operadores do FTS5 vindos do usuário); basta um termo para casar.
+        # O MATCH exige o e-mail do usuário (como frase na sua coluna) e procura os termos só na
+        # pergunta e na resposta; a comparação exata com h.user_email descarta e-mails de mesma frase.
+        owner = user_email.replace('"', '""')
+        match = f'user_email : "{owner}" AND {{question answer}} : (' + " OR ".join(f'"{term}"' for term in terms) + ")"
+        rows = self._connection().execute("""
+            SELECT h.id, h.question, h.timestamp,
+                   snippet(history_fts, 1, '', '', '…', 24) AS snippet,
+                   bm25(history_fts, 1.0, 1.0, 0.0) AS rank
+            FROM history_fts JOIN history h ON h.id = history_fts.rowid
+            WHERE history_fts MATCH ? AND h.user_email = ?
+            ORDER BY rank, h.id DESC
+            LIMIT ? OFFSET ?
+        """, (match, user_email, limit + 1, offset)).fetchall()
+        return [{
+            "id": row["id"],
+            "question": row["question"],
+            "timestamp": row["timestamp"],
+            "snippet": row["snippet"],
+            "score": round(-row["rank"], 4)  # bm25() do FTS5 é negativo: menor = mais relevante
+        } for row in rows[:limit]], len(rows) > limit
+
+def create_history_backend() -> HistoryBackend:
+    """Cria o backend configurado em HISTORY_BACKEND ("sqlite" ou "memory")."""
+    backend = os.getenv("HISTORY_BACKEND", "sqlite").lower()
+    if backend == "memory":
+        return MemoryHistoryBackend()
+    if backend != "sqlite":
+        raise ValueError(f"HISTORY_BACKEND desconhecido: {backend}")
+    return SQLiteHistoryBackend(
+        os.getenv("HISTORY_DB_PATH", "history.db"),
+        batch_size=int(os.getenv("HISTORY_WRITE_BATCH_SIZE", "100"))
+    )
+
+# Instância global usada pelas rotas de histórico e pelo chat
+history_store = create_history_backend()
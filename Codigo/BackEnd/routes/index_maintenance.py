@@ -0,0 +1,197 @@
+# Manutenção do índice vetorial: remoção dos vetores de documentos excluídos e reconciliação.
+# Sem isso, excluir um documento removia apenas o PDF e os metadados; os vetores continuavam
+# no índice, que crescia indefinidamente e seguia devolvendo fontes inexistentes no chat.
+# A remoção usa o manifesto de ids do chunk store (em lotes) e, para documentos indexados antes
+# do manifesto, um delete por filtro ou por prefixo de id. A reconciliação periódica compara o
+# índice e o chunk store com o acervo atual e remove os órfãos.
+
+import os
+import re
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from routes.utils import get_pinecone_index, flush_vector_index
+from routes.chunk_store import chunk_store
+from routes.bm25_index import bm25_index
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Máximo de IDs por chamada de remoção no Pinecone
+DELETE_BATCH_SIZE = 1000
+
+# Formatos dos ids de chunks: `<nome sem .pdf>_<hash de 16>[-<n>]` (atual, pelo conteúdo) e
+# `<nome sem .pdf>_<ordem>_<hex de 6>` (anterior). O nome pode conter "_" e dígitos, então o
+# documento só é identificado pelo id inteiro, e não por prefixo ("foo_2.pdf" começa com "foo_").
+CHUNK_ID_PATTERNS = (
+    re.compile(r"^(?P<stem>.+)_[0-9a-f]{16}(?:-\d+)?$"),
+    re.compile(r"^(?P<stem>.+)_\d+_[0-9a-f]{6}$"),
+)
+
+def document_stem(filename: str) -> str:
+    """Parte do nome do documento usada nos ids dos seus chunks."""
+    return filename.replace('.pdf', '')
+
+def document_id_prefix(filename: str) -> str:
+    """Prefixo dos ids dos chunks de um documento (ids = `<nome sem .pdf>_<hash>`)."""
+    return f"{document_stem(filename)}_"
+
+def stem_from_chunk_id(vector_id: str) -> Optional[str]:
+    """Documento (sem .pdf) de um id de chunk, ou None se o id não segue nenhum formato conhecido."""
+    for pattern in CHUNK_ID_PATTERNS:
+        match = pattern.match(vector_id)
+        if match:
+            return match.group("stem")
+    return None
+
+def delete_vectors(pinecone_index, ids: List[str]) -> int:
+    """Remove vetores por id em lotes. Retorna o número de ids enviados."""
+    for i in range(0, len(ids), DELETE_BATCH_SIZE):
+        pinecone_index.delete(ids=ids[i:i + DELETE_BATCH_SIZE])
+    return len(ids)
+
+def delete_unmanifested_vectors(pinecone_index, filename: str) -> tuple:
+    """
+    Remove os vetores de um documento indexado antes do manifesto de chunks, pelo metadado
+    `filename`. Índices serverless não aceitam delete por filtro; nesse caso lista os ids pelo prefixo.
+
+    Returns:
+        tuple: (vetores removidos ou None se removidos por filtro, método "filter" ou "prefix").
+    """
+    try:
+        pinecone_index.delete(filter={"filename": filename})
+        return None, "filter"
+    except Exception as e:
+        logger.info(f"Delete por filtro indisponível ({e}); removendo por prefixo de id")
+    # O prefixo também casa com documentos de nome mais longo ("foo_2.pdf" para "foo.pdf")
+    stem = document_stem(filename)
+    prefix_ids = [vector_id for page in pinecone_index.list(prefix=document_id_prefix(filename))
+                  for vector_id in page if stem_from_chunk_id(vector_id) == stem]
+    return delete_vectors(pinecone_index, prefix_ids), "prefix"
+
+def purge_document_vectors(filename: str) -> Dict[str, Any]:
+    """
+    Remove do índice vetorial e do chunk store todos os chunks de um documento.
+
+    Returns:
+        dict: Número de vetores removidos e método utilizado ("manifest", "filter" ou "prefix").
+    """
+    pinecone_index = get_pinecone_index()
+    if not pinecone_index:
+        raise RuntimeError("Pinecone não inicializado")
+
+    ids = chunk_store.get_chunk_ids(filename)
+    if ids:
+        deleted, method = delete_vectors(pinecone_index, ids), "manifest"
+    else:
+        deleted, method = delete_unmanifested_vectors(pinecone_index, filename)
+    flush_vector_index(pinecone_index)
+
+    chunk_store.delete_document(filename)
+    bm25_index.delete_document(filename)
+    logger.info(f"Vetores de {filename} removidos ({method}): {deleted if deleted is not None else 'por filtro'}")
+    return {"filename": filename, "vectors_deleted": deleted, "method": method}
+
+def reconcile_index(get_known_filenames: Callable[[], Iterable[str]]) -> Dict[str, Any]:
+    """
+    Remove do índice e do chunk store os chunks de documentos que não existem mais no acervo.
+
+    Args:
+        get_known_filenames: Retorna os documentos válidos (acervo + ingestões em andamento).
+                             É chamada depois da leitura do índice, para que vetores inseridos
+                             por uma ingestão iniciada durante a reconciliação não sejam removidos.
+
+    Returns:
+        dict: Documentos e vetores órfãos removidos.
+    """
+    started = datetime.now()
+    pinecone_index = get_pinecone_index()
+    if not pinecone_index:
+        raise RuntimeError("Pinecone não inicializado")
+
+    stored_filenames = chunk_store.get_filenames()
+    try:
+        index_ids = [vector_id for page in pinecone_index.list() for vector_id in page]
+    except Exception as e:
+        # Índices baseados em pods não listam ids; a reconciliação fica restrita ao manifesto
+        logger.warning(f"Listagem de ids indisponível no índice: {e}")
+        index_ids = None
+
+    known = set(get_known_filenames())
+    if not known:
+        # Acervo vazio costuma indicar metadados não carregados; não apaga o índice inteiro por precaução
+        logger.warning("Reconciliação ignorada: nenhum documento conhecido no acervo")
+        return {"skipped": True, "finished_at": datetime.now().isoformat()}
+
+    orphan_documents = [filename for filename in stored_filenames if filename not in known]
+    for filename in orphan_documents:
+        purge_document_vectors(filename)
+
+    orphan_vectors = 0
+    if index_ids is not None:
+        # Um vetor é mantido se está no manifesto de um documento conhecido ou se o documento do
+        # seu id (comparado por inteiro) é conhecido; ids fora dos formatos conhecidos não são removidos
+        known_ids = {chunk_id for filename in known for chunk_id in chunk_store.get_chunk_ids(filename)}
+        known_stems = {document_stem(filename) for filename in known}
+        orphan_ids, unrecognized = [], 0
+        for vector_id in index_ids:
+            if vector_id in known_ids:
+                continue
+            stem = stem_from_chunk_id(vector_id)
+            if stem is None:
+                unrecognized += 1
+            elif stem not in known_stems:
+                orphan_ids.append(vector_id)
+        if unrecognized:
+            logger.warning(f"Reconciliação: {unrecognized} vetores com id em formato desconhecido foram mantidos")
+        orphan_vectors = delete_vectors(pinecone_index, orphan_ids) if orphan_ids else 0
+        flush_vector_index(pinecone_index)
+
+    result = {
+        "orphan_documents": orphan_documents,
+        "orphan_vectors_deleted": orphan_vectors,
+        "vectors_scanned": len(index_ids) if index_ids is not None else None,
+        "duration_seconds": round((datetime.now() - started).total_seconds(), 2),
+        "finished_at": datetime.now().isoformat()
+    }
+    logger.info(f"Reconciliação do índice concluída: {result}")
+    return result
+
+class IndexReconciler:
+    """Executa `reconcile_index` periodicamente em uma thread de segundo plano."""
+
+    def __init__(self, interval_seconds: float):
+        """
+        Args:
+            interval_seconds (float): Intervalo entre reconciliações (0 desativa a execução periódica).
+        """
+        self.interval_seconds = interval_seconds
+        self.last_result: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, get_known_filenames: Callable[[], Iterable[str]]) -> None:
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(get_known_filenames,), name="index-reconciler", daemon=True)
+        self._thread.start()
+        logger.info(f"Reconciliação periódica do índice a cada {self.interval_seconds:.0f}s")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
+
+    def _run(self, get_known_filenames) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.last_result = reconcile_index(get_known_filenames)
+            except Exception as e:
+                logger.error(f"Erro na reconciliação do índice: {e}", exc_info=True)
+
+# Instância global iniciada na subida da aplicação
+index_reconciler = IndexReconciler(float(os.getenv("INDEX_RECONCILE_INTERVAL_SECONDS", "3600")))
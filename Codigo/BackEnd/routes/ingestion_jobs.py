@@ -0,0 +1,264 @@
+# Fila assíncrona de ingestão de documentos.
+# O upload apenas persiste o arquivo e devolve um id de job; a extração do PDF, o resumo,
+# os embeddings e a indexação rodam em um pool de workers em segundo plano. Assim uploads
+# grandes não prendem os workers da API e vários documentos podem ser ingeridos em paralelo.
+# O estado dos jobs fica em memória (como os demais stores do sistema) e inclui etapa,
+# progresso, tentativas e o resultado final do processamento.
+
+import os
+import uuid
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Estados possíveis de um job
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_RETRYING = "retrying"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+# Documento processado e indexado, mas a publicação (on_success) falhou: não é reprocessado;
+# uma nova tentativa manual repete apenas a publicação
+JOB_FINALIZE_FAILED = "finalize_failed"
+ACTIVE_JOB_STATUSES = (JOB_QUEUED, JOB_RUNNING, JOB_RETRYING)
+
+class IngestionJobManager:
+    """Gerencia jobs de ingestão executados em um pool de threads, com progresso e retentativas."""
+
+    def __init__(self, max_workers: int = 2, max_retries: int = 2, retry_delay_seconds: float = 5.0,
+                 max_finished_jobs: int = 500):
+        """
+        Args:
+            max_workers (int): Documentos processados em paralelo.
+            max_retries (int): Retentativas automáticas após uma falha recuperável.
+            retry_delay_seconds (float): Espera antes da primeira retentativa (dobra a cada nova tentativa).
+            max_finished_jobs (int): Jobs concluídos com sucesso mantidos no histórico.
+        """
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_delay_seconds = retry_delay_seconds
+        self.max_finished_jobs = max_finished_jobs
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._handlers: Dict[str, Dict[str, Callable]] = {}
+        self._lock = threading.Lock()
+        # Retentativas agendadas: a espera do backoff acontece em um timer, sem ocupar um worker do pool
+        self._retry_timers: Dict[str, threading.Timer] = {}
+        self._closed = False
+
+    def submit(self, process: Callable, file_path: str, file_id: str, original_name: str,
+               on_success: Optional[Callable] = None, on_failure: Optional[Callable] = None,
+               **extra: Any) -> Dict[str, Any]:
+        """
+        Cria um job e o enfileira no pool de workers.
+
+        Args:
+            process: Corrotina `process(file_path, file_id, progress_callback)` que retorna o resultado
+                     do processamento (dicionário com `success`).
+            file_path (str): Caminho do arquivo já persistido.
+            file_id (str): Identificador do documento.
+            original_name (str): Nome original do arquivo enviado.
+            on_success: Chamado com (job, resultado) quando o processamento conclui com sucesso.
+                        Se falhar, o job vai para `finalize_failed` sem reprocessar o documento.
+            on_failure: Chamado com (job, erro) quando o job falha definitivamente.
+            **extra: Campos adicionais guardados no job (ex.: tamanho do arquivo).
+
+        Returns:
+            dict: Cópia do estado inicial do job.
+        """
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "file_id": file_id,
+            "original_name": original_name,
+            "file_path": file_path,
+            "status": JOB_QUEUED,
+            "stage": "queued",
+            "progress": 0.0,
+            "attempts": 0,
+            "max_attempts": self.max_retries + 1,
+            "error": None,
+            "result": None,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            **extra
+        }
+        with self._lock:
+            self._prune_finished()
+            self._jobs[job_id] = job
+            self._handlers[job_id] = {"process": process, "on_success": on_success, "on_failure": on_failure}
+        self._executor.submit(self._run, job_id)
+        logger.info(f"Job de ingestão {job_id} enfileirado para {original_name}")
+        return self.get(job_id)
+
+    def retry(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Reenfileira manualmente um job que falhou, zerando suas tentativas. Se apenas a
+        publicação falhou (`finalize_failed`), só ela é repetida.
+
+        Returns:
+            dict: Estado do job, ou None se o job não existe ou não está em estado de falha.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] not in (JOB_FAILED, JOB_FINALIZE_FAILED):
+                return None
+            if job["status"] == JOB_FINALIZE_FAILED:
+                job.update({"status": JOB_RUNNING, "stage": "finalizing", "error": None, "finished_at": None})
+                target = self._retry_finalize
+            else:
+                job.update({"status": JOB_QUEUED, "stage": "queued", "progress": 0.0, "attempts": 0,
+                            "error": None, "finished_at": None})
+                target = self._run
+        self._executor.submit(target, job_id)
+        logger.info(f"Job de ingestão {job_id} reenfileirado manualmente")
+        return self.get(job_id)
+
+    def discard(self, job_id: str) -> bool:
+        """Remove um job que falhou definitivamente. Retorna False se o job não pode ser descartado."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] not in (JOB_FAILED, JOB_FINALIZE_FAILED):
+                return False
+            del self._jobs[job_id]
+            del self._handlers[job_id]
+            return True
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list_jobs(self, limit: Optional[int] = 50) -> List[Dict[str, Any]]:
+        """Jobs mais recentes primeiro (limit=None retorna todos)."""
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values()]
+        jobs.sort(key=lambda job: job["created_at"], reverse=True)
+        return jobs[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+        return {
+            "workers": self.max_workers,
+            "total": len(statuses),
+            **{status: statuses.count(status) for status in (JOB_QUEUED, JOB_RUNNING, JOB_RETRYING, JOB_SUCCEEDED, JOB_FAILED,
+                                                         JOB_FINALIZE_FAILED)}
+        }
+
+    def shutdown(self) -> None:
+        """Cancela os jobs ainda na fila e as retentativas agendadas e aguarda os que estão em execução."""
+        with self._lock:
+            self._closed = True
+            timers, self._retry_timers = list(self._retry_timers.values()), {}
+        for timer in timers:
+            timer.cancel()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _prune_finished(self) -> None:
+        """Descarta os jobs concluídos mais antigos (chamado com o lock adquirido)."""
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] == JOB_SUCCEEDED]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
+            del self._handlers[job_id]
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _finalize(self, job_id: str, result: Dict[str, Any]) -> bool:
+        """
+        Publica o resultado de um processamento bem-sucedido (on_success). Uma falha aqui não
+        é uma falha de ingestão: o documento já está indexado e não volta para a fila.
+        """
+        on_success = self._handlers[job_id]["on_success"]
+        if on_success:
+            try:
+                on_success(self.get(job_id), result)
+            except Exception as e:
+                logger.error(f"Erro ao publicar o documento do job {job_id}: {e}", exc_info=True)
+                self._update(job_id, status=JOB_FINALIZE_FAILED, stage="finalizing", progress=1.0, result=result,
+                             error=f"Falha ao publicar o documento processado: {e}",
+                             finished_at=datetime.now().isoformat())
+                return False
+        self._update(job_id, status=JOB_SUCCEEDED, stage="done", progress=1.0, result=result, error=None,
+                     finished_at=datetime.now().isoformat())
+        return True
+
+    def _retry_finalize(self, job_id: str) -> None:
+        if self._finalize(job_id, self.get(job_id)["result"]):
+            logger.info(f"Job de ingestão {job_id} publicado após nova tentativa")
+
+    def _schedule_retry(self, job_id: str, delay: float) -> None:
+        """Reenfileira o job no pool depois de `delay` segundos."""
+        def resubmit() -> None:
+            with self._lock:
+                if self._retry_timers.pop(job_id, None) is not None and not self._closed:
+                    self._executor.submit(self._run, job_id)
+
+        timer = threading.Timer(delay, resubmit)
+        timer.daemon = True
+        with self._lock:
+            if self._closed:
+                return
+            self._retry_timers[job_id] = timer
+        timer.start()
+
+    def _run(self, job_id: str) -> None:
+        """
+        Executa uma tentativa do job na thread do pool. Se a falha for recuperável, a próxima
+        tentativa é agendada com backoff exponencial e o worker fica livre durante a espera.
+        """
+        job = self.get(job_id)
+        handlers = self._handlers[job_id]
+        attempt = job["attempts"] + 1
+
+        def progress_callback(stage: str, progress: float) -> None:
+            self._update(job_id, stage=stage, progress=round(progress, 3))
+
+        self._update(job_id, status=JOB_RUNNING, attempts=attempt, started_at=datetime.now().isoformat(), error=None)
+        try:
+            # O pipeline de processamento é uma corrotina; cada worker roda seu próprio event loop.
+            result = asyncio.run(handlers["process"](job["file_path"], job["file_id"], progress_callback))
+            if result.get("success"):
+                if self._finalize(job_id, result):
+                    logger.info(f"Job de ingestão {job_id} concluído na tentativa {attempt}")
+                return
+
+            error = result.get("error", "Falha no processamento do documento")
+            retryable = result.get("retryable", True)
+        except Exception as e:
+            logger.error(f"Erro no job de ingestão {job_id}: {e}", exc_info=True)
+            error, retryable = str(e), True
+
+        if retryable and attempt < job["max_attempts"]:
+            delay = self.retry_delay_seconds * (2 ** (attempt - 1))
+            logger.warning(f"Job {job_id} falhou na tentativa {attempt} ({error}); nova tentativa em {delay:.0f}s")
+            self._update(job_id, status=JOB_RETRYING, error=error)
+            self._schedule_retry(job_id, delay)
+            return
+
+        self._update(job_id, status=JOB_FAILED, error=error, finished_at=datetime.now().isoformat())
+        logger.error(f"Job de ingestão {job_id} falhou definitivamente: {error}")
+        if handlers["on_failure"]:
+            try:
+                handlers["on_failure"](self.get(job_id), error)
+            except Exception as e:
+                logger.error(f"Erro no tratamento de falha do job {job_id}: {e}", exc_info=True)
+
+# Instância global usada pelas rotas de administração
+ingestion_jobs = IngestionJobManager(
+    max_workers=int(os.getenv("INGESTION_WORKERS", "2")),
+    max_retries=int(os.getenv("INGESTION_MAX_RETRIES", "2")),
+    retry_delay_seconds=float(os.getenv("INGESTION_RETRY_DELAY_SECONDS", "5"))
+)
@@ -0,0 +1,568 @@
+# Camada de acesso ao LLM compartilhada pelo chat e pela ingestão (resumos de documentos).
+# Antes, cada módulo criava seu próprio cliente Groq, com o nome do modelo fixo no código, sem
+# timeout, sem retentativas e sem como rodar o sistema sem rede. O gateway centraliza:
+# - Provedor plugável: "groq" (API real) ou "fake" (respostas determinísticas e latência simulada,
+#   para testes de carga e benchmarks sem acesso à rede);
+# - Cliente HTTP com pool de conexões reutilizado por todas as chamadas do processo;
+# - Timeouts configuráveis e retentativas com backoff exponencial com jitter (apenas para erros
+#   transitórios: conexão, timeout, 429 e 5xx; o header Retry-After é respeitado);
+# - Limite de chamadas simultâneas por modelo, único para o processo (threads e event loops);
+# - Estatísticas por modelo (chamadas, erros, retentativas, latência e tokens).
+
+import os
+import time
+import math
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+import weakref
+from collections import deque
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").lower()
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3-8b-8192")
+LLM_SUMMARY_MODEL = os.getenv("LLM_SUMMARY_MODEL", LLM_MODEL)
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY_SECONDS = float(os.getenv("LLM_RETRY_BASE_DELAY_SECONDS", "0.5"))
+LLM_RETRY_MAX_DELAY_SECONDS = float(os.getenv("LLM_RETRY_MAX_DELAY_SECONDS", "8"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+# Chamadas simultâneas por modelo (o padrão mantém o limite anterior do chat), com exceções por
+# modelo no formato "modelo=limite,modelo=limite"
+LLM_MAX_CONCURRENT_PER_MODEL = int(os.getenv("LLM_MAX_CONCURRENT_PER_MODEL", os.getenv("CHAT_MAX_CONCURRENT_LLM_CALLS", "32")))
+LLM_MODEL_CONCURRENCY = os.getenv("LLM_MODEL_CONCURRENCY", "")
+
+# Provedor simulado: tempo até o primeiro token, vazão de geração e taxa de falhas transitórias
+LLM_FAKE_LATENCY_MS = float(os.getenv("LLM_FAKE_LATENCY_MS", "150"))
+LLM_FAKE_TOKENS_PER_SECOND = float(os.getenv("LLM_FAKE_TOKENS_PER_SECOND", "400"))
+LLM_FAKE_FAILURE_RATE = float(os.getenv("LLM_FAKE_FAILURE_RATE", "0"))
+LLM_FAKE_ANSWER_TOKENS = 120
+
+def parse_model_limits(spec: str) -> Dict[str, int]:
+    """Converte "modelo=limite,modelo=limite" em dicionário (entradas inválidas são ignoradas)."""
+    limits = {}
+    for item in spec.split(","):
+        model, _, limit = item.strip().rpartition("=")
+        if model and limit.isdigit():
+            limits[model] = int(limit)
+    return limits
+
+class LLMCompletion:
+    """Resposta completa do LLM com a contagem de tokens informada pelo provedor."""
+    __slots__ = ("text", "model", "prompt_tokens", "completion_tokens", "attempts", "latency_ms")
+
+    def __init__(self, text: str, model: str, prompt_tokens: Optional[int] = None,
+                 completion_tokens: Optional[int] = None):
+        self.text = text
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.attempts = 1
+        self.latency_ms = 0.0
+
+    @property
+    def usage(self) -> dict:
+        return {"prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
+
+# ---------- Provedores ----------
+
+class LLMProvider(ABC):
+    """Interface dos provedores de LLM. `params` são os parâmetros de geração (max_tokens, temperature...)."""
+
+    name = "base"
+
+    @abstractmethod
+    def complete(self, model: str, messages: List[dict], params: dict) -> LLMCompletion:
+        ...
+
+    @abstractmethod
+    async def acomplete(self, model: str, messages: List[dict], params: dict) -> LLMCompletion:
+        ...
+
+    @abstractmethod
+    def astream(self, model: str, messages: List[dict], params: dict) -> AsyncIterator[str]:
+        ...
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Se o erro é transitório e a chamada pode ser repetida."""
+        return False
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        """Espera pedida pelo servidor (header Retry-After), em segundos."""
+        return None
+
+    async def aclose(self) -> None:
+        pass
+
+class GroqProvider(LLMProvider):
+    """
+    API da Groq. Os clientes (síncrono para a ingestão, assíncrono para o chat) são criados no
+    primeiro uso e reutilizados, mantendo as conexões HTTP abertas entre as chamadas. As
+    retentativas do SDK ficam desligadas: quem repete as chamadas é o gateway.
+    O pool de conexões assíncrono pertence a um event loop: há um cliente por loop (o do chat e o
+    de cada job que rode seu próprio loop), fechado quando o loop é encerrado.
+    """
+
+    name = "groq"
+
+    def __init__(self, api_key: Optional[str], timeout: float, connect_timeout: float, max_connections: int):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._client = None
+        # event loop -> (cliente assíncrono, gerador que o fecha no encerramento do loop)
+        self._async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    def _client_options(self) -> dict:
+        import httpx
+        return {
+            "api_key": self.api_key,
+            "max_retries": 0,
+            "timeout": httpx.Timeout(self.timeout, connect=self.connect_timeout)
+        }
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    def _sync(self):
+        with self._lock:
+            if self._client is None:
+                from groq import Groq, DefaultHttpxClient
+                self._client = Groq(http_client=DefaultHttpxClient(limits=self._limits()), **self._client_options())
+            return self._client
+
+    @staticmethod
+    async def _close_with_loop(client):
+        # Gerador assíncrono iniciado no loop do cliente: o encerramento do loop (asyncio.run chama
+        # loop.shutdown_asyncgens) o finaliza e fecha o pool de conexões ainda com o loop ativo
+        try:
+            yield
+        finally:
+            await client.close()
+
+    async def _async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._async_clients.get(loop)
+            created = entry is None
+            if created:
+                from groq import AsyncGroq, DefaultAsyncHttpxClient
+                client = AsyncGroq(http_client=DefaultAsyncHttpxClient(limits=self._limits()), **self._client_options())
+                entry = self._async_clients[loop] = (client, self._close_with_loop(client))
+        if created:
+            await entry[1].__anext__()
+        return entry[0]
+
+    @staticmethod
+    def _completion(response, model: str) -> LLMCompletion:
+        usage = getattr(response, "usage", None)
+        return LLMCompletion(
+            response.choices[0].message.content or "",
+            model,
+            getattr(usage, "prompt_tokens", None),
+            getattr(usage, "completion_tokens", None)
+        )
+
+    def complete(self, model: str, messages: List[dict], params: dict) -> LLMCompletion:
+        response = self._sync().chat.completions.create(model=model, messages=messages, **params)
+        return self._completion(response, model)
+
+    async def acomplete(self, model: str, messages: List[dict], params: dict) -> LLMCompletion:
+        client = await self._async()
+        response = await client.chat.completions.create(model=model, messages=messages, **params)
+        return self._completion(response, model)
+
+    async def astream(self, model: str, messages: List[dict], params: dict) -> AsyncIterator[str]:
+        client = await self._async()
+        stream = await client.chat.completions.create(model=model, messages=messages, stream=True, **params)
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+
+    def is_retryable(self, error: Exception) -> bool:
+        import groq
+        if isinstance(error, groq.APIConnectionError):  # Inclui APITimeoutError
+            return True
+        if isinstance(error, groq.APIStatusError):
+            return error.status_code in (408, 409, 429) or error.status_code >= 500
+        return False
+
+    def retry_after(self, error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        try:
+            return float(response.headers.get("retry-after")) if response is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    async def aclose(self) -> None:
+        """Fecha o cliente síncrono e o assíncrono do loop atual (os de outros loops fecham com eles)."""
+        with self._lock:
+            client, self._client = self._client, None
+            entry = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            client.close()
+        if entry is not None:
+            await entry[1].aclose()
+
+class FakeProviderError(Exception):
+    """Falha transitória simulada pelo provedor fake."""
+
+class FakeProvider(LLMProvider):
+    """
+    Provedor local para testes de carga e execução sem rede. A resposta é determinística (depende
+    só do prompt) e o tempo segue o perfil de um LLM remoto: latência até o primeiro token mais
+    tempo proporcional ao número de tokens gerados.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_ms: float, tokens_per_second: float, failure_rate: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = max(1.0, tokens_per_second)
+        self.failure_rate = failure_rate
+        self._random = random.Random()
+
+    def _tokens(self, messages: List[dict], params: dict) -> List[str]:
+        prompt = messages[-1]["content"]
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        words = prompt.split() or ["..."]
+        rng = random.Random(int(digest[:16], 16))
+        count = min(int(params.get("max_tokens", LLM_FAKE_ANSWER_TOKENS)), LLM_FAKE_ANSWER_TOKENS)
+        return [f"[resposta simulada {digest[:8]}]"] + [f" {rng.choice(words)}" for _ in range(max(0, count - 1))]
+
+    def _maybe_fail(self) -> None:
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise FakeProviderError("falha transitória simulada")
+
+    def _completion(self, model: str, messages: List[dict], tokens: List[str]) -> LLMCompletion:
+        prompt_tokens = math.ceil(sum(len(m["content"]) for m in messages) / 4)
+        return LLMCompletion("".join(tokens), model, prompt_tokens, len(tokens))
+
+    def complete(self, model: str, messages: List[dict], params: dict) -> LLMCompletion:
+        self._maybe_fail()
+        tokens = self._tokens(messages, params)
+        time.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return self._completion(model, messages, tokens)
+
+    async def acomplete(self, model: str, messages: List[dict], params: dict) -> LLMCompletion:
+        self._maybe_fail()
+        tokens = self._tokens(messages, params)
+        await asyncio.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return self._completion(model, messages, tokens)
+
+    async def astream(self, model: str, messages: List[dict], params: dict) -> AsyncIterator[str]:
+        self._maybe_fail()
+        tokens = self._tokens(messages, params)
+        await asyncio.sleep(self.latency)
+        # Tokens entregues em pequenos grupos, como nos chunks de streaming das APIs
+        for i in range(0, len(tokens), 4):
+            await asyncio.sleep(len(tokens[i:i + 4]) / self.tokens_per_second)
+            yield "".join(tokens[i:i + 4])
+
+    def is_retryable(self, error: Exception) -> bool:
+        return isinstance(error, FakeProviderError)
+
+# ---------- Gateway ----------
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+class ConcurrencyLimiter:
+    """
+    Semáforo compartilhado por threads e por event loops: um único limite por modelo vale para as
+    chamadas síncronas da ingestão, para o loop do chat e para jobs que rodam em loops próprios.
+    As vagas são entregues na ordem de chegada; quem espera em um loop recebe a vaga via
+    `call_soon_threadsafe`, sem bloquear o loop.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        # Esperas na ordem de chegada: threading.Event (threads) ou (loop, future) (corrotinas)
+        self._waiters: deque = deque()
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()  # a vaga é transferida por release() sem passar pelo contador
+
+    async def acquire_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+            if handed_over:
+                # A vaga já tinha sido entregue a esta espera: repassa adiante
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                    return
+                loop, future = waiter
+                if loop.is_closed():
+                    continue
+                try:
+                    loop.call_soon_threadsafe(_wake, future)
+                    return
+                except RuntimeError:
+                    continue  # loop encerrado entre a verificação e o agendamento
+            self._in_use -= 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+class ModelStats:
+    """Contadores de uso de um modelo."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.total_latency = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def to_dict(self) -> dict:
+        completed = self.requests - self.errors - self.in_flight
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "avg_latency_ms": round(self.total_latency / completed * 1000, 2) if completed > 0 else 0.0,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens
+        }
+
+class LLMGateway:
+    """Ponto único de chamada ao LLM: retentativas com backoff, limite por modelo e estatísticas."""
+
+    def __init__(self, provider: LLMProvider, default_model: str, max_retries: int, base_delay: float,
+                 max_delay: float, max_concurrent: int, model_limits: Optional[Dict[str, int]] = None):
+        self.provider = provider
+        self.default_model = default_model
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_concurrent = max_concurrent
+        self.model_limits = model_limits or {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, ModelStats] = {}
+        # Um limitador por modelo, compartilhado pelas chamadas síncronas e por todos os event loops
+        self._limiters: Dict[str, ConcurrencyLimiter] = {}
+
+    def limit_for(self, model: str) -> int:
+        return self.model_limits.get(model, self.max_concurrent)
+
+    def _limiter(self, model: str) -> ConcurrencyLimiter:
+        with self._lock:
+            if model not in self._limiters:
+                self._limiters[model] = ConcurrencyLimiter(self.limit_for(model))
+            return self._limiters[model]
+
+    def _model_stats(self, model: str) -> ModelStats:
+        with self._lock:
+            return self._stats.setdefault(model, ModelStats())
+
+    def _begin(self, model: str) -> ModelStats:
+        stats = self._model_stats(model)
+        with self._lock:
+            stats.requests += 1
+            stats.in_flight += 1
+        return stats
+
+    def _finish(self, stats: ModelStats, started: float, completion: Optional[LLMCompletion] = None,
+                error: bool = False) -> None:
+        with self._lock:
+            stats.in_flight -= 1
+            if error:
+                stats.errors += 1
+                return
+            stats.total_latency += time.perf_counter() - started
+            if completion is not None:
+                stats.prompt_tokens += completion.prompt_tokens or 0
+                stats.completion_tokens += completion.completion_tokens or 0
+
+    def _retry_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """Espera antes da próxima tentativa, ou None se o erro não deve ser repetido."""
+        if attempt >= self.max_retries or not self.provider.is_retryable(error):
+            return None
+        # Backoff exponencial com jitter total: evita que as retentativas de várias requisições
+        # cheguem ao provedor ao mesmo tempo
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = self.provider.retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def _log_retry(self, model: str, attempt: int, delay: float, error: Exception, stats: ModelStats) -> None:
+        with self._lock:
+            stats.retries += 1
+        logger.warning(f"Falha transitória no LLM '{model}' (tentativa {attempt + 1}): {error}; nova tentativa em {delay:.2f}s")
+
+    def complete(self, messages: List[dict], model: Optional[str] = None, **params) -> LLMCompletion:
+        """Chamada síncrona (threads de ingestão)."""
+        model = model or self.default_model
+        stats = self._begin(model)
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                with self._limiter(model):
+                    completion = self.provider.complete(model, messages, params)
+                break
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    self._finish(stats, started, error=True)
+                    raise
+                self._log_retry(model, attempt, delay, e, stats)
+                time.sleep(delay)
+                attempt += 1
+        completion.attempts = attempt + 1
+        completion.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        self._finish(stats, started, completion)
+        return completion
+
+    async def acomplete(self, messages: List[dict], model: Optional[str] = None, **params) -> LLMCompletion:
+        """Chamada assíncrona (chat); a espera entre tentativas não ocupa a vaga do modelo."""
+        model = model or self.default_model
+        stats = self._begin(model)
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                async with self._limiter(model):
+                    completion = await self.provider.acomplete(model, messages, params)
+                break
+            except Exception as e:
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    self._finish(stats, started, error=True)
+                    raise
+                self._log_retry(model, attempt, delay, e, stats)
+                await asyncio.sleep(delay)
+                attempt += 1
+        completion.attempts = attempt + 1
+        completion.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        self._finish(stats, started, completion)
+        return completion
+
+    async def astream(self, messages: List[dict], model: Optional[str] = None, **params) -> AsyncIterator[str]:
+        """
+        Resposta em streaming, token a token. Só há retentativa se a falha ocorrer antes do
+        primeiro token: depois disso o cliente já recebeu parte da resposta.
+        """
+        model = model or self.default_model
+        stats = self._begin(model)
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            emitted = False
+            try:
+                async with self._limiter(model):
+                    async for token in self.provider.astream(model, messages, params):
+                        emitted = True
+                        yield token
+                break
+            except Exception as e:
+                delay = None if emitted else self._retry_delay(attempt, e)
+                if delay is None:
+                    self._finish(stats, started, error=True)
+                    raise
+                self._log_retry(model, attempt, delay, e, stats)
+                await asyncio.sleep(delay)
+                attempt += 1
+            except BaseException:
+                # Stream interrompido pelo cliente (desconexão): não conta como erro do provedor
+                self._finish(stats, started)
+                raise
+        self._finish(stats, started)
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {model: stats.to_dict() for model, stats in self._stats.items()}
+        return {
+            "provider": self.provider.name,
+            "default_model": self.default_model,
+            "max_retries": self.max_retries,
+            "max_concurrent_per_model": self.max_concurrent,
+            "models": models
+        }
+
+    async def aclose(self) -> None:
+        await self.provider.aclose()
+
+def create_llm_provider(name: str = LLM_PROVIDER) -> LLMProvider:
+    if name == "fake":
+        logger.info("LLM_PROVIDER=fake: respostas simuladas localmente, sem chamadas à rede")
+        return FakeProvider(LLM_FAKE_LATENCY_MS, LLM_FAKE_TOKENS_PER_SECOND, LLM_FAKE_FAILURE_RATE)
+    if name == "groq":
+        return GroqProvider(os.getenv("GROQ_API_KEY"), LLM_TIMEOUT_SECONDS, LLM_CONNECT_TIMEOUT_SECONDS, LLM_MAX_CONNECTIONS)
+    raise ValueError(f"LLM_PROVIDER desconhecido: {name}")
+
+# Instância global compartilhada por chat e ingestão
+llm_gateway = LLMGateway(
+    create_llm_provider(),
+    default_model=LLM_MODEL,
+    max_retries=LLM_MAX_RETRIES,
+    base_delay=LLM_RETRY_BASE_DELAY_SECONDS,
+    max_delay=LLM_RETRY_MAX_DELAY_SECONDS,
+    max_concurrent=LLM_MAX_CONCURRENT_PER_MODEL,
+    model_limits=parse_model_limits(LLM_MODEL_CONCURRENCY)
+)
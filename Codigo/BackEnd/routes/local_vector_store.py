@@ -0,0 +1,379 @@
+# Índice vetorial local, em processo, como alternativa ao Pinecone.
+# O acervo servido (algumas centenas de resoluções da UFMA) cabe facilmente em memória,
+# então a busca pode ser feita localmente, sem ida e volta pela rede a cada pergunta.
+# Expõe a mesma interface usada do índice Pinecone (query, upsert, delete, describe_index_stats):
+#   - Vetores normalizados em uma matriz float32 contígua; similaridade de cosseno = produto interno.
+#   - Top-k vetorizado com NumPy (argpartition) e filtro de metadados, com caminho rápido para `filename`.
+#   - Persistência em disco: a matriz é salva em .npy e aberta como memory-map (compartilhada entre
+#     workers via page cache); ids e metadados ficam em um JSON ao lado.
+#   - As escritas só alteram a memória e marcam o índice como pendente; `flush()` grava os arquivos
+#     uma vez ao fim de cada ingestão ou remoção (e no encerramento), em vez de regravar a matriz
+#     inteira a cada lote de upsert.
+# Pressupõe um único processo escritor por vez (a ingestão); os demais recarregam ao detectar mudança.
+
+import os
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.json"
+
+@dataclass
+class LocalMatch:
+    """Resultado individual de uma consulta, com os mesmos atributos de um match do Pinecone."""
+    id: str
+    score: float
+    metadata: Optional[Dict[str, Any]] = None
+    values: List[float] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "score": self.score, "metadata": self.metadata, "values": self.values}
+
+@dataclass
+class LocalQueryResponse:
+    """Resposta de consulta compatível com `QueryResponse.matches` do Pinecone."""
+    matches: List[LocalMatch]
+    namespace: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"matches": [m.to_dict() for m in self.matches], "namespace": self.namespace}
+
+class LocalVectorIndex:
+    """Índice vetorial em memória com a interface do `pinecone.Index` usada pelo sistema."""
+
+    def __init__(self, directory: str, dimension: Optional[int] = None):
+        self.directory = directory
+        self.dimension = dimension
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._matrix = np.zeros((0, dimension or 0), dtype=np.float32)
+        self._buffer: Optional[np.ndarray] = None     # Matriz com folga para inserções; _matrix é uma visão dela
+        self._ids: List[str] = []
+        self._metadata: List[Dict[str, Any]] = []
+        self._positions: Dict[str, int] = {}          # id -> linha da matriz
+        self._filename_codes = np.zeros(0, dtype=np.int32)  # código do `filename` de cada linha
+        self._code_by_filename: Dict[str, int] = {}
+        self._loaded_stamp = None
+        self._dirty = False  # Alterações em memória ainda não gravadas em disco
+
+        self._load()
+
+    # ---------- Interface compatível com o Pinecone ----------
+
+    def query(self, vector, top_k: int = 10, include_metadata: bool = False, include_values: bool = False,
+              filter: Optional[Dict[str, Any]] = None, namespace: Optional[str] = None, **kwargs) -> LocalQueryResponse:
+        """
+        Busca os `top_k` vetores mais similares (cosseno) ao vetor consultado.
+
+        Args:
+            vector: Vetor de consulta.
+            top_k (int): Número máximo de resultados.
+            include_metadata (bool): Inclui os metadados de cada resultado.
+            include_values (bool): Inclui os valores do vetor de cada resultado.
+            filter (dict): Filtro de metadados no formato do Pinecone
+                           (ex.: {"filename": "x.pdf"} ou {"filename": {"$in": [...]}}).
+        """
+        self._reload_if_changed()
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        with self._lock:
+            if not self._ids or top_k <= 0:
+                return LocalQueryResponse(matches=[], namespace=namespace or "")
+
+            scores = self._matrix @ query
+            mask = self._filter_mask(filter)
+            if mask is not None:
+                scores = np.where(mask, scores, -np.inf)
+
+            k = min(top_k, len(scores))
+            candidates = np.argpartition(-scores, k - 1)[:k]
+            ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+            matches = []
+            for row in ranked:
+                score = float(scores[row])
+                if score == -np.inf:
+                    break
+                matches.append(LocalMatch(
+                    id=self._ids[row],
+                    score=score,
+                    metadata=dict(self._metadata[row]) if include_metadata else None,
+                    values=self._matrix[row].tolist() if include_values else []
+                ))
+            return LocalQueryResponse(matches=matches, namespace=namespace or "")
+
+    def upsert(self, vectors: List[Any], namespace: Optional[str] = None, **kwargs) -> Dict[str, int]:
+        """
+        Insere ou atualiza vetores. Aceita dicionários {"id", "values", "metadata"}
+        ou tuplas (id, values[, metadata]), como o cliente Pinecone.
+        """
+        records = [self._as_record(v) for v in vectors]
+        if not records:
+            return {"upserted_count": 0}
+        self._reload_if_changed()
+
+        with self._lock:
+            self._ensure_writable()
+            new_rows = []
+            for vector_id, values, metadata in records:
+                values = self._normalize(values)
+                if self.dimension is None or self._matrix.shape[1] == 0:
+                    self.dimension = len(values)
+                    self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+                    self._buffer = None
+                if len(values) != self.dimension:
+                    raise ValueError(f"Dimensão do vetor '{vector_id}' ({len(values)}) difere da dimensão do índice ({self.dimension})")
+
+                row = self._positions.get(vector_id)
+                if row is None:
+                    self._positions[vector_id] = len(self._ids) + len(new_rows)
+                    new_rows.append((vector_id, values, metadata))
+                elif row >= len(self._ids):
+                    # Id repetido dentro do mesmo lote: prevalece a última ocorrência
+                    new_rows[row - len(self._ids)] = (vector_id, values, metadata)
+                else:
+                    # Atualização no lugar
+                    self._matrix[row] = values
+                    self._metadata[row] = metadata
+                    self._filename_codes[row] = self._code_for(metadata.get("filename"))
+
+            if new_rows:
+                self._append_rows(np.stack([values for _, values, _ in new_rows]))
+                self._ids.extend(vector_id for vector_id, _, _ in new_rows)
+                self._metadata.extend(metadata for _, _, metadata in new_rows)
+                self._filename_codes = np.concatenate([
+                    self._filename_codes,
+                    np.array([self._code_for(m.get("filename")) for _, _, m in new_rows], dtype=np.int32)
+                ])
+            self._dirty = True
+        return {"upserted_count": len(records)}
+
+    def delete(self, ids: Optional[List[str]] = None, delete_all: Optional[bool] = None,
+               namespace: Optional[str] = None, filter: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        """Remove vetores por id, por filtro de metadados ou todos (`delete_all=True`)."""
+        self._reload_if_changed()
+        with self._lock:
+            self._ensure_writable()
+            if delete_all:
+                remove = np.ones(len(self._ids), dtype=bool)
+            else:
+                remove = np.zeros(len(self._ids), dtype=bool)
+                for vector_id in ids or []:
+                    row = self._positions.get(vector_id)
+                    if row is not None:
+                        remove[row] = True
+                if filter:
+                    remove |= self._filter_mask(filter)
+
+            if remove.any():
+                keep = ~remove
+                self._matrix = np.ascontiguousarray(self._matrix[keep])
+                self._buffer = self._matrix
+                self._ids = [vector_id for vector_id, k in zip(self._ids, keep) if k]
+                self._metadata = [metadata for metadata, k in zip(self._metadata, keep) if k]
+                self._filename_codes = self._filename_codes[keep]
+                self._positions = {vector_id: row for row, vector_id in enumerate(self._ids)}
+                self._dirty = True
+            logger.info(f"Índice local: {int(remove.sum())} vetores removidos")
+        return {}
+
+    def flush(self) -> None:
+        """Grava em disco as alterações pendentes (sem custo se não houver nenhuma)."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+                self._dirty = False
+
+    def list(self, prefix: Optional[str] = None, limit: int = 100, namespace: Optional[str] = None, **kwargs):
+        """Gera páginas de ids (com prefixo opcional), como o `Index.list` do Pinecone serverless."""
+        self._reload_if_changed()
+        with self._lock:
+            ids = [vector_id for vector_id in self._ids if not prefix or vector_id.startswith(prefix)]
+        for i in range(0, len(ids), max(1, limit)):
+            yield ids[i:i + limit]
+
+    def describe_index_stats(self, filter: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        """Estatísticas no formato do Pinecone (dimensão e contagem de vetores)."""
+        self._reload_if_changed()
+        with self._lock:
+            mask = self._filter_mask(filter)
+            count = int(mask.sum()) if mask is not None else len(self._ids)
+            return {
+                "dimension": self.dimension or 0,
+                "index_fullness": 0.0,
+                "total_vector_count": count,
+                "namespaces": {"": {"vector_count": count}}
+            }
+
+    # ---------- Filtros ----------
+
+    def _filter_mask(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Converte um filtro no formato do Pinecone em uma máscara booleana por linha."""
+        if not filter:
+            return None
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, condition in filter.items():
+            if key == "$and":
+                for sub_filter in condition:
+                    mask &= self._filter_mask(sub_filter)
+            elif key == "$or":
+                any_mask = np.zeros(len(self._ids), dtype=bool)
+                for sub_filter in condition:
+                    any_mask |= self._filter_mask(sub_filter)
+                mask &= any_mask
+            elif key == "filename":
+                mask &= self._filename_mask(condition)
+            else:
+                mask &= np.array([self._matches_condition(m.get(key), condition) for m in self._metadata], dtype=bool)
+        return mask
+
+    def _filename_mask(self, condition) -> np.ndarray:
+        """Caminho vetorizado para filtros em `filename`, comparando códigos inteiros."""
+        operator, operand = self._split_condition(condition)
+        if operator in ("$eq", "$ne"):
+            mask = self._filename_codes == self._code_by_filename.get(operand, -1)
+            return mask if operator == "$eq" else ~mask
+        if operator in ("$in", "$nin"):
+            codes = [self._code_by_filename[name] for name in operand if name in self._code_by_filename]
+            mask = np.isin(self._filename_codes, codes)
+            return mask if operator == "$in" else ~mask
+        raise ValueError(f"Operador de filtro não suportado: {operator}")
+
+    @staticmethod
+    def _split_condition(condition):
+        if isinstance(condition, dict):
+            if len(condition) != 1:
+                raise ValueError(f"Condição de filtro inválida: {condition}")
+            return next(iter(condition.items()))
+        return "$eq", condition
+
+    @classmethod
+    def _matches_condition(cls, value, condition) -> bool:
+        operator, operand = cls._split_condition(condition)
+        if operator == "$eq":
+            return value == operand
+        if operator == "$ne":
+            return value != operand
+        if operator == "$in":
+            return value in operand
+        if operator == "$nin":
+            return value not in operand
+        if operator == "$gt":
+            return value is not None and value > operand
+        if operator == "$gte":
+            return value is not None and value >= operand
+        if operator == "$lt":
+            return value is not None and value < operand
+        if operator == "$lte":
+            return value is not None and value <= operand
+        raise ValueError(f"Operador de filtro não suportado: {operator}")
+
+    # ---------- Auxiliares ----------
+
+    @staticmethod
+    def _as_record(vector) -> tuple:
+        if isinstance(vector, dict):
+            return str(vector["id"]), vector["values"], dict(vector.get("metadata") or {})
+        vector_id, values, *rest = vector
+        return str(vector_id), values, dict(rest[0] if rest else {})
+
+    @staticmethod
+    def _normalize(values) -> np.ndarray:
+        vector = np.asarray(values, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _code_for(self, filename) -> int:
+        if filename not in self._code_by_filename:
+            self._code_by_filename[filename] = len(self._code_by_filename)
+        return self._code_by_filename[filename]
+
+    def _ensure_writable(self) -> None:
+        # A matriz carregada do disco é um memory-map somente leitura; a escrita usa uma cópia em RAM.
+        if isinstance(self._matrix, np.memmap) or not self._matrix.flags.writeable:
+            self._matrix = np.array(self._matrix, dtype=np.float32)
+            self._buffer = self._matrix
+
+    def _append_rows(self, rows: np.ndarray) -> None:
+        """Acrescenta linhas à matriz; a capacidade dobra quando acaba, para cópias amortizadas O(1) por linha."""
+        count = len(self._ids)
+        needed = count + len(rows)
+        if self._buffer is None or self._buffer.shape[0] < needed or self._buffer.shape[1] != self.dimension:
+            buffer = np.empty((max(needed, 2 * count, 64), self.dimension), dtype=np.float32)
+            buffer[:count] = self._matrix
+            self._buffer = buffer
+        self._buffer[count:needed] = rows
+        self._matrix = self._buffer[:needed]
+
+    def _paths(self) -> tuple:
+        return os.path.join(self.directory, VECTORS_FILE), os.path.join(self.directory, RECORDS_FILE)
+
+    def _file_stamp(self):
+        _, records_path = self._paths()
+        try:
+            stat = os.stat(records_path)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def _save(self) -> None:
+        """Persiste matriz e registros de forma atômica (arquivo temporário + rename)."""
+        vectors_path, records_path = self._paths()
+        tmp_vectors = vectors_path + ".tmp"
+        with open(tmp_vectors, "wb") as f:
+            np.save(f, np.ascontiguousarray(self._matrix, dtype=np.float32))
+        os.replace(tmp_vectors, vectors_path)
+
+        tmp_records = records_path + ".tmp"
+        with open(tmp_records, "w", encoding="utf-8") as f:
+            json.dump({"dimension": self.dimension, "ids": self._ids, "metadata": self._metadata},
+                      f, ensure_ascii=False, default=str)
+        os.replace(tmp_records, records_path)
+        self._loaded_stamp = self._file_stamp()
+
+    def _load(self) -> None:
+        vectors_path, records_path = self._paths()
+        if not (os.path.exists(vectors_path) and os.path.exists(records_path)):
+            logger.info(f"Índice vetorial local vazio em '{self.directory}'")
+            return
+        try:
+            with open(records_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            matrix = np.load(vectors_path, mmap_mode="r")
+            if matrix.shape[0] != len(records["ids"]):
+                raise ValueError("Número de vetores difere do número de registros")
+        except Exception as e:
+            logger.error(f"Erro ao carregar índice vetorial local: {e}", exc_info=True)
+            return
+
+        self.dimension = records.get("dimension") or (matrix.shape[1] if matrix.ndim == 2 else self.dimension)
+        self._matrix = matrix
+        self._buffer = None
+        self._ids = records["ids"]
+        self._metadata = records["metadata"]
+        self._positions = {vector_id: row for row, vector_id in enumerate(self._ids)}
+        self._code_by_filename = {}
+        self._filename_codes = np.array([self._code_for(m.get("filename")) for m in self._metadata], dtype=np.int32)
+        self._loaded_stamp = self._file_stamp()
+        logger.info(f"Índice vetorial local carregado: {len(self._ids)} vetores de dimensão {self.dimension}")
+
+    def _reload_if_changed(self) -> None:
+        """Recarrega o índice se outro processo (ex.: outro worker) o atualizou em disco."""
+        if self._dirty:
+            return  # Este processo é o escritor: o estado em memória é o mais recente
+        stamp = self._file_stamp()
+        if stamp is not None and stamp != self._loaded_stamp:
+            with self._lock:
+                if stamp != self._loaded_stamp:
+                    self._load()
@@ -0,0 +1,158 @@
+# Registro de modelos compartilhado pelo processo.
+# O chat (routes/utils.py) e a ingestão (document_processor.py) carregavam cada um sua própria
+# cópia do SentenceTransformer, dobrando a memória de cada worker e o tempo de inicialização.
+# Aqui cada modelo é carregado uma única vez por processo, sob um lock por nome, e reutilizado
+# por todos os módulos. O carregamento pode ser antecipado em uma thread de aquecimento, e o
+# registro informa o tempo de carga e o consumo de memória de cada modelo.
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+def current_rss_bytes() -> Optional[int]:
+    """Memória residente atual do processo (Linux), ou None se indisponível."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def parameter_bytes(model: Any) -> Optional[int]:
+    """Tamanho dos pesos de um modelo PyTorch (parâmetros + buffers) ou do arquivo ONNX, ou None se não aplicável."""
+    if hasattr(model, "model_bytes"):
+        return model.model_bytes
+    try:
+        tensors = list(model.parameters()) + list(getattr(model, "buffers", lambda: [])())
+        return sum(t.numel() * t.element_size() for t in tensors) if tensors else None
+    except Exception:
+        return None
+
+def load_sentence_transformer(name: str):
+    """Carregador padrão dos modelos de embedding."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name, device=os.getenv("EMBEDDING_DEVICE", "cpu"), trust_remote_code=False)
+
+class ModelRegistry:
+    """Carrega cada modelo uma vez por processo e o compartilha entre os módulos."""
+
+    def __init__(self):
+        self._models: Dict[str, Any] = {}
+        self._info: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+
+    def get(self, name: str, loader: Callable[[str], Any] = load_sentence_transformer) -> Any:
+        """
+        Retorna o modelo, carregando-o na primeira chamada. Chamadas concorrentes aguardam
+        a mesma carga em vez de carregar cópias adicionais.
+
+        Raises:
+            Exception: Propaga o erro do carregador (uma nova chamada tenta carregar novamente).
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._registry_lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:
+            model = self._models.get(name)
+            if model is not None:
+                return model
+
+            logger.info(f"Carregando modelo '{name}'...")
+            rss_before = current_rss_bytes()
+            started = time.perf_counter()
+            try:
+                model = loader(name)
+            except Exception as e:
+                self._info[name] = {"loaded": False, "error": str(e)}
+                logger.error(f"Erro ao carregar o modelo '{name}': {e}", exc_info=True)
+                raise
+            load_seconds = time.perf_counter() - started
+            rss_after = current_rss_bytes()
+
+            self._info[name] = {
+                "loaded": True,
+                "load_seconds": round(load_seconds, 3),
+                "parameter_bytes": parameter_bytes(model),
+                "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+                "loaded_at": time.time()
+            }
+            self._models[name] = model
+            logger.info(f"Modelo '{name}' carregado em {load_seconds:.1f}s")
+            return model
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def warm_up(self, names: Iterable[str], background: bool = True) -> Optional[threading.Thread]:
+        """
+        Carrega antecipadamente os modelos indicados, por padrão em uma thread de segundo plano,
+        para que a primeira requisição não pague o tempo de carga.
+        """
+        def load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception:
+                    pass  # Já registrado em get(); a próxima requisição tenta novamente
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self) -> Dict[str, Any]:
+        """Modelos carregados com tempo de carga e consumo de memória."""
+        return {
+            "process_rss_bytes": current_rss_bytes(),
+            "models": {name: dict(info) for name, info in self._info.items()}
+        }
+
+# Instância global compartilhada por chat e ingestão
+model_registry = ModelRegistry()
+
+def get_embedding_model_name() -> str:
+    return os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+
+def get_embedding_backend() -> str:
+    """Backend de execução dos embeddings: "torch" (SentenceTransformer), "onnx" ou "onnx-int8"."""
+    backend = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    if backend == "onnx" and os.getenv("EMBEDDING_ONNX_QUANTIZE", "false").lower() in ("1", "true", "yes"):
+        return "onnx-int8"
+    return backend
+
+def get_embedding_model_key() -> str:
+    """
+    Identificador do modelo + backend, usado como chave no registro e nos caches de embeddings:
+    vetores do ONNX quantizado diferem levemente dos de referência e não devem ser misturados.
+    """
+    backend = get_embedding_backend()
+    name = get_embedding_model_name()
+    return name if backend == "torch" else f"{name}@{backend}"
+
+def load_embedding_model(key: str):
+    """Carregador do modelo de embeddings conforme o backend configurado."""
+    name, _, backend = key.partition("@")
+    if not backend:
+        return load_sentence_transformer(name)
+    if backend in ("onnx", "onnx-int8"):
+        from routes.onnx_embedding import load_onnx_embedding_model
+        return load_onnx_embedding_model(name, quantize=backend == "onnx-int8")
+    raise ValueError(f"EMBEDDING_BACKEND desconhecido: {backend}")
+
+def get_embedding_model():
+    """Modelo de embeddings compartilhado (carregado na primeira chamada)."""
+    return model_registry.get(get_embedding_model_key(), load_embedding_model)
@@ -0,0 +1,172 @@
+# Backend ONNX Runtime para os modelos de embedding.
+# Rodamos apenas em CPU, e o `SentenceTransformer.encode` em PyTorch float32 é o maior custo de
+# CPU por pergunta do chat e por chunk ingerido. Aqui o mesmo modelo é exportado uma única vez para
+# ONNX (opcionalmente com quantização dinâmica int8) e executado pelo ONNX Runtime, reproduzindo o
+# pipeline do SentenceTransformer: tokenização, pooling (média ou CLS) e normalização L2.
+# Dependências opcionais: `pip install "optimum[onnxruntime]"`.
+
+import os
+import json
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import fcntl  # Evita que vários workers exportem o mesmo modelo ao mesmo tempo
+except ImportError:
+    fcntl = None
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+CONFIG_FILE = "embedding_config.json"
+DEFAULT_MAX_SEQ_LENGTH = 256
+
+def _read_model_file(name: str, filename: str) -> Optional[dict]:
+    """Lê um JSON da pasta local do modelo ou do Hugging Face Hub (None se não existir)."""
+    try:
+        if os.path.isdir(name):
+            path = os.path.join(name, filename)
+        else:
+            from huggingface_hub import hf_hub_download
+            path = hf_hub_download(name, filename)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def read_sentence_transformers_config(name: str) -> Dict[str, Any]:
+    """
+    Configuração de pooling, normalização e tamanho máximo de sequência do SentenceTransformer,
+    para que o backend ONNX produza os mesmos vetores que o backend de referência.
+    """
+    modules = _read_model_file(name, "modules.json") or []
+    normalize = any(module.get("type", "").endswith("Normalize") for module in modules)
+
+    pooling_path = next((module["path"] for module in modules if module.get("type", "").endswith("Pooling")), "1_Pooling")
+    pooling = _read_model_file(name, f"{pooling_path}/config.json") or {}
+    pooling_mode = "cls" if pooling.get("pooling_mode_cls_token") else "mean"
+
+    st_config = _read_model_file(name, "sentence_bert_config.json") or {}
+    return {
+        "pooling_mode": pooling_mode,
+        "normalize": normalize,
+        "max_seq_length": int(st_config.get("max_seq_length") or DEFAULT_MAX_SEQ_LENGTH)
+    }
+
+def export_onnx_model(name: str, directory: str, quantize: bool) -> None:
+    """Exporta o modelo para ONNX (e a versão int8, se solicitada) na pasta indicada."""
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+
+    if not os.path.exists(os.path.join(directory, MODEL_FILE)):
+        logger.info(f"Exportando '{name}' para ONNX em {directory}...")
+        ORTModelForFeatureExtraction.from_pretrained(name, export=True).save_pretrained(directory)
+        AutoTokenizer.from_pretrained(name).save_pretrained(directory)
+        with open(os.path.join(directory, CONFIG_FILE), "w", encoding="utf-8") as f:
+            json.dump(read_sentence_transformers_config(name), f)
+
+    if quantize and not os.path.exists(os.path.join(directory, QUANTIZED_MODEL_FILE)):
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        logger.info(f"Quantizando '{name}' para int8 (quantização dinâmica)...")
+        quantizer = ORTQuantizer.from_pretrained(directory, file_name=MODEL_FILE)
+        quantizer.quantize(save_dir=directory, quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False))
+
+class OnnxEmbeddingModel:
+    """Modelo de embedding executado no ONNX Runtime com a mesma interface `encode` do SentenceTransformer."""
+
+    def __init__(self, name: str, cache_dir: str, quantize: bool = False, threads: int = 0):
+        """
+        Args:
+            name (str): Modelo do Hugging Face (ou pasta local) no formato SentenceTransformer.
+            cache_dir (str): Pasta onde os modelos exportados são guardados.
+            quantize (bool): Usa a versão com quantização dinâmica int8.
+            threads (int): Threads do ONNX Runtime por chamada (0 = padrão do ONNX Runtime).
+        """
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.name = name
+        self.quantize = quantize
+        safe_name = "".join(c if c.isalnum() or c in "-._" else "__" for c in name)
+        self.directory = os.path.join(cache_dir, safe_name)
+        os.makedirs(self.directory, exist_ok=True)
+
+        # A exportação roda uma vez por máquina; os demais workers aguardam a trava e reaproveitam os arquivos
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                export_onnx_model(name, self.directory, quantize)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        with open(os.path.join(self.directory, CONFIG_FILE), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        self.pooling_mode = config["pooling_mode"]
+        self.normalize = config["normalize"]
+        self.max_seq_length = config["max_seq_length"]
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        model_path = os.path.join(self.directory, QUANTIZED_MODEL_FILE if quantize else MODEL_FILE)
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(self.directory)
+        self.model_bytes = os.path.getsize(model_path)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.encode(["dimensão"])[0].shape[0])
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np")
+        inputs = {key: value.astype(np.int64) for key, value in tokens.items() if key in self.input_names}
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        if self.pooling_mode == "cls":
+            return token_embeddings[:, 0]
+        # Média dos tokens reais (ignora o padding), como o módulo Pooling do SentenceTransformer
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        """Mesma assinatura usada do `SentenceTransformer.encode`; devolve uma matriz float32 (ou vetor, para um texto)."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Ordena por tamanho para reduzir o padding dentro de cada lote e restaura a ordem no final
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        batches = [self._encode_batch([texts[i] for i in order[start:start + batch_size]])
+                   for start in range(0, len(texts), batch_size)]
+        embeddings = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.concatenate(batches)
+
+        if self.normalize or normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+def load_onnx_embedding_model(name: str, quantize: bool = False) -> OnnxEmbeddingModel:
+    """Carregador usado pelo registro de modelos quando EMBEDDING_BACKEND=onnx."""
+    try:
+        import onnxruntime  # noqa: F401
+        import optimum.onnxruntime  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(f"EMBEDDING_BACKEND=onnx requer 'optimum[onnxruntime]' instalado ({e})")
+    return OnnxEmbeddingModel(
+        name,
+        cache_dir=os.getenv("EMBEDDING_ONNX_DIR", "onnx_models"),
+        quantize=quantize,
+        threads=int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+    )
@@ -0,0 +1,137 @@
+# Extração paralela de texto de PDFs.
+# A extração página a página com pypdf é dominada por CPU e, em documentos grandes
+# (regimentos, calendários, coletâneas de resoluções), levava a maior parte do tempo de ingestão.
+# Aqui as páginas são divididas em faixas processadas por um pool de processos; cada worker
+# abre o PDF, extrai sua faixa e devolve os trechos, que são unidos na ordem original.
+# A função executada nos workers usa apenas o pypdf (sem logging nem locks), o que torna
+# seguro criar os processos por fork mesmo com as threads da API em execução.
+
+import os
+import sys
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pypdf import PdfReader
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+def extract_page_range(file_path: str, start: int, end: int) -> Tuple[List[str], List[str]]:
+    """
+    Extrai o texto das páginas [start, end) de um PDF.
+    Executada nos processos do pool, por isso fica no nível do módulo.
+
+    Returns:
+        tuple: (um trecho por página com texto, já com o separador de página; erros por página).
+    """
+    reader = PdfReader(file_path)
+    segments, errors = [], []
+    for page_num in range(start, end):
+        try:
+            page_text = reader.pages[page_num].extract_text()
+            if page_text and page_text.strip():
+                # Adiciona separador de página
+                segments.append(f"\n\n--- Página {page_num + 1} ---\n{page_text.strip()}\n")
+        except Exception as e:
+            errors.append(f"Erro na página {page_num + 1}: {e}")
+    return segments, errors
+
+class PdfTextExtractor:
+    """Extrai texto de PDFs dividindo as páginas em faixas processadas em paralelo."""
+
+    def __init__(self, max_pages: int = 0, workers: int = 4, pages_per_task: int = 16):
+        """
+        Args:
+            max_pages (int): Limite de páginas extraídas por documento (0 = sem limite).
+            workers (int): Processos do pool (1 desativa o paralelismo).
+            pages_per_task (int): Páginas por faixa; PDFs com até esse número de páginas são extraídos no próprio processo.
+        """
+        self.max_pages = max(0, max_pages)
+        self.workers = max(1, workers)
+        self.pages_per_task = max(1, pages_per_task)
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def extract(self, file_path: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Extrai o texto completo do PDF.
+
+        Returns:
+            tuple: (texto, estatísticas com páginas, tempo de extração e páginas por segundo).
+        """
+        start_time = time.perf_counter()
+        total_pages = len(PdfReader(file_path).pages)
+        pages_to_extract = min(total_pages, self.max_pages) if self.max_pages else total_pages
+        if pages_to_extract < total_pages:
+            logger.warning(f"PDF com {total_pages} páginas truncado em {pages_to_extract} (PDF_MAX_PAGES)")
+
+        ranges = [(start, min(start + self.pages_per_task, pages_to_extract))
+                  for start in range(0, pages_to_extract, self.pages_per_task)]
+
+        parallel = self.workers > 1 and len(ranges) > 1
+        results = self._extract_parallel(file_path, ranges) if parallel else None
+        if results is None:
+            parallel = False
+            results = [extract_page_range(file_path, start, end) for start, end in ranges]
+
+        # As faixas voltam na ordem das páginas; o texto é unido uma única vez
+        segments = [segment for range_segments, _ in results for segment in range_segments]
+        for _, errors in results:
+            for error in errors:
+                logger.warning(error)
+
+        text = "".join(segments)
+        elapsed = time.perf_counter() - start_time
+        stats = {
+            "pages_total": total_pages,
+            "pages_processed": pages_to_extract,
+            "pages_extracted": len(segments),
+            "extraction_seconds": round(elapsed, 3),
+            "pages_per_second": round(pages_to_extract / elapsed, 2) if elapsed > 0 else 0.0,
+            "extraction_workers": min(self.workers, len(ranges)) if parallel else 1
+        }
+        logger.info(f"Texto extraído: {len(text):,} caracteres de {pages_to_extract} páginas "
+                    f"({stats['pages_per_second']} páginas/s, {stats['extraction_workers']} processo(s))")
+        return text, stats
+
+    def shutdown(self) -> None:
+        """Encerra o pool de processos (se criado)."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def _extract_parallel(self, file_path: str, ranges: List[Tuple[int, int]]) -> Optional[List[tuple]]:
+        """Distribui as faixas no pool e devolve os resultados na ordem das páginas (None se o pool falhar)."""
+        try:
+            pool = self._get_pool()
+            futures = [pool.submit(extract_page_range, file_path, start, end) for start, end in ranges]
+            return [future.result() for future in futures]
+        except BrokenProcessPool as e:
+            logger.warning(f"Pool de extração indisponível ({e}); extraindo no processo atual")
+            with self._pool_lock:
+                self._pool = None
+            return None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # O pool é criado no primeiro PDF grande e reaproveitado entre documentos.
+        with self._pool_lock:
+            if self._pool is None:
+                # No Linux, fork reaproveita os módulos já importados; nos demais sistemas usa spawn
+                context = multiprocessing.get_context("fork" if sys.platform.startswith("linux") else "spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool
+
+# Instância global usada pelo processador de documentos
+pdf_extractor = PdfTextExtractor(
+    max_pages=int(os.getenv("PDF_MAX_PAGES", "0")),
+    workers=int(os.getenv("PDF_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    pages_per_task=int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+)
@@ -0,0 +1,225 @@
+# Reordenação (rerank) opcional dos chunks recuperados com um cross-encoder local, em CPU.
+# A busca vetorial traz de 15 a 25 chunks por similaridade de cosseno e muitos deles são marginais:
+# aumentam o prompt e o tempo de geração sem ajudar a resposta. O cross-encoder avalia cada par
+# (pergunta, chunk) em conjunto, o que ranqueia melhor que o cosseno, e só os N melhores seguem
+# para o contexto.
+# O custo é limitado por requisição: os pares são pontuados em lotes e, se o orçamento de tempo
+# estourar (ou o modelo ainda estiver carregando), a ordem original da busca é mantida.
+
+import os
+import time
+import logging
+import threading
+from collections import Counter, deque
+from typing import List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from routes.model_registry import model_registry
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+RERANK_ENABLED = os.getenv("CHAT_RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+# Cross-encoder pequeno e multilíngue (MiniLM treinado no mMARCO, que inclui português)
+RERANK_MODEL = os.getenv("CHAT_RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_TOP_N = int(os.getenv("CHAT_RERANK_TOP_N", "6"))
+RERANK_BATCH_SIZE = int(os.getenv("CHAT_RERANK_BATCH_SIZE", "8"))
+RERANK_TIME_BUDGET_MS = float(os.getenv("CHAT_RERANK_TIME_BUDGET_MS", "400"))
+# Os chunks são cortados antes da pontuação: o início basta para julgar a relevância e o custo
+# do cross-encoder cresce com o tamanho da entrada
+RERANK_MAX_CHARS = int(os.getenv("CHAT_RERANK_MAX_CHARS", "1200"))
+RERANK_MAX_LENGTH = 384  # Tokens por par (pergunta + chunk)
+# Intervalo mínimo entre tentativas de carga do modelo após uma falha
+RERANK_RETRY_SECONDS = 60
+
+# Limites (ms) dos intervalos do histograma de latência
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 200, 400, 800, 1600)
+
+def load_cross_encoder(name: str):
+    """Carregador do cross-encoder (sentence-transformers) para o registro de modelos."""
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(name, max_length=RERANK_MAX_LENGTH, device=os.getenv("EMBEDDING_DEVICE", "cpu"))
+
+class RerankMetrics:
+    """Contadores, histograma de latência e distribuição recente dos scores do rerank."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.applied = 0
+        self.fallbacks: Counter = Counter()
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._latencies = deque(maxlen=window)
+        self._scores = deque(maxlen=window * 10)   # Todos os candidatos pontuados
+        self._top_scores = deque(maxlen=window)    # Melhor candidato de cada requisição
+        self._cutoff_scores = deque(maxlen=window) # Último candidato mantido (corte do top N)
+
+    def record(self, latency_ms: float, scores: Optional[np.ndarray] = None, kept: int = 0,
+               fallback: Optional[str] = None) -> None:
+        with self._lock:
+            self.requests += 1
+            if fallback:
+                self.fallbacks[fallback] += 1
+            if scores is None:
+                return
+            self.applied += 1
+            self.latency_buckets[int(np.searchsorted(LATENCY_BUCKETS_MS, latency_ms))] += 1
+            self._latencies.append(latency_ms)
+            ranked = np.sort(scores)[::-1]
+            self._scores.extend(ranked.tolist())
+            self._top_scores.append(float(ranked[0]))
+            self._cutoff_scores.append(float(ranked[kept - 1]))
+
+    @staticmethod
+    def _quantiles(values) -> Optional[dict]:
+        if not values:
+            return None
+        p = np.percentile(np.asarray(values, dtype=np.float64), [0, 10, 50, 90, 100])
+        return {"min": round(p[0], 4), "p10": round(p[1], 4), "p50": round(p[2], 4), "p90": round(p[3], 4), "max": round(p[4], 4)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = list(self._latencies)
+            buckets = list(self.latency_buckets)
+            scores, top, cutoff = list(self._scores), list(self._top_scores), list(self._cutoff_scores)
+            requests, applied, fallbacks = self.requests, self.applied, dict(self.fallbacks)
+        labels = [f"<={limit}" for limit in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        latency = self._quantiles(latencies)
+        if latency is not None:
+            latency["p95"] = round(float(np.percentile(latencies, 95)), 2)
+        return {
+            "requests": requests,
+            "applied": applied,
+            "fallbacks": fallbacks,
+            "latency_ms": latency,
+            "latency_histogram_ms": dict(zip(labels, buckets)),
+            "scores": {"all": self._quantiles(scores), "top": self._quantiles(top), "cutoff": self._quantiles(cutoff)}
+        }
+
+class CrossEncoderReranker:
+    """Reordena candidatos do chat por um cross-encoder, dentro de um orçamento de tempo por requisição."""
+
+    def __init__(self, model_name: str, enabled: bool, top_n: int, batch_size: int,
+                 time_budget_ms: float, max_chars: int):
+        self.model_name = model_name
+        self.enabled = enabled
+        self.top_n = top_n
+        self.batch_size = max(1, batch_size)
+        self.time_budget = time_budget_ms / 1000
+        self.max_chars = max_chars
+        self.metrics = RerankMetrics()
+        self._load_lock = threading.Lock()
+        self._loading = False
+        self._last_load_attempt = None
+
+    def load(self):
+        """Carrega o modelo (bloqueante); usado no aquecimento da aplicação."""
+        return model_registry.get(self.model_name, load_cross_encoder)
+
+    def _ensure_loading(self) -> None:
+        """Dispara a carga do modelo em segundo plano, sem bloquear a requisição que a pediu."""
+        with self._load_lock:
+            if self._loading:
+                return
+            if self._last_load_attempt is not None and time.monotonic() - self._last_load_attempt < RERANK_RETRY_SECONDS:
+                return
+            self._loading = True
+            self._last_load_attempt = time.monotonic()
+
+        def run():
+            try:
+                self.load()
+            except Exception as e:
+                logger.warning(f"Cross-encoder de rerank indisponível: {e}")
+            finally:
+                with self._load_lock:
+                    self._loading = False
+
+        threading.Thread(target=run, name="rerank-model-load", daemon=True).start()
+
+    def _fallback(self, candidates: List[dict], reason: str, started: float) -> Tuple[List[dict], dict]:
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.metrics.record(latency_ms, fallback=reason)
+        return candidates, {"applied": False, "reason": reason, "latency_ms": round(latency_ms, 2), "kept": len(candidates)}
+
+    def rerank(self, question: str, candidates: List[dict],
+               submitted_at: Optional[float] = None) -> Tuple[List[dict], dict]:
+        """
+        Pontua os candidatos e mantém os `top_n` melhores, em ordem de score do cross-encoder.
+        Se o rerank estiver desativado, o modelo não estiver carregado, ocorrer um erro ou o
+        orçamento de tempo estourar, a lista original é devolvida sem alterações.
+
+        Args:
+            candidates: Chunks selecionados (dicionários com `content`), em ordem de relevância.
+            submitted_at: Instante (time.perf_counter) em que a tarefa foi enviada ao pool; o
+                orçamento conta a partir dele, incluindo a espera na fila.
+
+        Returns:
+            tuple: (candidatos, informações de debug do rerank).
+        """
+        started = submitted_at if submitted_at is not None else time.perf_counter()
+        if not self.enabled:
+            return candidates, {"applied": False, "reason": "disabled"}
+        if len(candidates) <= 1:
+            return candidates, {"applied": False, "reason": "too_few_candidates"}
+        if not model_registry.is_loaded(self.model_name):
+            self._ensure_loading()
+            return self._fallback(candidates, "model_loading", started)
+
+        model = model_registry.get(self.model_name, load_cross_encoder)
+        pairs = [(question, candidate["content"][:self.max_chars]) for candidate in candidates]
+        deadline = started + self.time_budget
+        scores: List[float] = []
+        slowest_batch = 0.0
+        try:
+            for i in range(0, len(pairs), self.batch_size):
+                batch_started = time.perf_counter()
+                # Não inicia um lote que, pelo tempo do mais lento até aqui, terminaria fora do orçamento
+                if batch_started + slowest_batch > deadline:
+                    return self._fallback(candidates, "time_budget", started)
+                batch = pairs[i:i + self.batch_size]
+                scores.extend(np.asarray(model.predict(batch, batch_size=len(batch), show_progress_bar=False),
+                                         dtype=np.float32).reshape(-1).tolist())
+                slowest_batch = max(slowest_batch, time.perf_counter() - batch_started)
+        except Exception as e:
+            logger.warning(f"Erro no rerank; mantendo a ordem da busca: {e}")
+            return self._fallback(candidates, "error", started)
+        if time.perf_counter() > deadline:
+            return self._fallback(candidates, "time_budget", started)
+
+        scores = np.asarray(scores, dtype=np.float32)
+        order = np.argsort(-scores, kind="stable")[:self.top_n]
+        reranked = [{**candidates[i], "rerank_score": float(scores[i])} for i in order]
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.metrics.record(latency_ms, scores=scores, kept=len(reranked))
+        return reranked, {
+            "applied": True,
+            "latency_ms": round(latency_ms, 2),
+            "candidates": len(candidates),
+            "kept": len(reranked),
+            "moved": sum(1 for position, i in enumerate(order) if position != i),
+            "top_score": round(float(scores[order[0]]), 4)
+        }
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "model": self.model_name,
+            "loaded": model_registry.is_loaded(self.model_name),
+            "top_n": self.top_n,
+            "batch_size": self.batch_size,
+            "time_budget_ms": self.time_budget * 1000,
+            **self.metrics.stats()
+        }
+
+# Instância global (o modelo é carregado no aquecimento ou na primeira requisição, em segundo plano)
+reranker = CrossEncoderReranker(
+    RERANK_MODEL,
+    enabled=RERANK_ENABLED,
+    top_n=RERANK_TOP_N,
+    batch_size=RERANK_BATCH_SIZE,
+    time_budget_ms=RERANK_TIME_BUDGET_MS,
+    max_chars=RERANK_MAX_CHARS
+)
@@ -0,0 +1,216 @@
+# Utilitários de busca textual compartilhados (histórico, índice de chunks e busca de fallback).
+# A normalização segue o tokenizador `unicode61 remove_diacritics 2` do SQLite FTS5: minúsculas,
+# sem acentos ("Resolução" e "resolucao" são o mesmo termo) e palavras separadas por pontuação.
+# Há dois índices invertidos com ranking BM25: um incremental em dicionários (InvertedIndex, usado
+# pelo backend de histórico em memória) e um compacto em arrays NumPy (KeywordIndex, usado pelas
+# buscas de fallback sobre os chunks), construído uma vez e consultado com operações vetorizadas.
+
+import re
+import math
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Parâmetros usuais do BM25 (saturação da frequência do termo e normalização pelo tamanho)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Palavras muito frequentes em português que não ajudam a ranquear (removidas apenas das consultas)
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e em entre foi for ha isso na nas no nos o os ou para pela pelas
+pelo pelos por qual quais que se sem ser sua suas seu seus sobre um uma umas uns me minha meu
+""".split())
+
+def normalize(text: str) -> str:
+    """Minúsculas e sem acentos (forma NFKD sem os caracteres combinantes)."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+@lru_cache(maxsize=65536)
+def _normalize_word(word: str) -> Tuple[str, ...]:
+    # A decomposição pode gerar caracteres que não são de palavra ("½" -> "1⁄2"): divide de novo
+    return tuple(TOKEN_PATTERN.findall(normalize(word)))
+
+def tokenize(text: str) -> List[str]:
+    """Termos normalizados do texto, na ordem em que aparecem."""
+    # Remover acentos caractere a caractere é caro: é feito uma vez por palavra distinta (cache),
+    # e palavras ASCII (a maioria) passam direto
+    terms = []
+    for word in TOKEN_PATTERN.findall(unicodedata.normalize("NFC", text).lower()):
+        if word.isascii():
+            terms.append(word)
+        else:
+            terms.extend(_normalize_word(word))
+    return terms
+
+def query_terms(query: str) -> List[str]:
+    """Termos distintos de uma consulta, sem stopwords (a menos que a consulta só tenha stopwords)."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    meaningful = [term for term in terms if term not in STOPWORDS]
+    return meaningful or terms
+
+def make_snippet(text: str, terms: Iterable[str], width: int = 160) -> str:
+    """Trecho do texto em volta da primeira ocorrência de um dos termos (ou o início do texto)."""
+    wanted = set(terms)
+    start = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        if normalize(match.group()) in wanted:
+            start = max(0, match.start() - width // 3)
+            break
+    snippet = text[start:start + width].strip()
+    return ("…" if start > 0 else "") + snippet + ("…" if start + width < len(text) else "")
+
+def bm25_idf(document_frequency: int, total_documents: int) -> float:
+    """IDF do BM25 (variante sempre positiva, como no Lucene)."""
+    return math.log(1 + (total_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+
+class InvertedIndex:
+    """
+    Índice invertido em memória (termo -> {documento: frequência}) com ranking BM25.
+    A busca só visita os documentos que contêm algum termo da consulta.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, doc_id: int, text: str) -> None:
+        terms = Counter(tokenize(text))
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        length = sum(terms.values())
+        self.lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id: int, text: str) -> None:
+        """Remove o documento (o texto original é usado para saber quais listas de ocorrência visitar)."""
+        if doc_id not in self.lengths:
+            return
+        for term in set(tokenize(text)):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id)
+
+    def search(self, query: str, limit: int, offset: int = 0,
+               terms: Optional[List[str]] = None) -> Tuple[List[Tuple[int, float]], bool]:
+        """
+        Returns:
+            tuple: ([(documento, score BM25)] da página, se há mais resultados).
+        """
+        terms = terms if terms is not None else query_terms(query)
+        if not self.lengths or not terms:
+            return [], False
+        total = len(self.lengths)
+        average_length = self.total_length / total or 1.0
+        scores: Dict[int, float] = {}
+        for term in terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = bm25_idf(len(docs), total)
+            for doc_id, frequency in docs.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[offset:offset + limit], len(ranked) > offset + limit
+
+class KeywordIndex:
+    """
+    Índice invertido imutável em formato CSR: as listas de ocorrência de todos os termos ficam
+    concatenadas em dois arrays (documento e peso BM25), e `indptr[t]:indptr[t + 1]` delimita as
+    do termo t. Os textos são tokenizados e normalizados uma única vez, na construção; o peso BM25
+    de cada ocorrência também é pré-calculado, então a consulta só soma fatias de arrays.
+    """
+
+    def __init__(self, lengths: np.ndarray, vocabulary: Dict[str, int], indptr: np.ndarray,
+                 doc_ids: np.ndarray, weights: np.ndarray):
+        self.lengths = lengths
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    @classmethod
+    def from_postings(cls, lengths: Iterable[int], terms: List[str], docs: Iterable[int],
+                      frequencies: Iterable[int]) -> "KeywordIndex":
+        """
+        Constrói o índice a partir das ocorrências (termo, documento, frequência), em qualquer ordem.
+
+        Args:
+            lengths: Número de termos de cada documento (o documento i é a posição i).
+        """
+        lengths = np.asarray(lengths, dtype=np.float32)
+        vocabulary: Dict[str, int] = {}
+        term_ids = np.fromiter((vocabulary.setdefault(term, len(vocabulary)) for term in terms),
+                               dtype=np.int32, count=len(terms))
+        docs = np.asarray(docs, dtype=np.int32)
+        frequencies = np.asarray(frequencies, dtype=np.float32)
+
+        # Agrupa as ocorrências por termo (ordenação estável: documentos em ordem dentro do termo)
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, docs, frequencies = term_ids[order], docs[order], frequencies[order]
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=indptr[1:])
+
+        weights = np.zeros(0, dtype=np.float32)
+        if len(lengths) and len(docs):
+            total = len(lengths)
+            document_frequency = np.diff(indptr).astype(np.float64)
+            idf = np.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+            average_length = float(lengths.mean()) or 1.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / average_length)
+            weights = (idf[term_ids] * frequencies * (BM25_K1 + 1) / (frequencies + norm)).astype(np.float32)
+        return cls(lengths, vocabulary, indptr, docs, weights)
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "KeywordIndex":
+        """Tokeniza e indexa os textos (o documento i é o i-ésimo texto)."""
+        lengths, terms, docs, frequencies = [], [], [], []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            terms.extend(counts.keys())
+            docs.extend([doc_id] * len(counts))
+            frequencies.extend(counts.values())
+        return cls.from_postings(lengths, terms, docs, frequencies)
+
+    def search(self, query: str, limit: int, mask: Optional[np.ndarray] = None,
+               terms: Optional[List[str]] = None) -> List[Tuple[int, float]]:
+        """
+        Args:
+            mask: Array booleano opcional com os documentos que podem ser retornados.
+
+        Returns:
+            list: [(documento, score BM25)] em ordem decrescente de score (empates pelo documento).
+        """
+        terms = terms if terms is not None else query_terms(query)
+        term_ids = [self.vocabulary[term] for term in terms if term in self.vocabulary]
+        if not term_ids or limit <= 0:
+            return []
+        scores = np.zeros(len(self.lengths), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # Os documentos de uma lista de ocorrência são distintos: a soma indexada é segura
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        if mask is not None:
+            scores[~mask] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        ranked = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in ranked]
@@ -1,13 +1,19 @@
 # Módulo para encapsular funcionalidades centrais do Retrieval-Augmented Generation (RAG).
-# Inclui a geração de embeddings, interação com o banco de dados vetorial Pinecone,
-# e funcionalidades de busca simples para fallback.
+# Inclui a geração de embeddings, a conexão com o índice vetorial (Pinecone ou local)
+# e a divisão de textos em chunks. A busca por palavras-chave fica em routes/bm25_index.py.
 
 import os
+import asyncio
 import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, Index, PodSpec, ServerlessSpec
 import time 
+from routes.embedding_batcher import EmbeddingBatcher
+from routes.local_vector_store import LocalVectorIndex
+from routes.model_registry import model_registry, get_embedding_model, get_embedding_model_key
 
 # Configuração do logger para monitoramento e depuração
 logger = logging.getLogger(__name__)
@@ -15,108 +21,276 @@ logger = logging.getLogger(__name__)
 # Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
 
-# Armazenamento em memória para documentos processados
-document_store = []
-
 # --- Configuração do Modelo de Embeddings ---
-# O modelo de embedding é inicializado uma única vez na carga do módulo para eficiência.
-embedding_model = None # Inicializado como None para controle de estado
-try:
-    # Lê o modelo das variáveis de ambiente, com fallback para o modelo padrão
-    model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-    embedding_model = SentenceTransformer(model_name)
-    logger.info(f"Modelo de embedding '{model_name}' carregado com sucesso.")
-except Exception as e:
-    logger.error(f"Erro ao carregar o modelo de embedding SentenceTransformer: {e}", exc_info=True)
-    # Falhas na carga do modelo impactam diretamente a funcionalidade de geração de embeddings.
+# O modelo vem do registro compartilhado: uma única instância por processo para chat e ingestão.
+# Lê o modelo e o backend (torch/onnx) das variáveis de ambiente; a chave identifica os dois
+# e separa no cache os vetores de backends diferentes
+model_name = get_embedding_model_key()
+
+# --- Cache de Embeddings de Consultas ---
+class EmbeddingCache:
+    """
+    Cache LRU limitado e thread-safe de embeddings de consultas.
+    A chave é (nome do modelo, texto normalizado) e os vetores são guardados como
+    arrays float32 compactos, em vez de listas Python.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Normaliza o texto sem alterar seu significado: forma Unicode NFC e espaços colapsados."""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def get(self, model: str, text: str):
+        """Retorna o embedding em cache (np.ndarray float32) ou None."""
+        key = (model, self.normalize_text(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model: str, text: str, vector) -> np.ndarray:
+        """Armazena o embedding como float32, descartando o menos usado se o cache estiver cheio."""
+        key = (model, self.normalize_text(text))
+        compact = np.asarray(vector, dtype=np.float32)
+        compact.setflags(write=False)  # Compartilhado entre requisições: protege contra mutações
+        with self._lock:
+            self._entries[key] = compact
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return compact
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Tamanho atual, limite e taxa de acerto do cache."""
+        with self._lock:
+            size = len(self._entries)
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
+
+embedding_cache = EmbeddingCache(max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "4096")))
+
+# --- Micro-batching de Embeddings ---
+# Consultas concorrentes são agrupadas em lotes e codificadas em uma única chamada ao modelo.
+def _encode_query_batch(texts: list[str]) -> np.ndarray:
+    return get_embedding_model().encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+embedding_batcher = EmbeddingBatcher(
+    _encode_query_batch,
+    max_batch_size=int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32")),
+    max_wait_ms=float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+)
+
+def _check_embedding_model() -> None:
+    """Garante o modelo carregado (aguardando o aquecimento, se ainda em andamento)."""
+    try:
+        get_embedding_model()
+    except Exception as e:
+        raise RuntimeError("Modelo de embedding não inicializado. Verifique os logs de inicialização e as configurações.") from e
 
 def generate_embedding(text: str) -> list[float]:
     """
     Gera um vetor numérico (embedding) para o texto fornecido.
     Estes embeddings são cruciais para a busca de similaridade em bancos de dados vetoriais.
+    Perguntas repetidas são servidas do cache de embeddings; as demais passam pelo
+    batcher, que agrupa consultas concorrentes em uma única chamada ao modelo.
 
     Raises:
         RuntimeError: Se o modelo de embedding não foi inicializado corretamente.
     """
-    if embedding_model is None:
-        raise RuntimeError("Modelo de embedding não inicializado. Verifique os logs de inicialização e as configurações.")
-    return embedding_model.encode(text).tolist()
+    _check_embedding_model()
+
+    cached = embedding_cache.get(model_name, text)
+    if cached is None:
+        cached = embedding_cache.put(model_name, text, embedding_batcher.encode(text))
+    return cached.tolist()
+
+async def generate_embedding_async(text: str) -> list[float]:
+    """
+    Versão assíncrona de `generate_embedding` para as rotas: aguarda o future do batcher
+    diretamente no event loop, sem ocupar uma thread por requisição.
 
-# --- Configuração do Pinecone ---
+    Raises:
+        RuntimeError: Se o modelo de embedding não foi inicializado corretamente.
+    """
+    if not model_registry.is_loaded(model_name):
+        # A carga do modelo é bloqueante: aguarda fora do event loop
+        await asyncio.to_thread(_check_embedding_model)
+
+    cached = embedding_cache.get(model_name, text)
+    if cached is None:
+        embedding = await asyncio.wrap_future(embedding_batcher.submit(text))
+        cached = embedding_cache.put(model_name, text, embedding)
+    return cached.tolist()
+
+def get_embedding_cache_stats() -> dict:
+    """Estatísticas do cache de embeddings de consultas (tamanho e taxa de acerto)."""
+    return embedding_cache.stats()
+
+def get_embedding_batcher_stats() -> dict:
+    """Estatísticas do micro-batching de embeddings (lotes e tamanho médio)."""
+    return embedding_batcher.stats()
+
+# --- Configuração do Banco Vetorial (Pinecone ou índice local) ---
+# A conexão é feita sob demanda (primeira busca ou aquecimento na subida da aplicação),
+# e não na importação do módulo, para que os workers iniciem rapidamente.
 pinecone_client = None
 pinecone_index = None
+_index_lock = threading.Lock()
+_last_connect_attempt = None
 
-try:
-    # Inicializa o cliente Pinecone utilizando as chaves de API e ambiente das variáveis de ambiente.
-    pinecone_client = Pinecone(
-        api_key=os.getenv("PINECONE_API_KEY"),
-        environment=os.getenv("PINECONE_ENVIRONMENT") # Mantém o environment para compatibilidade de API
-    )
-    logger.info("Cliente Pinecone inicializado.")
+# Intervalo mínimo entre novas tentativas de conexão após uma falha
+VECTOR_INDEX_RETRY_SECONDS = float(os.getenv("VECTOR_INDEX_RETRY_SECONDS", "30"))
+# Tempo máximo de espera até um índice recém-criado ficar pronto
+PINECONE_INDEX_READY_TIMEOUT = float(os.getenv("PINECONE_INDEX_READY_TIMEOUT", "60"))
 
-    index_name = os.getenv("PINECONE_INDEX_NAME")
-    
-    # Conecta-se diretamente ao índice existente ou o cria se não existir
+def _wait_for_index_ready(index_name: str) -> None:
+    """Aguarda o índice recém-criado ficar pronto, consultando seu status."""
+    deadline = time.monotonic() + PINECONE_INDEX_READY_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            if pinecone_client.describe_index(index_name).status.get("ready"):
+                return
+        except Exception as e:
+            logger.debug(f"Status do índice '{index_name}' indisponível: {e}")
+        time.sleep(1)
+    logger.warning(f"Índice '{index_name}' não ficou pronto em {PINECONE_INDEX_READY_TIMEOUT:.0f}s")
+
+def _connect_pinecone_index():
+    """Conecta ao índice Pinecone configurado, criando-o se necessário. Retorna None em caso de falha."""
+    global pinecone_client
     try:
-        pinecone_index = pinecone_client.Index(index_name)
+        from pinecone import Pinecone, ServerlessSpec
+
+        # Inicializa o cliente Pinecone utilizando as chaves de API e ambiente das variáveis de ambiente.
+        pinecone_client = Pinecone(
+            api_key=os.getenv("PINECONE_API_KEY"),
+            environment=os.getenv("PINECONE_ENVIRONMENT") # Mantém o environment para compatibilidade de API
+        )
+        logger.info("Cliente Pinecone inicializado.")
+
+        index_name = os.getenv("PINECONE_INDEX_NAME")
+    
+        # Conecta-se diretamente ao índice existente ou o cria se não existir
+        try:
+            pinecone_index = pinecone_client.Index(index_name)
         
-        # Testa a conexão
-        stats = pinecone_index.describe_index_stats()
-        logger.info(f"Conectado ao índice Pinecone '{index_name}' com sucesso. Estatísticas: {stats}")
+            # Testa a conexão
+            stats = pinecone_index.describe_index_stats()
+            logger.info(f"Conectado ao índice Pinecone '{index_name}' com sucesso. Estatísticas: {stats}")
+            return pinecone_index
         
-    except Exception as index_error:
-        logger.warning(f"Não foi possível conectar ao índice existente '{index_name}': {index_error}")
+        except Exception as index_error:
+            logger.warning(f"Não foi possível conectar ao índice existente '{index_name}': {index_error}")
         
-        # Se não conseguir conectar, verifica se o índice existe
-        try:
-            available_indexes = pinecone_client.list_indexes()
-            logger.info(f"Índices disponíveis: {available_indexes}")
+            # Se não conseguir conectar, verifica se o índice existe
+            try:
+                available_indexes = pinecone_client.list_indexes()
+                logger.info(f"Índices disponíveis: {available_indexes}")
             
-            # Ajuste aqui para verificar se o nome do índice existe na lista retornada
-            if index_name not in [idx['name'] for idx in available_indexes]: # Pinecone v3 retorna uma lista de dicionários
-                logger.info(f"Índice '{index_name}' não encontrado. Criando novo índice...")
+                # Ajuste aqui para verificar se o nome do índice existe na lista retornada
+                if index_name not in [idx['name'] for idx in available_indexes]: # Pinecone v3 retorna uma lista de dicionários
+                    logger.info(f"Índice '{index_name}' não encontrado. Criando novo índice...")
                 
-                # Cria um novo índice com as dimensões corretas
-                # A dimensão do índice é lida das variáveis de ambiente, com fallback para 384
-                embedding_dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", "384"))
-                pinecone_client.create_index(
-                    name=index_name,
-                    dimension=embedding_dimensions,  # Dimensão configurável
-                    metric='cosine',
-                    spec=ServerlessSpec(
-                        cloud='aws', 
-                        region='us-east-1' 
+                    # Cria um novo índice com as dimensões corretas
+                    # A dimensão do índice é lida das variáveis de ambiente, com fallback para 384
+                    embedding_dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", "384"))
+                    pinecone_client.create_index(
+                        name=index_name,
+                        dimension=embedding_dimensions,  # Dimensão configurável
+                        metric='cosine',
+                        spec=ServerlessSpec(
+                            cloud='aws', 
+                            region='us-east-1' 
+                        )
                     )
-                )
-                logger.info(f"Índice '{index_name}' criado com sucesso com {embedding_dimensions} dimensões.")
+                    logger.info(f"Índice '{index_name}' criado com sucesso com {embedding_dimensions} dimensões.")
                 
-                # Aguarda criação
-                time.sleep(10) # Importante aguardar a criação do índice
+                    # Aguarda criação
+                    _wait_for_index_ready(index_name) # Importante aguardar a criação do índice
 
-            # Tenta conectar novamente
-            pinecone_index = pinecone_client.Index(index_name)
-            logger.info(f"Conectado ao índice Pinecone '{index_name}' após verificação.")
+                # Tenta conectar novamente
+                pinecone_index = pinecone_client.Index(index_name)
+                logger.info(f"Conectado ao índice Pinecone '{index_name}' após verificação.")
+                return pinecone_index
             
-        except Exception as create_error:
-            logger.error(f"Erro ao verificar/criar índice: {create_error}")
-            pinecone_index = None
+            except Exception as create_error:
+                logger.error(f"Erro ao verificar/criar índice: {create_error}")
+                return None
+
+    except Exception as e:
+        logger.error(f"Erro crítico ao inicializar o Pinecone: {e}. Funcionalidades RAG podem ser afetadas.", exc_info=True)
+        return None # Garante que o índice permaneça None em caso de falha.
+
+def _open_local_vector_index() -> LocalVectorIndex:
+    """Abre (ou cria) o índice vetorial local persistido em disco."""
+    directory = os.getenv("LOCAL_VECTOR_STORE_DIR", "vector_store")
+    dimension = int(os.getenv("EMBEDDING_DIMENSIONS", "384"))
+    logger.info(f"Usando índice vetorial local em '{directory}'")
+    return LocalVectorIndex(directory, dimension=dimension)
 
-except Exception as e:
-    logger.error(f"Erro crítico ao inicializar o Pinecone: {e}. Funcionalidades RAG podem ser afetadas.", exc_info=True)
-    pinecone_index = None # Garante que a variável permaneça None em caso de falha.
+# Backend do banco vetorial: "pinecone" (padrão) ou "local" (em processo, sem rede)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
 
-def get_pinecone_index() -> Index:
+def get_pinecone_index():
     """
     Fornece a instância do índice Pinecone para outros módulos.
     Isso centraliza o acesso ao índice, garantindo uma única fonte de verdade.
+    Com VECTOR_STORE_BACKEND=local, retorna o índice local de mesma interface.
+    A conexão é aberta na primeira chamada; após uma falha, nova tentativa só
+    ocorre depois de VECTOR_INDEX_RETRY_SECONDS.
 
     Raises:
         RuntimeError: Se o índice Pinecone não foi inicializado corretamente.
     """
+    global pinecone_index, _last_connect_attempt
+    if pinecone_index is None:
+        with _index_lock:
+            if pinecone_index is None and (_last_connect_attempt is None or time.monotonic() - _last_connect_attempt >= VECTOR_INDEX_RETRY_SECONDS):
+                _last_connect_attempt = time.monotonic()
+                if VECTOR_STORE_BACKEND == "local":
+                    pinecone_index = _open_local_vector_index()
+                else:
+                    pinecone_index = _connect_pinecone_index()
     if pinecone_index is None:
         raise RuntimeError("Pinecone index não inicializado. Verifique logs e variáveis de ambiente.")
     return pinecone_index
 
+def flush_vector_index(index=None) -> None:
+    """
+    Grava em disco as escritas pendentes do índice vetorial local (chamada ao fim de uma ingestão
+    ou remoção). O Pinecone persiste cada operação no servidor, então para ele não há o que fazer.
+    """
+    index = index if index is not None else pinecone_index
+    flush = getattr(index, "flush", None)
+    if callable(flush):
+        flush()
+
+def is_vector_index_ready() -> bool:
+    """Indica se o índice vetorial já está conectado (sem tentar conectar)."""
+    return pinecone_index is not None
+
 # --- Função de Divisão de Texto (Text Splitter Customizado) ---
 def create_documents_from_text_manual(text: str, filename: str, chunk_size: int = 1000, overlap: int = 200) -> list[dict]:
     """
@@ -191,38 +365,3 @@ def simple_text_splitter(text: str, chunk_size: int = 1000, overlap: int = 200)
             start = 0
     
     return chunks
-
-def simple_search(query: str, documents: list[dict], max_results: int = 3) -> list[dict]:
-    """
-    Sistema de busca por relevância baseado em contagem de palavras-chave.
-    Implementa scoring simples mas eficaz para recuperação de informações.
-    Funciona como fallback quando o Pinecone não está disponível.
-    
-    Args:
-        query (str): A pergunta do usuário para a busca.
-        documents (list[dict]): Lista de documentos (chunks) no formato {'content': '...', 'filename': '...'}.
-        max_results (int): Número máximo de resultados a serem retornados.
-
-    Returns:
-        list[dict]: Lista de documentos relevantes ordenados por score.
-    """
-    query_words = query.lower().split()
-    results = []
-    
-    for doc in documents:
-        score = 0
-        content_lower = doc['content'].lower()
-        
-        for word in query_words:
-            score += content_lower.count(word)
-        
-        if score > 0:
-            results.append({
-                'content': doc['content'],
-                'filename': doc['filename'],
-                'score': score
-            })
-    
-    # Ordenação por relevância para retornar os resultados mais pertinentes
-    results.sort(key=lambda x: x['score'], reverse=True)
-    return results[:max_results]
\ No newline at end of file
@@ -0,0 +1,29 @@
+# Configuração comum dos testes do backend.
+# Os módulos de routes/ abrem seus bancos (chunk store, histórico, índice local) na importação,
+# a partir de variáveis de ambiente: elas apontam para um diretório temporário antes de qualquer
+# importação, para que os testes nunca toquem nos arquivos da aplicação nem acessem a rede.
+# O diretório temporário também é o diretório de trabalho, onde ficam os uploads e os metadados
+# do acervo (caminhos relativos em routes/admin.py).
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_data_dir = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.update({
+    "VECTOR_STORE_BACKEND": "local",
+    "LOCAL_VECTOR_STORE_DIR": os.path.join(_data_dir, "vector_store"),
+    "CHUNK_STORE_PATH": os.path.join(_data_dir, "chunk_store.db"),
+    "CHUNK_EMBEDDING_CACHE_DIR": os.path.join(_data_dir, "embedding_cache"),
+    "HISTORY_DB_PATH": os.path.join(_data_dir, "history.db"),
+    "LLM_PROVIDER": "fake",
+    "ANSWER_CACHE_ENABLED": "false",
+    "CHAT_RERANK_ENABLED": "false",
+    "CHAT_TOKENIZER": "chars",
+    "EMBEDDING_WARMUP": "false",
+    "INDEX_RECONCILE_INTERVAL_SECONDS": "0",
+})
+os.chdir(_data_dir)
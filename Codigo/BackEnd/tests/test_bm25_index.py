@@ -0,0 +1,22 @@
+from routes.bm25_index import ChunkBM25Index
+
+def test_search_sees_changes_made_by_another_connection(tmp_path):
+    path = str(tmp_path / "chunk_store.db")
+    reader, writer = ChunkBM25Index(path), ChunkBM25Index(path)
+    writer.add_chunks("a.pdf", [{"id": "a_1", "content": "Prazo de trancamento de matrícula"}])
+    assert [hit[0] for hit in reader.search("matricula", 5)] == ["a_1"]
+
+    # Mesmo número de chunks, conteúdo diferente: a versão do índice muda e a cópia em memória é refeita
+    writer.delete_chunks(["a_1"])
+    writer.add_chunks("b.pdf", [{"id": "b_1", "content": "Calendário acadêmico e matrícula"}])
+    assert [(chunk_id, filename) for chunk_id, _, filename in reader.search("matrícula", 5)] == [("b_1", "b.pdf")]
+    assert reader.search("trancamento", 5) == []
+
+def test_search_filters_by_document(tmp_path):
+    index = ChunkBM25Index(str(tmp_path / "chunk_store.db"))
+    index.add_chunks("a.pdf", [{"id": "a_1", "content": "frequência mínima"}])
+    index.add_chunks("b.pdf", [{"id": "b_1", "content": "frequência mínima exigida"}])
+
+    assert [hit[0] for hit in index.search("frequencia", 5, filename="b.pdf")] == ["b_1"]
+    assert index.delete_document("a.pdf") == 1
+    assert [hit[0] for hit in index.search("frequencia", 5)] == ["b_1"]
@@ -0,0 +1,77 @@
+from routes.context_packer import TokenCounter, find_overlap, merge_neighbors, pack_context
+
+counter = TokenCounter("chars")  # ceil(caracteres / 3.5)
+
+def chunk(id, content, score, filename="doc.pdf", order=None):
+    return {"id": id, "filename": filename, "chunk_order": order, "content": content, "score": score}
+
+def sentences(prefix, count):
+    return " ".join(f"{prefix} frase número {i} do documento." for i in range(count))
+
+def test_find_overlap():
+    shared = "trecho repetido entre chunks vizinhos"
+    assert find_overlap("início do texto " + shared, shared + " e continuação") == len(shared)
+    assert find_overlap("início do texto", "continuação sem repetição alguma") == 0
+
+def test_merge_neighbors_joins_consecutive_chunks_without_overlap():
+    shared = "sobreposição de vinte e poucos caracteres"
+    candidates = [
+        chunk("b", shared + " segunda parte.", 0.9, order=1),
+        chunk("a", "Primeira parte, " + shared, 0.7, order=0),
+        chunk("c", "Outro documento.", 0.8, filename="outro.pdf", order=5),
+        chunk("d", "Parte distante.", 0.5, order=7),
+    ]
+    segments, stats = merge_neighbors(candidates)
+
+    assert [s["ids"] for s in segments] == [["a", "b"], ["c"], ["d"]]
+    assert segments[0]["content"] == "Primeira parte, " + shared + " segunda parte."
+    assert segments[0]["score"] == 0.9 and segments[0]["rank"] == 0
+    assert stats == {"duplicates_removed": 0, "merged": 1, "overlap_chars_removed": len(shared)}
+
+def test_merge_neighbors_drops_duplicate_text():
+    candidates = [chunk("novo", "Mesmo texto.", 0.9, order=0), chunk("antigo", " Mesmo texto. ", 0.8)]
+    segments, stats = merge_neighbors(candidates)
+
+    assert [s["ids"] for s in segments] == [["novo"]]
+    assert stats["duplicates_removed"] == 1
+
+def test_pack_context_respects_budget_in_relevance_order():
+    candidates = [
+        chunk("a", sentences("A", 10), 0.9, filename="a.pdf"),
+        chunk("b", sentences("B", 10), 0.8, filename="b.pdf"),
+        chunk("c", "Trecho curto.", 0.7, filename="c.pdf"),
+    ]
+    cost_a = counter.count("[DOCUMENTO: a.pdf]\n") + counter.count(candidates[0]["content"])
+    budget = cost_a + 20  # Não cabe b inteiro nem um corte útil dele, mas cabe c
+
+    packed = pack_context(candidates, budget, counter)
+
+    assert packed["included_ids"] == ["a", "c"]
+    assert packed["context_parts"][0] == "[DOCUMENTO: a.pdf]\n" + candidates[0]["content"]
+    usage = packed["usage"]
+    assert usage["context_tokens"] <= budget
+    assert usage["chunks_dropped"] == 1 and usage["segments_truncated"] == 0
+    # Cabeçalho e texto são contados separadamente, mais o separador entre os trechos
+    expected = sum(counter.count(f"[DOCUMENTO: {c['filename']}]\n") + counter.count(c["content"]) for c in (candidates[0], candidates[2]))
+    assert usage["context_tokens"] == expected + counter.count("\n\n")
+
+def test_pack_context_truncates_segment_at_sentence_boundary():
+    content = sentences("A", 40)
+    packed = pack_context([chunk("a", content, 0.9)], 150, counter)
+
+    part = packed["context_parts"][0]
+    assert packed["included_ids"] == ["a"]
+    assert packed["usage"]["segments_truncated"] == 1
+    assert packed["usage"]["context_tokens"] <= 150
+    assert part.endswith("documento. [...]")
+    assert content.startswith(part[len("[DOCUMENTO: doc.pdf]\n"):-len(" [...]")])
+
+def test_truncate_counts_the_truncation_mark():
+    text = sentences("A", 40)
+    for max_tokens in (10, 57, 120):
+        assert counter.count(counter.truncate(text, max_tokens)) <= max_tokens
+
+def test_pack_context_with_zero_budget_includes_nothing():
+    packed = pack_context([chunk("a", "Texto qualquer.", 0.9)], 0, counter)
+    assert packed["context_parts"] == [] and packed["included_ids"] == []
+    assert packed["usage"]["chunks_dropped"] == 1
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from routes import document_processor
+from routes.bm25_index import bm25_index
+from routes.chunk_store import chunk_store
+from routes.document_processor import hybrid_processor
+from routes.local_vector_store import LocalVectorIndex
+
+FILENAME = "legado.pdf"
+TEXTS = ["Primeira seção revisada do documento.", "Segunda seção revisada do documento."]
+
+class NoFilterDeleteIndex(LocalVectorIndex):
+    """Índice como os serverless do Pinecone: sem delete por filtro de metadados."""
+
+    def delete(self, ids=None, delete_all=None, namespace=None, filter=None, **kwargs):
+        if filter:
+            raise ValueError("delete por filtro não suportado")
+        return super().delete(ids=ids, delete_all=delete_all, namespace=namespace)
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    def chunks(text, filename):
+        return [{"content": content, "metadata": {"filename": filename, "chunk_order": i, "char_count": len(content)}}
+                for i, content in enumerate(TEXTS)]
+
+    def embeddings(contents):
+        return [[1.0, float(i), 0.0, 0.0] for i, _ in enumerate(contents)], {"embedding_cache_hit_ratio": 0.0}
+
+    monkeypatch.setattr(hybrid_processor, "extract_pdf_pages", lambda path: (" ".join(TEXTS), {}))
+    monkeypatch.setattr(hybrid_processor, "generate_document_summary", lambda text, filename: "Resumo do documento legado.")
+    monkeypatch.setattr(hybrid_processor, "create_smart_chunks", chunks)
+    monkeypatch.setattr(hybrid_processor, "batch_generate_embeddings_with_stats", embeddings)
+    yield
+    chunk_store.delete_document(FILENAME)
+    bm25_index.delete_document(FILENAME)
+
+def legacy_vectors():
+    # Ids da versão anterior à indexação incremental: <nome>_<ordem>_<hex aleatório>, sem manifesto
+    return [
+        {"id": "legado_0_a1b2c3", "values": [0, 1, 0, 0], "metadata": {"filename": FILENAME}},
+        {"id": "legado_1_d4e5f6", "values": [0, 0, 1, 0], "metadata": {"filename": FILENAME}},
+        {"id": "legado_2_0_a1b2c3", "values": [0, 0, 0, 1], "metadata": {"filename": "legado_2.pdf"}},
+    ]
+
+@pytest.mark.parametrize("index_class", [LocalVectorIndex, NoFilterDeleteIndex])
+def test_reupload_of_legacy_document_replaces_old_vectors(tmp_path, monkeypatch, pipeline, index_class):
+    index = index_class(str(tmp_path), dimension=4)
+    index.upsert(legacy_vectors())
+    monkeypatch.setattr(document_processor, "get_pinecone_index", lambda: index)
+
+    result = asyncio.run(hybrid_processor.process_pdf_hybrid("/tmp/legado.pdf", FILENAME))
+
+    assert result["success"] and result["vectors_inserted"] == 2
+    remaining = {vector_id for page in index.list() for vector_id in page}
+    assert remaining == set(chunk_store.get_chunk_ids(FILENAME)) | {"legado_2_0_a1b2c3"}
+    assert index.describe_index_stats(filter={"filename": FILENAME})["total_vector_count"] == 2
+
+def test_reindexing_with_manifest_keeps_unchanged_vectors(tmp_path, monkeypatch, pipeline):
+    index = LocalVectorIndex(str(tmp_path), dimension=4)
+    monkeypatch.setattr(document_processor, "get_pinecone_index", lambda: index)
+    asyncio.run(hybrid_processor.process_pdf_hybrid("/tmp/legado.pdf", FILENAME))
+
+    result = asyncio.run(hybrid_processor.process_pdf_hybrid("/tmp/legado.pdf", FILENAME))
+
+    assert result["success"] and result["vectors_inserted"] == 0 and result["chunks_unchanged"] == 2
+    assert index.describe_index_stats()["total_vector_count"] == 2
@@ -0,0 +1,141 @@
+import time
+import sqlite3
+import threading
+
+import pytest
+
+from routes import history_store as store_module
+from routes.history_store import HistoryBackend, SQLiteHistoryBackend
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "history.db")
+
+def test_history_backend_is_abstract():
+    with pytest.raises(TypeError):
+        HistoryBackend()
+
+def test_ids_come_from_reserved_blocks(db_path, monkeypatch):
+    monkeypatch.setattr(store_module, "ID_BLOCK_SIZE", 3)
+    first, second = SQLiteHistoryBackend(db_path), SQLiteHistoryBackend(db_path)
+
+    ids = [first.add_entry("a@ufma.br", "pergunta", "resposta")]
+    other = second.add_entry("b@ufma.br", "pergunta", "resposta")
+    ids += [first.add_entry("a@ufma.br", f"pergunta {i}", "resposta") for i in range(3)]
+
+    # Cada processo reserva seu próprio bloco: os ids nunca se repetem entre eles
+    assert ids == [1, 2, 3, 7]
+    assert other == 4
+    first.close()
+    second.close()
+
+def test_reserved_block_survives_restart(db_path, monkeypatch):
+    monkeypatch.setattr(store_module, "ID_BLOCK_SIZE", 10)
+    backend = SQLiteHistoryBackend(db_path)
+    backend.add_entry("a@ufma.br", "pergunta", "resposta")
+    backend.close()
+
+    restarted = SQLiteHistoryBackend(db_path)
+    assert restarted.add_entry("a@ufma.br", "pergunta", "resposta") == 11
+    restarted.close()
+
+def test_flush_writes_queued_entries(db_path):
+    backend = SQLiteHistoryBackend(db_path, batch_size=2)
+    for i in range(5):
+        backend.add_entry("a@ufma.br", f"pergunta {i}", "resposta", [{"filename": "doc.pdf"}])
+    backend.flush()
+
+    rows = backend._connection().execute("SELECT question FROM history ORDER BY id").fetchall()
+    assert [row["question"] for row in rows] == [f"pergunta {i}" for i in range(5)]
+    stats = backend.stats("a@ufma.br")
+    assert stats["total_entries"] == 5
+    backend.close()
+
+def test_close_persists_pending_entries(db_path):
+    backend = SQLiteHistoryBackend(db_path)
+    entry_id = backend.add_entry("a@ufma.br", "pergunta", "resposta")
+    backend.close()
+
+    reopened = SQLiteHistoryBackend(db_path)
+    entries = reopened.get_entries("a@ufma.br")
+    assert [entry["id"] for entry in entries] == [entry_id]
+    assert entries[0]["sources"] == []
+    assert reopened.delete_entry("a@ufma.br", entry_id)
+    assert reopened.stats("a@ufma.br")["total_entries"] == 0
+    reopened.close()
+
+def test_reads_wait_only_for_the_users_own_queued_entries(db_path):
+    backend = SQLiteHistoryBackend(db_path, batch_size=1)
+    release_other = threading.Event()
+    write_batch = backend._write_batch
+
+    def slow_write_batch(rows):
+        if rows[0][1] == "b@ufma.br":
+            release_other.wait(5)  # simula uma fila longa de outro usuário
+        write_batch(rows)
+
+    backend._write_batch = slow_write_batch
+    backend.add_entry("a@ufma.br", "pergunta de a", "resposta")
+    backend.add_entry("b@ufma.br", "pergunta de b", "resposta")
+    backend.add_entry("b@ufma.br", "outra pergunta de b", "resposta")
+
+    started = time.monotonic()
+    entries = backend.get_entries("a@ufma.br")
+    assert [entry["question"] for entry in entries] == ["pergunta de a"]
+    assert time.monotonic() - started < 2
+
+    release_other.set()
+    assert len(backend.get_entries("b@ufma.br")) == 2
+    assert backend._pending == {}
+    backend.close()
+
+def test_stats_and_delete_do_not_wait_for_other_users(db_path):
+    backend = SQLiteHistoryBackend(db_path, batch_size=1)
+    entry_id = backend.add_entry("a@ufma.br", "pergunta de a", "resposta")
+    backend.flush()
+    release_other = threading.Event()
+    write_batch = backend._write_batch
+
+    def slow_write_batch(rows):
+        release_other.wait(5)
+        write_batch(rows)
+
+    backend._write_batch = slow_write_batch
+    backend.add_entry("b@ufma.br", "pergunta de b", "resposta")
+
+    started = time.monotonic()
+    assert backend.stats("a@ufma.br")["total_entries"] == 1
+    assert backend.delete_entry("a@ufma.br", entry_id)
+    assert backend.stats("a@ufma.br")["total_entries"] == 0
+    assert time.monotonic() - started < 2
+
+    release_other.set()
+    assert backend.stats("b@ufma.br")["total_entries"] == 1
+    backend.close()
+
+def test_search_matches_only_the_users_entries(db_path):
+    backend = SQLiteHistoryBackend(db_path)
+    backend.add_entry("a@ufma.br", "Qual o prazo de matrícula?", "A matrícula vai até março.")
+    for i in range(3):
+        backend.add_entry("b@ufma.br", f"Matrícula {i}", "Matrícula matrícula matrícula.")
+    backend.add_entry("a.b@ufma.br", "Matrícula", "ufma")
+
+    results, has_more = backend.search("a@ufma.br", "matricula ufma", limit=10)
+    assert [result["question"] for result in results] == ["Qual o prazo de matrícula?"]
+    assert not has_more
+    backend.close()
+
+def test_search_index_is_rebuilt_with_the_user_column(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE history (id INTEGER PRIMARY KEY, user_email TEXT NOT NULL, question TEXT NOT NULL, "
+                 "answer TEXT NOT NULL, timestamp TEXT NOT NULL, sources TEXT NOT NULL)")
+    conn.execute("CREATE VIRTUAL TABLE history_fts USING fts5(question, answer, content='history', content_rowid='id')")
+    conn.execute("INSERT INTO history VALUES (1, 'a@ufma.br', 'Trancamento', 'Até o fim do semestre', '2024-01-01T00:00:00', '[]')")
+    conn.commit()
+    conn.close()
+
+    backend = SQLiteHistoryBackend(db_path)
+    results, _ = backend.search("a@ufma.br", "trancamento", limit=5)
+    assert [result["id"] for result in results] == [1]
+    assert backend.search("b@ufma.br", "trancamento", limit=5) == ([], False)
+    backend.close()
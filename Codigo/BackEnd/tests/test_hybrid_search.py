@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from routes import chat
+from routes.bm25_index import bm25_index
+from routes.chunk_store import chunk_store
+
+FILENAME = "resolucao_teste.pdf"
+CHUNKS = [
+    {"id": "resolucao_teste_1", "chunk_order": 0, "content": "O trancamento de matrícula deve ser solicitado até o fim do semestre."},
+    {"id": "resolucao_teste_2", "chunk_order": 1, "content": "A frequência mínima exigida em cada disciplina é de setenta e cinco por cento."},
+]
+
+class Match:
+    def __init__(self, id, score, filename):
+        self.id = id
+        self.score = score
+        self.metadata = {"filename": filename}
+
+@pytest.fixture
+def indexed_document():
+    chunk_store.put_chunks(FILENAME, CHUNKS)
+    bm25_index.add_chunks(FILENAME, CHUNKS)
+    yield
+    chunk_store.delete_document(FILENAME)
+    bm25_index.delete_document(FILENAME)
+
+@pytest.fixture
+def vector_store_down(monkeypatch):
+    async def embed(question):
+        return [0.0] * 384
+
+    def unavailable():
+        raise RuntimeError("Pinecone index não inicializado")
+
+    monkeypatch.setattr(chat, "embed_question", embed)
+    monkeypatch.setattr(chat, "get_pinecone_index", unavailable)
+
+def test_reciprocal_rank_fusion_keeps_cosine_score():
+    dense = [Match("a", 0.82, "x.pdf"), Match("b", 0.75, "x.pdf")]
+    keyword = [("b", 7.1, "x.pdf"), ("c", 5.0, "y.pdf")]
+
+    fused = chat.reciprocal_rank_fusion(dense, keyword, k=60)
+
+    assert [m.id for m in fused] == ["b", "a", "c"]
+    by_id = {m.id: m for m in fused}
+    assert by_id["a"].score == 0.82 and by_id["b"].score == 0.75
+    assert by_id["c"].score == 0.0 and by_id["c"].metadata == {"filename": "y.pdf"}
+    assert by_id["b"].fusion_score == pytest.approx(1 / 62 + 1 / 61)
+    assert by_id["b"].keyword_score == 7.1
+
+def test_keyword_only_answer_when_vector_index_unavailable(indexed_document, vector_store_down):
+    result = asyncio.run(chat.retrieve_context("Qual o prazo de trancamento de matrícula?"))
+
+    assert result["selection"]["fusion"]["method"] == "bm25_fallback"
+    assert result["sources"][0]["filename"] == FILENAME
+    assert result["sources"][0]["score"] == 0.0
+    assert result["sources"][0]["fusion_score"] > 0
+    assert "trancamento de matrícula" in result["context"]
+
+def test_error_when_vector_index_unavailable_and_no_keyword_match(indexed_document, vector_store_down):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(chat.retrieve_context("zzzzqqq"))
+    assert error.value.status_code == 500
+
+def test_error_when_vector_index_unavailable_and_hybrid_disabled(indexed_document, vector_store_down, monkeypatch):
+    monkeypatch.setattr(chat, "HYBRID_SEARCH_ENABLED", False)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(chat.retrieve_context("Qual o prazo de trancamento de matrícula?"))
+    assert error.value.status_code == 500
+
+def test_chat_stats_requires_admin():
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(chat.get_chat_stats({"email": "aluno@discente.ufma.br", "is_admin": False}))
+    assert error.value.status_code == 403
+
+    stats = asyncio.run(chat.get_chat_stats({"email": "admin@ufma.br", "is_admin": True}))
+    assert "bm25_index" in stats and "llm" in stats
@@ -0,0 +1,48 @@
+import pytest
+
+from routes import index_maintenance
+from routes.chunk_store import chunk_store
+from routes.index_maintenance import reconcile_index, stem_from_chunk_id
+from routes.local_vector_store import LocalVectorIndex
+
+HASH = "0123456789abcdef"
+
+@pytest.mark.parametrize("vector_id, stem", [
+    (f"foo_{HASH}", "foo"),
+    (f"foo_2_{HASH}-1", "foo_2"),
+    ("foo_2_17_a1b2c3", "foo_2"),   # Formato anterior: <nome>_<ordem>_<hex de 6>
+    ("foo_17_a1b2c3", "foo"),
+    ("sem-formato", None),
+])
+def test_stem_from_chunk_id(vector_id, stem):
+    assert stem_from_chunk_id(vector_id) == stem
+
+def test_reconcile_removes_vectors_of_deleted_document_sharing_a_prefix(tmp_path, monkeypatch):
+    index = LocalVectorIndex(str(tmp_path), dimension=4)
+    index.upsert([
+        {"id": f"foo_{HASH}", "values": [1, 0, 0, 0], "metadata": {"filename": "foo.pdf"}},
+        {"id": "foo_3_a1b2c3", "values": [0, 1, 0, 0], "metadata": {"filename": "foo.pdf"}},
+        {"id": f"foo_2_{HASH}", "values": [0, 0, 1, 0], "metadata": {"filename": "foo_2.pdf"}},
+        {"id": "foo_2_0_a1b2c3", "values": [0, 0, 0, 1], "metadata": {"filename": "foo_2.pdf"}},
+        {"id": "importado-manualmente", "values": [1, 1, 0, 0], "metadata": {}},
+    ])
+    monkeypatch.setattr(index_maintenance, "get_pinecone_index", lambda: index)
+
+    result = reconcile_index(lambda: ["foo.pdf"])
+
+    assert result["orphan_vectors_deleted"] == 2
+    remaining = {vector_id for page in index.list() for vector_id in page}
+    assert remaining == {f"foo_{HASH}", "foo_3_a1b2c3", "importado-manualmente"}
+
+def test_reconcile_keeps_manifest_ids(tmp_path, monkeypatch):
+    index = LocalVectorIndex(str(tmp_path), dimension=4)
+    index.upsert([{"id": "id-do-manifesto", "values": [1, 0, 0, 0], "metadata": {"filename": "bar.pdf"}}])
+    chunk_store.put_chunks("bar.pdf", [{"id": "id-do-manifesto", "chunk_order": 0, "content": "texto"}])
+    monkeypatch.setattr(index_maintenance, "get_pinecone_index", lambda: index)
+    try:
+        result = reconcile_index(lambda: ["bar.pdf"])
+    finally:
+        chunk_store.delete_document("bar.pdf")
+
+    assert result["orphan_vectors_deleted"] == 0
+    assert index.describe_index_stats()["total_vector_count"] == 1
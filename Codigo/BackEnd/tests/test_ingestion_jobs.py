@@ -0,0 +1,148 @@
+import os
+import json
+import time
+
+import pytest
+
+from routes.ingestion_jobs import IngestionJobManager, JOB_FAILED, JOB_FINALIZE_FAILED, JOB_RETRYING, JOB_SUCCEEDED
+
+def wait_for(manager, job_id, statuses, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} não terminou: {manager.get(job_id)}")
+
+@pytest.fixture
+def manager():
+    manager = IngestionJobManager(max_workers=1, max_retries=2, retry_delay_seconds=0)
+    yield manager
+    manager.shutdown()
+
+def counting_process(calls):
+    async def process(file_path, file_id, progress_callback):
+        calls.append(file_id)
+        progress_callback("indexing", 0.5)
+        return {"success": True, "total_chunks": 3}
+    return process
+
+def test_on_success_failure_does_not_reprocess_document(manager):
+    calls, published = [], []
+
+    def on_success(job, result):
+        if not published:
+            published.append(None)
+            raise OSError("disco cheio")
+        published.append(job["file_id"])
+
+    job = manager.submit(counting_process(calls), "/tmp/pendente.pdf", "doc.pdf", "doc.pdf", on_success=on_success)
+    job = wait_for(manager, job["id"], (JOB_SUCCEEDED, JOB_FAILED, JOB_FINALIZE_FAILED))
+
+    assert job["status"] == JOB_FINALIZE_FAILED
+    assert job["attempts"] == 1 and calls == ["doc.pdf"]
+    assert "disco cheio" in job["error"]
+    assert job["result"] == {"success": True, "total_chunks": 3}
+    assert manager.stats()[JOB_FINALIZE_FAILED] == 1
+
+    # A nova tentativa manual repete só a publicação
+    assert manager.retry(job["id"]) is not None
+    job = wait_for(manager, job["id"], (JOB_SUCCEEDED, JOB_FINALIZE_FAILED))
+    assert job["status"] == JOB_SUCCEEDED and job["error"] is None
+    assert calls == ["doc.pdf"] and published == [None, "doc.pdf"]
+
+def test_processing_failures_are_retried(manager):
+    attempts, failures = [], []
+
+    async def process(file_path, file_id, progress_callback):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("índice indisponível")
+        return {"success": True}
+
+    job = manager.submit(process, "/tmp/pendente.pdf", "doc.pdf", "doc.pdf",
+                         on_failure=lambda job, error: failures.append(error))
+    job = wait_for(manager, job["id"], (JOB_SUCCEEDED, JOB_FAILED))
+
+    assert job["status"] == JOB_SUCCEEDED and job["attempts"] == 3
+    assert failures == []
+
+def test_non_retryable_result_fails_once(manager):
+    failures = []
+
+    async def process(file_path, file_id, progress_callback):
+        return {"success": False, "error": "PDF sem texto", "retryable": False}
+
+    job = manager.submit(process, "/tmp/pendente.pdf", "doc.pdf", "doc.pdf",
+                         on_failure=lambda job, error: failures.append(error))
+    job = wait_for(manager, job["id"], (JOB_SUCCEEDED, JOB_FAILED))
+    time.sleep(0.05)
+
+    assert job["status"] == JOB_FAILED and job["attempts"] == 1
+    assert failures == ["PDF sem texto"]
+    assert manager.discard(job["id"]) and manager.get(job["id"]) is None
+
+def test_retry_backoff_does_not_hold_a_worker():
+    manager = IngestionJobManager(max_workers=1, max_retries=1, retry_delay_seconds=0.5)
+    order = []
+
+    async def flaky(file_path, file_id, progress_callback):
+        order.append(file_id)
+        if order.count(file_id) == 1:
+            raise RuntimeError("índice indisponível")
+        return {"success": True}
+
+    async def quick(file_path, file_id, progress_callback):
+        order.append(file_id)
+        return {"success": True}
+
+    first = manager.submit(flaky, "/tmp/a.pdf", "a.pdf", "a.pdf")
+    wait_for(manager, first["id"], (JOB_RETRYING,))
+    second = manager.submit(quick, "/tmp/b.pdf", "b.pdf", "b.pdf")
+
+    # O único worker atende o outro job enquanto o primeiro espera a retentativa
+    assert wait_for(manager, second["id"], (JOB_SUCCEEDED,), timeout=0.4)["status"] == JOB_SUCCEEDED
+    job = wait_for(manager, first["id"], (JOB_SUCCEEDED, JOB_FAILED))
+    assert job["status"] == JOB_SUCCEEDED and job["attempts"] == 2
+    assert order == ["a.pdf", "b.pdf", "a.pdf"]
+    manager.shutdown()
+
+def test_pending_uploads_are_resumed_after_restart(monkeypatch):
+    from routes import admin
+
+    manager = IngestionJobManager(max_workers=1, max_retries=0, retry_delay_seconds=0)
+    processed = []
+
+    async def process(file_path, file_id, progress_callback):
+        processed.append(file_id)
+        return {"success": True, "summary": "Resumo"}
+
+    monkeypatch.setattr(admin, "ingestion_jobs", manager)
+    monkeypatch.setattr(admin, "process_and_index_pdf", process)
+    monkeypatch.setattr(admin, "save_metadata", lambda: None)
+    monkeypatch.setattr(admin, "documents_metadata", {})
+
+    def pending(name, content=b"%PDF"):
+        path = os.path.join(admin.PENDING_DIR, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        os.utime(path, (admin.PROCESS_STARTED_AT - 60, admin.PROCESS_STARTED_AT - 60))
+        return path
+
+    resumed = pending("abc.pdf")
+    with open(os.path.join(admin.PENDING_DIR, "abc.json"), "w", encoding="utf-8") as f:
+        json.dump({"file_id": "20250101_abc_edital.pdf", "original_name": "edital.pdf", "file_size": 4,
+                   "content_hash": "abc"}, f)
+    partial = pending("1234.upload")
+    orphan = pending("def.pdf")
+
+    assert admin.resume_pending_ingestions() == {"resumed": 1, "discarded": 2}
+    job = wait_for(manager, manager.list_jobs()[0]["id"], (JOB_SUCCEEDED, JOB_FAILED, JOB_FINALIZE_FAILED))
+    manager.shutdown()
+
+    assert job["status"] == JOB_SUCCEEDED and processed == ["20250101_abc_edital.pdf"]
+    assert admin.documents_metadata["20250101_abc_edital.pdf"]["original_name"] == "edital.pdf"
+    assert os.path.exists(os.path.join(admin.UPLOAD_DIR, "20250101_abc_edital.pdf"))
+    assert os.listdir(admin.PENDING_DIR) == []
+    assert not any(os.path.exists(path) for path in (resumed, partial, orphan))
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import pytest
+
+from routes.llm_gateway import FakeProvider, LLMGateway, LLMProvider
+
+def test_llm_provider_is_abstract():
+    with pytest.raises(TypeError):
+        LLMProvider()
+
+    class Incomplete(LLMProvider):
+        def complete(self, model, messages, params):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_gateway_retries_transient_failures():
+    provider = FakeProvider(latency_ms=0, tokens_per_second=100000, failure_rate=0.5)
+    provider._random.seed(1)
+    gateway = LLMGateway(provider, "modelo", max_retries=20, base_delay=0, max_delay=0, max_concurrent=2)
+    messages = [{"role": "user", "content": "Qual o prazo de trancamento?"}]
+
+    completions = [gateway.complete(messages) for _ in range(5)]
+    completions.append(asyncio.run(gateway.acomplete(messages)))
+
+    assert len({completion.text for completion in completions}) == 1
+    stats = gateway.stats()["models"]["modelo"]
+    assert stats["requests"] == 6 and stats["errors"] == 0 and stats["retries"] > 0
+
+def test_groq_provider_keeps_one_async_client_per_loop():
+    from routes.llm_gateway import GroqProvider
+
+    provider = GroqProvider("chave", timeout=5, connect_timeout=1, max_connections=2)
+
+    async def get_client():
+        client = await provider._async()
+        assert client is await provider._async()
+        return client
+
+    def run_in_thread(results):
+        results.append(asyncio.run(get_client()))
+
+    results = []
+    thread = threading.Thread(target=run_in_thread, args=(results,))
+    thread.start()
+    first = asyncio.run(get_client())
+    thread.join()
+
+    # Cada loop tem o seu cliente, e o encerramento do loop fecha o pool de conexões
+    assert first is not results[0]
+    assert first.is_closed() and results[0].is_closed()
+
+def test_gateway_limit_is_shared_by_threads_and_event_loops():
+    class CountingProvider(FakeProvider):
+        def __init__(self):
+            super().__init__(latency_ms=20, tokens_per_second=100000)
+            self.lock = threading.Lock()
+            self.active = self.peak = 0
+
+        def _enter(self):
+            with self.lock:
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+
+        def _exit(self):
+            with self.lock:
+                self.active -= 1
+
+        def complete(self, model, messages, params):
+            self._enter()
+            try:
+                return super().complete(model, messages, params)
+            finally:
+                self._exit()
+
+        async def acomplete(self, model, messages, params):
+            self._enter()
+            try:
+                return await super().acomplete(model, messages, params)
+            finally:
+                self._exit()
+
+    provider = CountingProvider()
+    gateway = LLMGateway(provider, "modelo", max_retries=0, base_delay=0, max_delay=0, max_concurrent=2)
+    messages = [{"role": "user", "content": "Quando começa o semestre?"}]
+
+    async def burst():
+        await asyncio.gather(*(gateway.acomplete(messages) for _ in range(4)))
+
+    workers = [threading.Thread(target=lambda: asyncio.run(burst())) for _ in range(2)]
+    workers += [threading.Thread(target=gateway.complete, args=(messages,)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert provider.peak == 2
+    assert gateway.stats()["models"]["modelo"]["requests"] == 12
+    assert gateway._limiter("modelo").in_use == 0
+
+def test_concurrency_limiter_releases_cancelled_waiters():
+    from routes.llm_gateway import ConcurrencyLimiter
+
+    limiter = ConcurrencyLimiter(1)
+
+    async def scenario():
+        limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()
+        async with limiter:
+            assert limiter.in_use == 1
+
+    asyncio.run(scenario())
+    assert limiter.in_use == 0
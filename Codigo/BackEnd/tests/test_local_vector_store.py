@@ -0,0 +1,47 @@
+import numpy as np
+
+from routes import local_vector_store
+from routes.local_vector_store import LocalVectorIndex
+
+def vectors(prefix, count, filename="doc.pdf", dimension=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{"id": f"{prefix}_{i}", "values": rng.normal(size=dimension).tolist(), "metadata": {"filename": filename}}
+            for i in range(count)]
+
+def test_upserts_are_persisted_once_on_flush(tmp_path, monkeypatch):
+    index = LocalVectorIndex(str(tmp_path), dimension=8)
+    saves = []
+    save = index._save
+    monkeypatch.setattr(index, "_save", lambda: (saves.append(1), save()))
+
+    batch = vectors("doc", 250)
+    for i in range(0, len(batch), 100):
+        index.upsert(batch[i:i + 100])
+    assert saves == []
+    assert not (tmp_path / local_vector_store.RECORDS_FILE).exists()
+
+    index.flush()
+    index.flush()  # Sem alterações pendentes, não grava de novo
+    assert saves == [1]
+
+    reopened = LocalVectorIndex(str(tmp_path), dimension=8)
+    assert reopened.describe_index_stats()["total_vector_count"] == 250
+    match = reopened.query(batch[42]["values"], top_k=1, include_metadata=True).matches[0]
+    assert match.id == "doc_42" and match.metadata == {"filename": "doc.pdf"}
+
+def test_writer_keeps_unflushed_changes_and_appends_after_load(tmp_path):
+    index = LocalVectorIndex(str(tmp_path), dimension=8)
+    index.upsert(vectors("a", 3, "a.pdf"))
+    index.flush()
+
+    # Um segundo escritor parte do memory-map somente leitura gravado pelo primeiro
+    writer = LocalVectorIndex(str(tmp_path), dimension=8)
+    writer.upsert(vectors("b", 70, "b.pdf", seed=1))
+    writer.delete(ids=["a_0"])
+    assert writer.describe_index_stats(filter={"filename": "b.pdf"})["total_vector_count"] == 70
+    assert [m.id for m in writer.query(vectors("b", 70, seed=1)[69]["values"], top_k=1).matches] == ["b_69"]
+
+    writer.flush()
+    reader = LocalVectorIndex(str(tmp_path), dimension=8)
+    assert reader.describe_index_stats()["total_vector_count"] == 72
+    assert reader.describe_index_stats(filter={"filename": "a.pdf"})["total_vector_count"] == 2
@@ -0,0 +1,40 @@
+import time
+
+import numpy as np
+
+from routes.model_registry import model_registry
+from routes.reranker import CrossEncoderReranker
+
+class OverlapCrossEncoder:
+    """Pontua cada par pelo número de palavras da pergunta presentes no chunk."""
+
+    def predict(self, pairs, batch_size=8, show_progress_bar=False):
+        return np.array([len(set(q.lower().split()) & set(c.lower().split())) for q, c in pairs], dtype=np.float32)
+
+CANDIDATES = [
+    {"id": "a", "content": "calendário acadêmico do semestre"},
+    {"id": "b", "content": "prazo de trancamento de matrícula"},
+    {"id": "c", "content": "trancamento de matrícula e prazo de solicitação"},
+]
+
+def make_reranker(name, time_budget_ms=500):
+    model_registry.get(name, lambda _: OverlapCrossEncoder())
+    return CrossEncoderReranker(name, enabled=True, top_n=2, batch_size=2, time_budget_ms=time_budget_ms, max_chars=200)
+
+def test_rerank_keeps_best_candidates():
+    reranker = make_reranker("teste/overlap")
+    reranked, info = reranker.rerank("prazo de trancamento", CANDIDATES)
+
+    assert info["applied"] and info["kept"] == 2
+    assert [c["id"] for c in reranked] == ["b", "c"]
+    assert reranked[0]["rerank_score"] == 3.0
+
+def test_time_budget_counts_from_submission():
+    reranker = make_reranker("teste/overlap-fila", time_budget_ms=50)
+    # A tarefa esperou na fila do pool além do orçamento: a ordem original é mantida
+    reranked, info = reranker.rerank("prazo de trancamento", CANDIDATES, submitted_at=time.perf_counter() - 0.2)
+
+    assert reranked is CANDIDATES
+    assert info["applied"] is False and info["reason"] == "time_budget"
+    assert info["latency_ms"] >= 200
+    assert reranker.stats()["fallbacks"] == {"time_budget": 1}
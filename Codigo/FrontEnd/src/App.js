@@ -333,17 +333,27 @@ const UFMAConsultaSystem = () => {
     setIsLoading(true);
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API_BASE_URL}/api/history`, {
-        method: 'GET',
-        headers: {
-          'Authorization': `Bearer ${token}`
+      // A API devolve o histórico em páginas (mais recentes primeiro); segue o cursor até o fim
+      const entries = [];
+      let cursor = null;
+      do {
+        const params = new URLSearchParams({ limit: '200' });
+        if (cursor) params.set('cursor', cursor);
+        const response = await fetch(`${API_BASE_URL}/api/history?${params}`, {
+          method: 'GET',
+          headers: {
+            'Authorization': `Bearer ${token}`
+          }
+        });
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
         }
-      });
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-      const data = await response.json();
-      setUserHistory(data.history);
+        const data = await response.json();
+        entries.push(...data.history);
+        cursor = data.next_cursor;
+      } while (cursor);
+      // Mantém a ordem exibida antes da paginação: da conversa mais antiga para a mais recente
+      setUserHistory(entries.reverse());
     } catch (error) {
       console.error('Erro ao buscar histórico:', error);
       reportError(`Erro ao carregar histórico: ${error.message}`);